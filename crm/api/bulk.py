@@ -0,0 +1,312 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+from authentication.models import User
+from authentication.roles import has_role, prefetch_roles
+from epicevent.conflicts import SupportCalendar, conflict_message
+from epicevent.models import MAX_EVENT_DURATION, Client, Contract, Event
+from epicevent.signals import post_bulk_save, pre_bulk_save
+from .serializers import ClientBulkSerializer, ContractDetailSerializer, EventDetailSerializer
+
+
+class BulkError(Exception):
+    pass
+
+
+class BulkOperation(object):
+    """
+        Creates or updates a list of objects with a few set-based queries:
+        - resolve() loads every user, client and contract referenced by the items at once
+        - build() / apply() check the business rules of an item and raise BulkError when one is broken
+        - the valid items are written with bulk_create / bulk_update in a transaction,
+          the invalid ones are reported with their index in the list
+    """
+    model = None
+    serializer_class = None
+    lookup_field = 'id'
+    update_fields = ()
+
+    def __init__(self, user, items):
+        self.user = user
+        self.items = items
+        self.errors = []
+
+    def values(self, field):
+        return {item[field] for item in self.items if item.get(field) not in (None, '')}
+
+    def get_users(self, usernames):
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        prefetch_roles(users.values())
+        return users
+
+    def get_clients(self, company_names):
+        clients = Client.objects.filter(company_name__in=company_names).select_related('sales_contact_id')
+        return {client.company_name: client for client in clients}
+
+    def get_existing(self, keys):
+        return self.model.objects.in_bulk(keys, field_name=self.lookup_field)
+
+    def resolve(self):
+        pass
+
+    def build(self, item, validated_data):
+        raise NotImplementedError
+
+    def apply(self, instance, item, validated_data):
+        raise NotImplementedError
+
+    def validate(self, index, serializer):
+        if serializer.is_valid():
+            return True
+        self.errors.append({'index': index, 'errors': serializer.errors})
+        return False
+
+    def create(self):
+        self.resolve()
+        objects = []
+        for index, item in enumerate(self.items):
+            serializer = self.serializer_class(data=item)
+            if not self.validate(index, serializer):
+                continue
+            try:
+                objects.append(self.build(item, serializer.validated_data))
+            except BulkError as error:
+                self.errors.append({'index': index, 'errors': str(error)})
+        with transaction.atomic():
+            objects = self.model.objects.bulk_create(objects)
+            post_bulk_save.send(sender=self.model, instances=objects, created=True)
+        return self.serializer_class(objects, many=True).data
+
+    def to_key(self, value):
+        try:
+            return self.model._meta.get_field(self.lookup_field).to_python(value) \
+                if value not in (None, '') else None
+        except ValidationError:
+            return None
+
+    def update(self):
+        self.resolve()
+        keys = [self.to_key(item.get(self.lookup_field)) for item in self.items]
+        existing = self.get_existing({key for key in keys if key is not None})
+        objects = []
+        now = timezone.now()
+        for index, (key, item) in enumerate(zip(keys, self.items)):
+            instance = existing.get(key)
+            if instance is None:
+                self.errors.append({'index': index,
+                                    'errors': f"{self.lookup_field} {item.get(self.lookup_field)} does not exist"})
+                continue
+            serializer = self.serializer_class(instance, data=item)
+            if not self.validate(index, serializer):
+                continue
+            try:
+                self.apply(instance, item, serializer.validated_data)
+            except BulkError as error:
+                self.errors.append({'index': index, 'errors': str(error)})
+                continue
+            for field, value in serializer.validated_data.items():
+                setattr(instance, field, value)
+            instance.update_date = now
+            objects.append(instance)
+        with transaction.atomic():
+            pre_bulk_save.send(sender=self.model, instances=objects, created=False)
+            # bulk_update does not run the auto_now of update_date
+            self.model.objects.bulk_update(objects, [*self.update_fields, 'update_date'])
+            post_bulk_save.send(sender=self.model, instances=objects, created=False)
+        return self.serializer_class(objects, many=True).data
+
+
+class ClientBulkOperation(BulkOperation):
+    model = Client
+    serializer_class = ClientBulkSerializer
+    lookup_field = 'company_name'
+    update_fields = ['first_name', 'last_name', 'email', 'phone', 'mobile', 'sales_contact_id']
+
+    def resolve(self):
+        self.users = self.get_users(self.values('sales_contact_id'))
+        names, emails = self.values('company_name'), self.values('email')
+        taken = Client.objects.filter(Q(company_name__in=names) | Q(email__in=emails))
+        self.taken = {'company_name': {}, 'email': {}}
+        for pk, company_name, email in taken.values_list('id', 'company_name', 'email'):
+            self.taken['company_name'][company_name] = pk
+            self.taken['email'][email] = pk
+
+    def check_unique(self, pk, **values):
+        """
+            checks the values are not used by another client, in the database or earlier in the batch
+        """
+        for field, value in values.items():
+            if value is not None and self.taken[field].get(value, pk) != pk:
+                raise BulkError(f"client with this {field} already exists")
+        for field, value in values.items():
+            if value is not None:
+                self.taken[field][value] = pk
+
+    def get_sales_contact(self, username):
+        sales_contact = self.users.get(username)
+        if sales_contact is None:
+            raise BulkError(f"{username} does not exist")
+        if not has_role(sales_contact, 'sales'):
+            raise BulkError(f"{sales_contact} is not from sales team")
+        return sales_contact
+
+    def build(self, item, validated_data):
+        self.check_unique(object(), company_name=validated_data['company_name'], email=validated_data.get('email'))
+        return Client(sales_contact_id=self.get_sales_contact(item.get('sales_contact_id')), **validated_data)
+
+    def apply(self, instance, item, validated_data):
+        if not has_role(self.user, 'manager') and self.user.pk != instance.sales_contact_id_id:
+            raise BulkError(f"You do not have permission to update {instance}")
+        if validated_data.get('company_name', instance.company_name) != instance.company_name:
+            raise BulkError("company_name cannot be modified in a bulk update")
+        self.check_unique(instance.pk, email=validated_data.get('email'))
+        if item.get('sales_contact_id'):
+            instance.sales_contact_id = self.get_sales_contact(item['sales_contact_id'])
+        else:
+            instance.sales_contact_id = None
+
+
+class ContractBulkOperation(BulkOperation):
+    model = Contract
+    serializer_class = ContractDetailSerializer
+    update_fields = ['status', 'amount', 'payment_due', 'client_id', 'sales_contact_id']
+
+    def resolve(self):
+        self.clients = self.get_clients(self.values('client_id'))
+
+    def get_existing(self, keys):
+        return Contract.objects.select_related('sales_contact_id').in_bulk(keys)
+
+    def get_client(self, company_name):
+        client = self.clients.get(company_name)
+        if client is None:
+            raise BulkError(f"client {company_name} does not exist")
+        if client.sales_contact_id is None:
+            raise BulkError(f"{client} does not have a sales contact")
+        return client
+
+    def build(self, item, validated_data):
+        client = self.get_client(item.get('client_id'))
+        return Contract(client_id=client, sales_contact_id=client.sales_contact_id, **validated_data)
+
+    def apply(self, instance, item, validated_data):
+        client = self.get_client(item.get('client_id'))
+        if not has_role(self.user, 'manager') and self.user.pk != instance.sales_contact_id_id:
+            raise BulkError(f"You do not have rights to update contract {instance.id} of {client.company_name}")
+        instance.client_id = client
+        instance.sales_contact_id = client.sales_contact_id
+
+
+class EventBulkOperation(BulkOperation):
+    model = Event
+    serializer_class = EventDetailSerializer
+    update_fields = ['attendees', 'event_date', 'duration', 'notes', 'support_contact']
+
+    def resolve(self):
+        self.clients = self.get_clients(self.values('client_id'))
+        self.users = self.get_users(self.values('support_contact'))
+        contract_ids = {int(value) for value in self.values('contract_id') if str(value).isdigit()}
+        self.contracts = Contract.objects.select_related('sales_contact_id').in_bulk(contract_ids)
+        self.used_contracts = set(Event.objects.filter(contract_id__in=contract_ids)
+                                  .values_list('contract_id', flat=True))
+        self.calendar = self.get_calendar()
+
+    def get_calendar(self):
+        """
+            loads the events of the support contacts around the dates of the items in one interval index
+        """
+        dates = []
+        for value in self.values('event_date'):
+            try:
+                date = parse_datetime(str(value))
+            except ValueError:
+                date = None
+            if date is not None:
+                dates.append(timezone.make_aware(date) if timezone.is_naive(date) else date)
+        support_contacts = [user.pk for user in self.users.values()]
+        if not dates:
+            return SupportCalendar(support_contacts, None, None)
+        return SupportCalendar(support_contacts, min(dates), max(dates) + MAX_EVENT_DURATION)
+
+    def check_conflicts(self, support_contact, event_date, duration, exclude=None):
+        if support_contact is None:
+            return
+        conflicts = self.calendar.conflicts(support_contact.pk, event_date, duration, exclude=exclude)
+        if conflicts:
+            raise BulkError(conflict_message(support_contact, conflicts))
+
+    def get_existing(self, keys):
+        return Event.objects.select_related('client_id', 'contract_id__sales_contact_id',
+                                            'support_contact').in_bulk(keys)
+
+    def get_support_contact(self, item):
+        if not item.get('support_contact'):
+            return None
+        support_contact = self.users.get(item['support_contact'])
+        if support_contact is None:
+            raise BulkError(f"{item['support_contact']} does not exist")
+        if not has_role(support_contact, 'support'):
+            raise BulkError(f"{support_contact} is not from support team")
+        return support_contact
+
+    def check_contract(self, client, contract):
+        if contract.client_id_id != client.pk:
+            raise BulkError(f"{client.company_name} sales contact is {client.sales_contact_id}")
+        if contract.status is not True:
+            raise BulkError("Contract is not signed")
+
+    def build(self, item, validated_data):
+        client = self.clients.get(item.get('client_id'))
+        if client is None:
+            raise BulkError(f"client {item.get('client_id')} does not exist")
+        contract_id = item.get('contract_id')
+        contract = self.contracts.get(int(contract_id)) if str(contract_id).isdigit() else None
+        if contract is None:
+            raise BulkError(f"contract {contract_id} does not exist")
+        if contract.pk in self.used_contracts:
+            raise BulkError("Contract is already used")
+        self.check_contract(client, contract)
+        support_contact = self.get_support_contact(item)
+        self.check_conflicts(support_contact, validated_data['event_date'], validated_data.get('duration'))
+        self.used_contracts.add(contract.pk)
+        if support_contact is not None:
+            self.calendar.add(support_contact.pk, None, validated_data['event_date'], validated_data.get('duration'))
+        return Event(client_id=client, contract_id=contract, support_contact=support_contact, **validated_data)
+
+    def apply(self, instance, item, validated_data):
+        client = instance.client_id
+        if not has_role(self.user, 'manager') \
+                and self.user.pk != client.sales_contact_id_id \
+                and self.user.pk != instance.support_contact_id:
+            raise BulkError("You do not have rights to update this event")
+        self.check_contract(client, instance.contract_id)
+        support_contact = self.get_support_contact(item)
+        duration = validated_data.get('duration', instance.duration)
+        self.check_conflicts(support_contact, validated_data['event_date'], duration, exclude=instance.pk)
+        if instance.support_contact_id is not None:
+            self.calendar.remove(instance.support_contact_id, instance.pk, instance.event_date, instance.duration)
+        if support_contact is not None:
+            self.calendar.add(support_contact.pk, instance.pk, validated_data['event_date'], duration)
+        instance.support_contact = support_contact
+
+
+def bulk_response(operation, creating):
+    """
+        runs the operation and returns the written objects and the errors of the rejected items
+    """
+    max_items = getattr(settings, 'BULK_MAX_ITEMS', 10000)
+    if not isinstance(operation.items, list) or not all(isinstance(item, dict) for item in operation.items):
+        return Response("A list of objects is expected", status=status.HTTP_400_BAD_REQUEST)
+    if len(operation.items) > max_items:
+        return Response(f"At most {max_items} objects can be sent at once", status=status.HTTP_400_BAD_REQUEST)
+    results = operation.create() if creating else operation.update()
+    if results or not operation.errors:
+        response_status = status.HTTP_201_CREATED if creating else status.HTTP_200_OK
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response({'results': results, 'errors': operation.errors}, status=response_status)
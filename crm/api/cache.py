@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import md5
+from threading import Lock
+from time import monotonic
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from epicevent.versions import get_scope_versions, get_versions, object_scope
+from .conditional import conditional_response
+from .metrics import registry, increment
+
+representation_cache_total = registry.counter('crm_representation_cache_total',
+                                              'Lookups of the representation cache by serializer and result')
+
+
+class LRUBackend(object):
+    """
+        in-process cache keeping at most max_entries entries for ttl seconds,
+        the least recently used entry is evicted first
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoCacheBackend(object):
+    """
+        stores the entries in a cache of CACHES, the local-memory one by default
+    """
+
+    def __init__(self, alias='default', ttl=300):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def get_dependencies(instance, serializer):
+    """
+        returns the scopes of the instance and of the related instances serialized by the nested serializers
+    """
+    scopes = {object_scope(instance)}
+    for field in serializer.fields.values():
+        if not isinstance(field, BaseSerializer) or field.source == '*':
+            continue
+        related = getattr(instance, field.source, None)
+        if related is None:
+            continue
+        if isinstance(field, ListSerializer):
+            for item in related.all():
+                scopes |= get_dependencies(item, field.child)
+        else:
+            scopes |= get_dependencies(related, field)
+    return scopes
+
+
+def get_models(serializer):
+    """
+        returns the models serialized by the serializer and its nested serializers, known without an instance
+    """
+    models = {serializer.Meta.model}
+    for field in serializer.fields.values():
+        if isinstance(field, ListSerializer):
+            field = field.child
+        if isinstance(field, BaseSerializer) and field.source != '*' and hasattr(field, 'Meta'):
+            models |= get_models(field)
+    return models
+
+
+class RepresentationCache(object):
+    """
+        Cache of serialized representations:
+        each entry is stored with the versions of the rows it includes (the instance and the nested ones),
+        it is served only while none of these rows changed, see epicevent.signals.object_changed
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key, label):
+        """
+            returns the entry (data, versions) while it is valid, None otherwise
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            data, versions = entry
+            if get_scope_versions(versions) == versions:
+                increment(representation_cache_total, serializer=label, result='hit')
+                return entry
+        increment(representation_cache_total, serializer=label, result='miss')
+        return None
+
+    def set(self, key, data, versions):
+        """
+            stores data with the versions of its rows, read before the rows were loaded
+        """
+        entry = (data, versions)
+        self.backend.set(key, entry)
+        return entry
+
+    def clear(self):
+        self.backend.clear()
+
+
+@lru_cache(maxsize=None)
+def get_representation_cache():
+    """
+        builds the cache configured by REPRESENTATION_CACHE = {'BACKEND': path, 'OPTIONS': {...}}
+    """
+    config = getattr(settings, 'REPRESENTATION_CACHE', {})
+    backend_class = import_string(config.get('BACKEND', 'api.cache.LRUBackend'))
+    return RepresentationCache(backend_class(**config.get('OPTIONS', {})))
+
+
+class CachedRetrieveMixin(object):
+    """
+        serves retrieve from the representation cache
+        the permissions of the view are checked before, the object permissions are not as they only depend on roles
+        the versions of the entry are the validators of the response: 304 Not Modified while they are unchanged
+        on a miss the object is loaded once, between two reads of the versions of its models (epicevent.signals
+        bumps them on every write): the entry is only stored when no write happened meanwhile
+        with LRUBackend each process keeps its own entries, the versions have to be shared between the workers:
+        the default cache of CACHES must then be a shared one (memcached, redis), not the local-memory cache
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        serializer_class = self.get_serializer_class()
+        label = serializer_class.__name__
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            lookup = f'{lookup}:{fieldset.key}'
+        lookup = md5(f'{self.lookup_field}:{lookup}'.encode()).hexdigest()
+        key = f'repr:{serializer_class.__module__}.{label}:{lookup}'
+        cache = get_representation_cache()
+        entry = cache.get(key, label)
+        if entry is None:
+            models = sorted(get_models(self.get_serializer()), key=lambda model: model._meta.label)
+            model_versions = get_versions(*models)
+            instance = self.get_object()
+            serializer = self.get_serializer(instance)
+            data = OrderedDict(serializer.data)
+            versions = get_scope_versions(get_dependencies(instance, serializer))
+            if get_versions(*models) == model_versions:
+                entry = cache.set(key, data, versions)
+            else:
+                # a row was written while the object was loaded, the entry is served without being stored
+                entry = (data, versions)
+        data, versions = entry
+        return conditional_response(request, sorted(versions.items()), max(versions.values()),
+                                    lambda: Response(data))
@@ -0,0 +1,84 @@
+from functools import wraps
+from hashlib import md5
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from epicevent.versions import get_versions
+
+
+def queryset_validators(queryset, *models):
+    """
+        returns the state of the rows of the queryset and their last modification time with one aggregate query:
+        the number of rows and the last update_date, with the versions of the models of the nested rows
+    """
+    queryset = queryset.select_related(None).prefetch_related(None).order_by()
+    rows = queryset.aggregate(count=Count('pk'), last_update=Max('update_date'))
+    versions = get_versions(*models)
+    last_update = rows['last_update'].timestamp() if rows['last_update'] else 0
+    return (rows['count'], last_update, versions), max((last_update, *versions))
+
+
+def conditional_response(request, state, last_modified, build):
+    """
+        returns 304 Not Modified when If-None-Match (or If-Modified-Since) matches the validators of the state,
+        otherwise the response of build() with its ETag and Last-Modified
+        the ETag also depends on the url and the user as some lists are filtered on the user
+    """
+    etag = quote_etag(md5(f'{request.user.pk}:{request.get_full_path()}:{state}'.encode()).hexdigest())
+    last_modified = int(last_modified) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build()
+        if response.status_code == 200:
+            response.headers['ETag'] = etag
+            if last_modified:
+                response.headers['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=0)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional(method):
+    """
+        decorator of the GET methods of a view, runs the method only when the validators of view.get_validators changed
+    """
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        state, last_modified = view.get_validators(request, *args, **kwargs)
+        return conditional_response(request, state, last_modified, lambda: method(view, request, *args, **kwargs))
+    return wrapper
+
+
+class ConditionalGetMixin(object):
+    """
+        view mixin providing the validators of the methods decorated with conditional:
+        GET is answered with 304 Not Modified before the rows are loaded and serialized
+        while the rows of get_conditional_queryset() and the conditional_models (nested rows) did not change
+    """
+    conditional_models = ()
+
+    def get_conditional_queryset(self):
+        queryset = self.get_queryset()
+        if getattr(self, 'action', None) == 'retrieve':
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+        return queryset
+
+    def get_validators(self, request, *args, **kwargs):
+        return queryset_validators(self.get_conditional_queryset(), *self.conditional_models)
+
+
+class ConditionalViewSetMixin(ConditionalGetMixin):
+    """
+        viewset mixin making list and retrieve conditional
+        the validators of list are read from the database with the versions of the conditional_models:
+        a write through another worker changes them whatever the cache of the process holds
+    """
+
+    @conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,16 @@
+from rest_framework import status
+from rest_framework.response import Response
+from epicevent.export import ExportError
+
+
+def export_response(export, queryset, request):
+    """
+        streams the queryset filtered by the query parameters:
+        ?type=csv (default) or ndjson, ?compress=gzip, ?from= and ?to= dates, ?sales_contact_id=
+    """
+    params = request.query_params
+    try:
+        queryset = export.filter(queryset, params)
+        return export.response(queryset, params.get('type', 'csv'), params.get('compress') == 'gzip')
+    except ExportError as error:
+        return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
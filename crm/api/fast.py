@@ -0,0 +1,189 @@
+from datetime import datetime
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601, fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.settings import api_settings
+
+# serializer fields whose representation is the value read from a column of this type
+IDENTITY_FIELDS = {
+    fields.CharField: 'CharField',
+    fields.EmailField: 'CharField',
+    fields.IntegerField: 'IntegerField',
+    fields.BooleanField: 'BooleanField',
+    fields.FloatField: 'FloatField',
+}
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def datetime_representation(field):
+    """
+        DateTimeField.to_representation with the timezone resolved once per page instead of once per value,
+        the values other than aware datetimes go through the field
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def to_representation(value):
+        if not isinstance(value, datetime) or not timezone.is_aware(value):
+            return field.to_representation(value)
+        try:
+            text = value.astimezone(field_timezone).isoformat()
+        except OverflowError:
+            return field.to_representation(value)
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return to_representation
+
+
+def representation(field):
+    if type(field) is fields.DateTimeField:
+        return datetime_representation(field)
+    return field.to_representation
+
+
+class CompiledSerializer(object):
+    """
+        Read-only representation of a ModelSerializer computed from the rows of a single values_list query:
+        - each declared field reads one column, the nested serializers on a foreign key read the columns of the
+          joined table and are None when the foreign key is null
+        - the values are converted by the to_representation of the declared fields, so the output is the same
+        - the plan is compiled to one function building the dict of a row, the converters are bound to it
+          for each page
+        serializers with methods, properties, dotted sources or lists of objects cannot be compiled
+    """
+
+    def __init__(self, serializer):
+        self.paths = []
+        self.plan = self.compile(serializer, serializer.Meta.model, '')
+        self.converted = []
+        self.make_renderer = self.build_renderer()
+
+    def column(self, path):
+        if path not in self.paths:
+            self.paths.append(path)
+        return self.paths.index(path)
+
+    def compile(self, serializer, model, prefix):
+        """
+            returns the plan of a serializer: [(name, column index, converted field, nested plan)]
+            the field is None when the column already holds the representation (text, numbers, booleans)
+        """
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if source == '*' or '.' in source or isinstance(field, ListSerializer):
+                raise NotCompilable(name)
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                raise NotCompilable(name)
+            if model_field.many_to_many or not model_field.concrete:
+                raise NotCompilable(name)
+            index = self.column(prefix + source)
+            if isinstance(field, BaseSerializer):
+                nested = self.compile(field, model_field.related_model, f'{prefix}{source}__')
+                plan.append((name, index, None, nested))
+            elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+                # the column of the foreign key is the primary key of the related row
+                plan.append((name, index, None, None))
+            elif IDENTITY_FIELDS.get(type(field)) == model_field.get_internal_type():
+                plan.append((name, index, None, None))
+            else:
+                plan.append((name, index, field, None))
+        return plan
+
+    def generate(self, plan):
+        """
+            returns the expression building the dict of a plan from a row
+        """
+        items = []
+        for name, index, field, nested in plan:
+            if nested is not None:
+                value = f'None if row[{index}] is None else {self.generate(nested)}'
+            elif field is not None:
+                self.converted.append(field)
+                value = f'None if row[{index}] is None else convert{len(self.converted) - 1}(row[{index}])'
+            else:
+                value = f'row[{index}]'
+            items.append(f'{name!r}: {value}')
+        return '{' + ', '.join(items) + '}'
+
+    def build_renderer(self):
+        """
+            compiles the plan to a function: a single dict expression reading the row by index,
+            returns the factory binding the converters of the fields to it
+        """
+        expression = self.generate(self.plan)
+        arguments = ', '.join(f'convert{index}' for index in range(len(self.converted)))
+        source = (f'def make_renderer({arguments}):\n'
+                  f'    def render(row):\n'
+                  f'        return {expression}\n'
+                  f'    return render\n')
+        namespace = {}
+        exec(compile(source, '<compiled serializer>', 'exec'), namespace)
+        return namespace['make_renderer']
+
+    def renderer(self):
+        return self.make_renderer(*[representation(field) for field in self.converted])
+
+    def columns(self, keep=()):
+        """
+            returns the columns read for each row, keep: columns added for the pagination
+        """
+        return self.paths + [path for path in keep if path not in self.paths]
+
+    def values(self, queryset, keep=()):
+        """
+            returns the rows read by the plan as plain tuples, named tuples cost a class instantiation per row
+        """
+        return queryset.prefetch_related(None).values_list(*self.columns(keep))
+
+    def render_many(self, rows):
+        return list(map(self.renderer(), rows))
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """
+        returns the compiled serializer class, raises NotCompilable when a field cannot be read from a column
+    """
+    return CompiledSerializer(serializer_class())
+
+
+class CompiledListMixin(object):
+    """
+        viewset mixin serving list with the compiled serializer: the page is read with one values_list query
+        and rendered without model instances, the other serializers fall back to the default list
+    """
+
+    def get_compiled_serializer(self):
+        """
+            the serializers restricted by ?fields= / ?expand= are compiled for the request
+        """
+        if self.get_fieldset() is None:
+            return compile_serializer(self.get_serializer_class())
+        return CompiledSerializer(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        try:
+            compiled = self.get_compiled_serializer()
+        except NotCompilable:
+            return super().list(request, *args, **kwargs)
+        ordering = [name.lstrip('-') for name in getattr(self.pagination_class, 'ordering', ())]
+        rows = compiled.values(self.filter_queryset(self.get_queryset()), keep=ordering)
+        if self.paginator is not None:
+            self.paginator.columns = compiled.columns(keep=ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.render_many(page))
+        return Response(compiled.render_many(rows))
@@ -0,0 +1,276 @@
+import json
+import platform
+import re
+import subprocess
+from datetime import datetime
+from statistics import mean, quantiles
+from time import perf_counter
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import get_resolver, URLPattern, URLResolver
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.models import User
+from api.middleware import QueryRecorder
+from api.views import Report
+from epicevent.calendars import get_feed
+from epicevent.models import Client
+from epicevent.rollups import REPORTS
+
+SKIPPED_PREFIXES = ('admin/', 'api-auth/', 'metrics/')
+
+
+def fall_back_to_sqlite():
+    """
+        replaces the default database by an in-memory sqlite database when postgresql is not reachable
+    """
+    connections['default'].close()
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+    del connections['default']
+
+
+def iter_routes(patterns, prefix=''):
+    """
+        yields (route, callback) for every url pattern, with the prefixes of the included urls
+    """
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern).lstrip('^').rstrip('$')
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern.callback
+
+
+def accepts_get(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return 'get' in actions
+    cls = getattr(callback, 'cls', None)
+    if cls is not None:
+        return hasattr(cls, 'get')
+    return True
+
+
+def sample_value(callback, name):
+    """
+        returns an existing value for a url parameter:
+        - the lookup field of the first object of a viewset
+        - the first report name of the reports route
+        - the token of the calendar feed of the first user
+        - the id of a client with a signed contract for the other views
+    """
+    cls = getattr(callback, 'cls', None)
+    if cls is not None and getattr(cls, 'lookup_field', None) == name and cls.queryset is not None:
+        instance = cls.queryset.model.objects.order_by('pk').first()
+        return str(getattr(instance, name)) if instance else None
+    if cls is Report and name == 'name':
+        return next(iter(REPORTS))
+    if name == 'token':
+        user = User.objects.order_by('pk').first()
+        return get_feed(user).token if user else None
+    client = Client.objects.filter(contract_client__status=True).order_by('pk').first()
+    return str(client.pk) if client else None
+
+
+def search_query():
+    client = Client.objects.order_by('pk').first()
+    return f'q={quote(client.company_name[:4])}' if client else None
+
+
+# query string of the routes which need one, None when no sample value exists
+SAMPLE_QUERIES = {
+    'api/search/': search_query,
+}
+
+
+def build_path(route, callback):
+    path = route
+    for name in re.findall(r'\(\?P<(\w+)>[^)]*\)|<(?:\w+:)?(\w+)>', route):
+        name = name[0] or name[1]
+        value = sample_value(callback, name)
+        if value is None:
+            return None
+        path = re.sub(r'\(\?P<%s>[^)]*\)|<(?:\w+:)?%s>' % (name, name), quote(value), path, count=1)
+    if route in SAMPLE_QUERIES:
+        query = SAMPLE_QUERIES[route]()
+        if query is None:
+            return None
+        path = f'{path}?{query}'
+    return '/' + path
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return {'p50': values[0], 'p95': values[0], 'p99': values[0]}
+    cuts = quantiles(values, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+class Command(BaseCommand):
+    """
+        Benchmarks every GET route of crm/urls.py on a dedicated database seeded with seed_crm
+        - each route is called as the first user (manager, sales, support) allowed to use it
+        - reports p50/p95/p99 latency in ms, queries per request and throughput in requests/s
+        - the routes answering with an error to every user are reported as not measured
+        - the results are written as JSON to be compared between commits
+        - falls back to an in-memory sqlite database when postgresql is not reachable
+        - with --server, the routes of a running server are called, its database has to be seeded with seed_crm
+    """
+    help = 'Benchmarks the API routes and writes the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='measured requests per route')
+        parser.add_argument('--warmup', type=int, default=5, help='requests per route before measuring')
+        parser.add_argument('--clients', type=int, default=1000, help='clients seeded in the database')
+        parser.add_argument('--seed', type=int, default=0, help='random seed of the dataset')
+        parser.add_argument('--route', action='append', help='benchmark only the routes containing this text')
+        parser.add_argument('--server', help='base url of a running server instead of the django test client, '
+                                             'the queries are not counted in this mode')
+        parser.add_argument('--output', default='benchmark.json', help='JSON file receiving the results')
+        parser.add_argument('--keepdb', action='store_true', help='keep and reuse the benchmark database')
+
+    def handle(self, *args, **options):
+        if options['server']:
+            results = self.run_benchmark(options)
+        else:
+            setup_test_environment()
+            try:
+                results = self.run_on_benchmark_database(options)
+            finally:
+                teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        for path, result in results['routes'].items():
+            self.stdout.write(f"{path:<45} {result['status']} p50={result['p50']:8.2f}ms "
+                              f"p95={result['p95']:8.2f}ms p99={result['p99']:8.2f}ms "
+                              f"queries={result['queries']} {result['throughput']:8.1f} req/s")
+        for path, reason in results['unmeasured'].items():
+            self.stdout.write(f'{path:<45} not measured: {reason}')
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_on_benchmark_database(self, options):
+        """
+            runs the benchmark on a dedicated database, created and seeded for the run
+        """
+        try:
+            connection.ensure_connection()
+        except OperationalError as error:
+            self.stderr.write(f'Database not reachable ({error}), falling back to sqlite')
+            fall_back_to_sqlite()
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Client.objects.exists():
+                call_command('seed_crm', clients=options['clients'], seed=options['seed'], stdout=self.stdout)
+            return self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def get_users(self):
+        return [User.objects.filter(groups=group).order_by('pk').first()
+                for group in Group.objects.filter(name__in=['manager', 'sales', 'support']).order_by('name')]
+
+    def get_requester(self, options, user):
+        """
+            returns a function sending a GET request as the user and returning its status code
+        """
+        if options['server']:
+            token = str(RefreshToken.for_user(user).access_token)
+
+            def request(path):
+                query = Request(options['server'].rstrip('/') + path,
+                                headers={'Authorization': f'Bearer {token}'})
+                try:
+                    with urlopen(query) as response:
+                        response.read()
+                        return response.status
+                except OSError as error:
+                    return getattr(error, 'code', 0)
+            return request
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        client.force_login(user)
+
+        def request(path):
+            response = client.get(path)
+            if response.streaming:
+                # exports and streamed lists generate their body while it is read
+                for _ in response.streaming_content:
+                    pass
+            return response.status_code
+        return request
+
+    def run_benchmark(self, options):
+        users = [user for user in self.get_users() if user is not None]
+        if not users:
+            self.stderr.write('No manager, sales or support user in the database, the routes are not measured')
+        routes, unmeasured = {}, {}
+        for route, callback in iter_routes(get_resolver().url_patterns):
+            if route.startswith(SKIPPED_PREFIXES) or not accepts_get(callback):
+                continue
+            path = build_path(route, callback)
+            if path is None or (options['route'] and not any(text in path for text in options['route'])):
+                continue
+            if not users:
+                unmeasured[path] = 'no user'
+                continue
+            result = self.benchmark_route(options, path, users)
+            if 200 <= result['status'] < 300:
+                routes[path] = result
+            else:
+                unmeasured[path] = f"status {result['status']} as {result['user']}"
+
+        return {
+            'date': datetime.now().isoformat(),
+            'commit': self.get_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'clients': Client.objects.count(),
+            'requests': options['requests'],
+            'routes': routes,
+            'unmeasured': unmeasured,
+        }
+
+    def benchmark_route(self, options, path, users):
+        for user in users:
+            request = self.get_requester(options, user)
+            status = request(path)
+            if status not in (401, 403):
+                break
+        if not 200 <= status < 300:
+            # an error response is not a measurement of the route
+            return {'status': status, 'user': user.username}
+        for _ in range(options['warmup']):
+            request(path)
+
+        durations, queries = [], []
+        start = perf_counter()
+        for _ in range(options['requests']):
+            recorder = QueryRecorder(0)
+            with connection.execute_wrapper(recorder):
+                begin = perf_counter()
+                request(path)
+                durations.append((perf_counter() - begin) * 1000)
+            queries.append(recorder.count)
+        total = perf_counter() - start
+
+        result = {'status': status, 'user': user.username}
+        result.update(percentiles(durations))
+        result['queries'] = None if options['server'] else mean(queries)
+        result['throughput'] = options['requests'] / total if total else 0
+        return result
+
+    def get_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            return None
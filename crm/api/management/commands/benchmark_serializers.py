@@ -0,0 +1,90 @@
+from statistics import median
+from time import perf_counter
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from api.fast import compile_serializer
+from api.optimization import optimize_queryset
+from api.serializers import ClientListSerializer, ContractListSerializer, EventListSerializer
+from epicevent.models import Client, Contract, Event
+from .benchmark import fall_back_to_sqlite
+
+SERIALIZERS = {
+    'clients': (Client, ClientListSerializer),
+    'contracts': (Contract, ContractListSerializer),
+    'events': (Event, EventListSerializer),
+}
+
+
+class Command(BaseCommand):
+    """
+        Compares the list serializers with their compiled version (api.fast) on pages read from the database:
+        - the page is loaded and rendered to JSON, the throughput is the number of pages per second of the median page
+        - fails when the JSON of the two versions differs or when a compiled serializer is not --min-ratio times faster
+        - runs on a dedicated database seeded with seed_crm, sqlite when postgresql is not reachable
+    """
+    help = 'Benchmarks the compiled list serializers against the DRF serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000, help='rows per page')
+        parser.add_argument('--repeat', type=int, default=20, help='measured pages per serializer')
+        parser.add_argument('--clients', type=int, default=1000, help='clients seeded in the database')
+        parser.add_argument('--seed', type=int, default=0, help='random seed of the dataset')
+        parser.add_argument('--min-ratio', type=float, default=5.0,
+                            help='throughput gain expected from the compiled serializers, 0 to only report it')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            connection.ensure_connection()
+        except OperationalError as error:
+            self.stderr.write(f'Database not reachable ({error}), falling back to sqlite')
+            fall_back_to_sqlite()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('seed_crm', clients=options['clients'], seed=options['seed'], stdout=self.stdout)
+            ratios = {name: self.benchmark(name, model, serializer_class, options)
+                      for name, (model, serializer_class) in SERIALIZERS.items()}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        slow = [f'{name} x{ratio:.1f}' for name, ratio in ratios.items() if ratio < options['min_ratio']]
+        if slow:
+            raise CommandError(f"Below the expected gain of x{options['min_ratio']}: {', '.join(slow)}")
+
+    def measure(self, build, repeat):
+        """
+            returns the content and the throughput of the median page, a page slowed by the machine does not count
+        """
+        content = build()
+        durations = []
+        for _ in range(repeat):
+            start = perf_counter()
+            build()
+            durations.append(perf_counter() - start)
+        return content, 1 / median(durations)
+
+    def benchmark(self, name, model, serializer_class, options):
+        page_size = options['page_size']
+        queryset = model.objects.order_by('pk')
+        compiled = compile_serializer(serializer_class)
+        renderer = JSONRenderer()
+
+        def drf():
+            page = list(optimize_queryset(queryset, serializer_class)[:page_size])
+            return renderer.render(serializer_class(page, many=True).data)
+
+        def fast():
+            return renderer.render(compiled.render_many(list(compiled.values(queryset)[:page_size])))
+
+        expected, drf_throughput = self.measure(drf, options['repeat'])
+        content, fast_throughput = self.measure(fast, options['repeat'])
+        if content != expected:
+            raise CommandError(f'{serializer_class.__name__}: the compiled serializer output differs')
+        rows = min(queryset.count(), page_size)
+        ratio = fast_throughput / drf_throughput
+        self.stdout.write(f'{name:<10} {rows} rows  drf={drf_throughput:8.1f} pages/s  '
+                          f'compiled={fast_throughput:8.1f} pages/s  x{ratio:.1f}')
+        return ratio
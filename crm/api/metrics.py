@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from threading import Lock
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+_lock = Lock()
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram(object):
+    """
+        histogram with fixed upper bounds, counts are stored per bucket and cumulated on export
+    """
+    kind = 'histogram'
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulated = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulated += count
+            yield name + '_bucket', labels + (('le', str(bound)),), cumulated
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class Family(object):
+    """
+        a metric with its children, one for each combination of label values
+    """
+
+    def __init__(self, name, documentation, factory):
+        self.name = name
+        self.documentation = documentation
+        self.factory = factory
+        self.kind = factory().kind
+        self.children = {}
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        child = self.children.get(key)
+        if child is None:
+            child = self.children.setdefault(key, self.factory())
+        return child
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, name, documentation, factory):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families.setdefault(name, Family(name, documentation, factory))
+        return family
+
+    def counter(self, name, documentation):
+        return self._family(name, documentation, Counter)
+
+    def histogram(self, name, documentation, buckets):
+        return self._family(name, documentation, lambda: Histogram(buckets))
+
+    def expose(self):
+        """
+            returns the metrics in the prometheus text exposition format
+        """
+        lines = []
+        with _lock:
+            for family in self.families.values():
+                lines.append(f'# HELP {family.name} {family.documentation}')
+                lines.append(f'# TYPE {family.name} {family.kind}')
+                for labels, child in family.children.items():
+                    for name, sample_labels, value in child.samples(family.name, labels):
+                        lines.append(f'{name}{_format_labels(sample_labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    values = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for name, value in labels)
+    return '{' + values + '}'
+
+
+registry = Registry()
+
+requests_total = registry.counter('crm_requests_total', 'Requests by endpoint and status code')
+request_duration = registry.histogram('crm_request_duration_seconds', 'Wall time of the requests',
+                                      LATENCY_BUCKETS)
+db_duration = registry.histogram('crm_db_duration_seconds', 'Time spent in database queries per request',
+                                 LATENCY_BUCKETS)
+db_queries = registry.histogram('crm_db_queries', 'Database queries per request', QUERY_BUCKETS)
+response_size = registry.histogram('crm_response_size_bytes', 'Size of the response bodies', SIZE_BUCKETS)
+
+
+def record_request(endpoint, status_code, duration, query_count, query_duration, size):
+    with _lock:
+        requests_total.labels(endpoint=endpoint, status=status_code).inc()
+        request_duration.labels(endpoint=endpoint).observe(duration)
+        db_duration.labels(endpoint=endpoint).observe(query_duration)
+        db_queries.labels(endpoint=endpoint).observe(query_count)
+        if size is not None:
+            response_size.labels(endpoint=endpoint).observe(size)
+
+
+def increment(counter, amount=1, **labels):
+    with _lock:
+        counter.labels(**labels).inc(amount)
+
+
+def metrics_allowed(request):
+    """
+        the metrics are served to the addresses of METRICS_ALLOWED_IPS (the prometheus scrapers) and to staff users
+    """
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics_view(request):
+    """
+        exposes the in-process metrics to prometheus
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics_view.skip_metrics = True
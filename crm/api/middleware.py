@@ -0,0 +1,107 @@
+import logging
+from contextlib import ExitStack
+from time import perf_counter
+from django.conf import settings
+from django.db import connections
+from .metrics import record_request
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder(object):
+    """
+        database execute wrapper counting the queries of a request and the time spent running them
+        the statements are kept (up to max_statements) to be logged when the request is over budget
+    """
+
+    def __init__(self, max_statements):
+        self.count = 0
+        self.duration = 0
+        self.max_statements = max_statements
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+            if len(self.statements) < self.max_statements:
+                self.statements.append(sql)
+
+
+def get_endpoint_name(view_func, request):
+    """
+        returns the name of the view handling the request:
+        - ClientViewSet.list for a viewset action
+        - MissingEventSupport.get for an APIView
+        - the function name for a function view
+    """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', view_func.__class__.__name__)
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware(object):
+    """
+        records for each request: wall time, database time, number of queries and response size
+        requests exceeding METRICS_QUERY_BUDGET queries or METRICS_LATENCY_BUDGET seconds are logged with their SQL
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'METRICS_QUERY_BUDGET', 50)
+        self.latency_budget = getattr(settings, 'METRICS_LATENCY_BUDGET', 1)
+        self.max_statements = getattr(settings, 'METRICS_LOGGED_STATEMENTS', 100)
+
+    def record_queries(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.max_statements)
+        start = perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+
+        endpoint = getattr(request, 'metrics_endpoint', None)
+        if endpoint is None:
+            return response
+        if response.streaming:
+            content = response.streaming_content
+            response.streaming_content = self.stream(request, content, response.status_code, endpoint, recorder, start)
+        else:
+            self.record(request, endpoint, response.status_code, perf_counter() - start, recorder,
+                        len(response.content))
+        return response
+
+    def stream(self, request, content, status_code, endpoint, recorder, start):
+        """
+            yields the body of a streaming response, the request is recorded when the iterator is exhausted or
+            closed: the duration, queries and size include the generation of the body
+        """
+        size = 0
+        try:
+            with self.record_queries(recorder):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, endpoint, status_code, perf_counter() - start, recorder, size)
+
+    def record(self, request, endpoint, status_code, duration, recorder, size):
+        record_request(endpoint, status_code, duration, recorder.count, recorder.duration, size)
+        if recorder.count > self.query_budget or duration > self.latency_budget:
+            logger.warning('%s %s over budget: %.3fs, %d queries (%.3fs in database)\n%s',
+                           request.method, request.path, duration, recorder.count, recorder.duration,
+                           ';\n'.join(recorder.statements))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'skip_metrics', False):
+            request.metrics_endpoint = get_endpoint_name(view_func, request)
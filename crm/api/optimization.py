@@ -0,0 +1,122 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from .sparse import SparseFieldset
+
+
+def _walk(serializer, prefix, in_prefetch, select, prefetch):
+    """
+        walk the declared fields of a serializer and collect the relations to load:
+        - nested serializers on a foreign key are joined with select_related
+        - nested serializers with many=True and lists of primary keys are loaded with prefetch_related
+    """
+    model = serializer.Meta.model
+    for field in serializer.fields.values():
+        if isinstance(field, ManyRelatedField):
+            prefetch.append(prefix + field.source.replace('.', '__'))
+            continue
+        if not isinstance(field, BaseSerializer) or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, ListSerializer):
+            prefetch.append(path)
+            _walk(field.child, path + '__', True, select, prefetch)
+            continue
+        model_field = model._meta.get_field(field.source.split('.')[0])
+        if model_field.many_to_one or model_field.one_to_one:
+            (prefetch if in_prefetch else select).append(path)
+            _walk(field, path + '__', in_prefetch, select, prefetch)
+
+
+@lru_cache(maxsize=None)
+def get_related_paths(serializer_class):
+    """
+        returns the select_related and prefetch_related paths needed by a serializer class
+    """
+    select, prefetch = [], []
+    _walk(serializer_class(), '', False, select, prefetch)
+    return tuple(select), tuple(prefetch)
+
+
+def optimize_queryset(queryset, serializer_class):
+    """
+        add the joins and prefetches declared by the nesting of the serializer to the queryset
+    """
+    select, prefetch = get_related_paths(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _columns(serializer, prefix, columns):
+    """
+        collects the columns read by a serializer and its joined nested serializers,
+        returns False when a field is not a model field (method, property): every column is then needed
+    """
+    model = serializer.Meta.model
+    columns.append(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            return False
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return False
+        if model_field.many_to_many or not model_field.concrete:
+            continue
+        columns.append(prefix + field.source)
+        if isinstance(field, BaseSerializer) and not _columns(field, f'{prefix}{field.source}__', columns):
+            return False
+    return True
+
+
+def optimize_serializer_queryset(queryset, serializer, keep=()):
+    """
+        add the joins and prefetches used by a serializer instance (restricted to a sparse fieldset) to the queryset,
+        and defer the columns it does not read
+        - keep: columns loaded anyway (ordering of the pagination)
+    """
+    select, prefetch = [], []
+    _walk(serializer, '', False, select, prefetch)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    columns = []
+    if _columns(serializer, '', columns):
+        queryset = queryset.only(*columns, *keep)
+    return queryset
+
+
+class OptimizedQuerysetMixin(object):
+    """
+        viewset mixin loading the relations used by the serializer of the current action
+        list and retrieve accept ?fields= and ?expand= (api.sparse.SparseFieldset):
+        the relations not requested are neither joined nor serialized and the columns not requested are deferred
+    """
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = SparseFieldset.from_request(self.request) \
+                if self.action in ('list', 'retrieve') else None
+        return self._fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            fieldset.restrict(serializer.child if isinstance(serializer, ListSerializer) else serializer)
+        return serializer
+
+    def get_queryset(self):
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return optimize_queryset(super().get_queryset(), self.get_serializer_class())
+        serializer = fieldset.restrict(self.get_serializer_class()(context=self.get_serializer_context()))
+        ordering = [name.lstrip('-') for name in getattr(self.pagination_class, 'ordering', ())]
+        return optimize_serializer_queryset(super().get_queryset(), serializer, keep=ordering)
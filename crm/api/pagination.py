@@ -1,4 +1,21 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
 class PaginationHandlerMixin(object):
+    """
+        pagination of an APIView, ?limit=all skips it: paginate_queryset returns None and the view streams every row
+    """
+    unpaginated_value = 'all'
+
     @property
     def paginator(self):
         if not hasattr(self, '_paginator'):
@@ -13,10 +30,172 @@ class PaginationHandlerMixin(object):
     def paginate_queryset(self, queryset):
         if self.paginator is None:
             return None
+        param = getattr(self.paginator, 'page_size_query_param', None)
+        if param and self.request.query_params.get(param) == self.unpaginated_value:
+            return None
         return self.paginator.paginate_queryset(queryset,
                                                 self.request,
                                                 view=self)
 
     def get_paginated_response(self, data):
         assert self.paginator is not None
-        return self.paginator.get_paginated_response(data)
\ No newline at end of file
+        return self.paginator.get_paginated_response(data)
+
+
+def _encode_value(value):
+    """
+        keeps the full precision of dates, DjangoJSONEncoder truncates microseconds
+    """
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def estimate_count(queryset):
+    """
+        returns the number of rows estimated by the postgresql planner,
+        other databases do not expose planner statistics so the rows are counted
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor pagination filtering on the last seen values of the ordering fields
+        instead of using an offset, every page costs an index range scan whatever its depth
+        - ordering: the fields defining the key, the last one has to be unique
+        - ?limit=: number of rows per page
+        - ?cursor=: opaque position returned in the next and previous links
+        - ?count=exact or ?count=estimate: adds the total number of rows to the response
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    # columns of the tuples paginated instead of model instances (api.fast)
+    columns = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+
+        position, reverse = self.decode_cursor(queryset.model, request)
+        if reverse:
+            queryset = queryset.order_by(*['-' + field for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position, reverse))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_position = self.get_position(results[-1]) if has_next and results else None
+        self.previous_position = self.get_position(results[0]) if has_previous and results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param],
+                                 strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def get_keyset_filter(self, position, reverse):
+        """
+            builds (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... for the ordering fields
+        """
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            equal = {previous: position[i] for i, previous in enumerate(self.ordering[:index])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[index]})
+        return condition
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field in self.ordering]
+        if isinstance(item, tuple) and self.columns is not None:
+            return [item[self.columns.index(field)] for field in self.ordering]
+        return [getattr(item, field) for field in self.ordering]
+
+    def decode_cursor(self, model, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(cursor['p']) != len(self.ordering):
+                raise ValueError
+            position = [model._meta.get_field(field).to_python(value)
+                        for field, value in zip(self.ordering, cursor['p'])]
+            return position, bool(cursor.get('r'))
+        except Exception:
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(cursor, default=_encode_value).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+
+class ClientPagination(KeysetPagination):
+    ordering = ('company_name',)
+
+
+class ContractPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class EventPagination(KeysetPagination):
+    ordering = ('event_date', 'id')
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+from .fast import NotCompilable, compile_serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_encoder():
+    """
+        returns the function encoding one item to the bytes rendered by rest_framework's JSONRenderer:
+        orjson when it is installed and the output is compact unicode (the defaults), the json module otherwise
+    """
+    default = encoders.JSONEncoder().default
+    if orjson is not None and api_settings.UNICODE_JSON and api_settings.COMPACT_JSON:
+
+        def encode(item):
+            # orjson does not escape the line terminators which are not valid in javascript
+            data = orjson.dumps(item, default=default)
+            return data.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return encode
+
+    encoder = encoders.JSONEncoder(ensure_ascii=not api_settings.UNICODE_JSON,
+                                   allow_nan=not api_settings.STRICT_JSON,
+                                   separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': '))
+
+    def encode(item):
+        return encoder.encode(item).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+    return encode
+
+
+def stream_json_array(items, chunk_size):
+    """
+        yields the JSON array of the items by chunks of chunk_size items
+    """
+    encode = json_encoder()
+    buffer = [b'[']
+    separator = b''
+    for item in items:
+        buffer.append(separator)
+        buffer.append(encode(item))
+        separator = b','
+        if len(buffer) >= 2 * chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+
+def serialized_rows(queryset, serializer_class, chunk_size):
+    """
+        yields the representation of each row of the queryset read with an iterator (server-side cursor):
+        one values_list query with the compiled serializer (api.fast), the model instances otherwise
+    """
+    try:
+        compiled = compile_serializer(serializer_class)
+    except NotCompilable:
+        serializer = serializer_class()
+        yield from map(serializer.to_representation, queryset.iterator(chunk_size=chunk_size))
+        return
+    yield from map(compiled.renderer(), compiled.values(queryset).iterator(chunk_size=chunk_size))
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+        unpaginated list streamed as a JSON array while the rows are read:
+        the memory used does not depend on the number of rows
+    """
+
+    def __init__(self, queryset, serializer_class, **kwargs):
+        chunk_size = getattr(settings, 'JSON_STREAM_CHUNK_SIZE', 2000)
+        rows = serialized_rows(queryset, serializer_class, chunk_size)
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(stream_json_array(rows, chunk_size), **kwargs)
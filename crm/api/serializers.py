@@ -138,5 +138,13 @@ class EventDetailSerializer(ModelSerializer):
 
     class Meta:
         model = Event
-        fields = ['attendees', 'event_date', 'notes', 'client_id', 'support_contact', 'contract_id']
-        
+        fields = ['attendees', 'event_date', 'duration', 'notes', 'client_id', 'support_contact', 'contract_id']
+
+
+class ClientBulkSerializer(ClientDetailSerializer):
+    """
+        uniqueness of company_name and email is checked once for the whole batch
+    """
+
+    class Meta(ClientDetailSerializer.Meta):
+        extra_kwargs = {'company_name': {'validators': []}, 'email': {'validators': []}}
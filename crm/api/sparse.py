@@ -0,0 +1,76 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def parse_paths(value):
+    """
+        returns the tree {name: subtree} of comma separated dotted paths:
+        'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldset(object):
+    """
+        Fields of a representation selected by the query parameters of a request:
+        - ?fields=: the fields to return, a dotted path selects a field of a nested object (client_id.company_name)
+        - ?expand=: the relations returned as nested objects, the other relations are returned as their id
+        without any of them the serializer is left as declared
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        params = getattr(request, 'query_params', {})
+        fields, expand = params.get('fields'), params.get('expand')
+        if not fields and not expand:
+            return None
+        return cls(parse_paths(fields) if fields else None, parse_paths(expand or ''))
+
+    @property
+    def key(self):
+        return f'fields={self.fields}:expand={self.expand}'
+
+    def restrict(self, serializer):
+        """
+            removes the fields not requested from the serializer (and its nested serializers)
+            and replaces the relations not expanded by primary key fields, which read the foreign key without a join
+        """
+        self._restrict(serializer, self.fields, self.expand, '')
+        return serializer
+
+    def _restrict(self, serializer, fields, expand, prefix):
+        declared = serializer.fields
+        unknown = (set(fields or ()) | set(expand)) - set(declared)
+        if unknown:
+            raise ParseError(f"Unknown fields: {', '.join(prefix + name for name in sorted(unknown))}")
+        # a dotted path or an expansion needs a nested serializer
+        nested = set(expand) | {name for name, subtree in (fields or {}).items() if subtree}
+        scalars = {name for name in nested
+                   if not isinstance(getattr(declared[name], 'child', declared[name]), BaseSerializer)}
+        if scalars:
+            raise ParseError(f"Not relations: {', '.join(prefix + name for name in sorted(scalars))}")
+        if fields is not None:
+            for name in [name for name in declared if name not in fields]:
+                del declared[name]
+        for name, field in list(declared.items()):
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if not isinstance(nested, BaseSerializer) or field.source == '*':
+                continue
+            subfields = fields.get(name) or None if fields is not None else None
+            if name in expand or subfields is not None:
+                self._restrict(nested, subfields, expand.get(name, {}), f'{prefix}{name}.')
+            else:
+                source = {'source': field.source} if field.source != name else {}
+                declared[name] = PrimaryKeyRelatedField(read_only=True, many=isinstance(field, ListSerializer),
+                                                        **source)
@@ -1,3 +1,925 @@
-from django.test import TestCase
+import gzip
+import json
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from authentication.models import User
+from api.cache import get_representation_cache
+from api.fast import NotCompilable, compile_serializer
+from api.metrics import response_size
+from api.renderers import stream_json_array
+from api.serializers import ClientListSerializer, ContractListSerializer, CreateUserSerializer, EventListSerializer
+from api.views import ClientViewSet
+from epicevent.changes import encode_cursor
+from epicevent.models import Change, Client, Contract, ContractRollup, Event, EventRollup
+from epicevent.queries import potential_clients
+from epicevent.rollups import rebuild_rollups
+from epicevent.search import NgramIndex, clear_ngram_indexes
+from epicevent.signals import post_bulk_save
 
-# Create your tests here.
+
+def create_dataset(size):
+    """
+        creates size clients, each one with a signed contract and an upcoming event
+        half of the events are assigned to a support contact
+    """
+    sales = User.objects.create(username='sales', email='sales@epic.com')
+    sales.groups.add(Group.objects.get(name='sales'))
+    support = User.objects.create(username='support', email='support@epic.com')
+    support.groups.add(Group.objects.get(name='support'))
+    event_date = timezone.now() + timedelta(days=1)
+    for i in range(size):
+        client = Client.objects.create(company_name=f'company{i}', email=f'client{i}@company.com',
+                                       sales_contact_id=sales)
+        contract = Contract.objects.create(status=True, amount=1000, client_id=client, sales_contact_id=sales)
+        Event.objects.create(attendees=10, event_date=event_date, client_id=client, contract_id=contract,
+                             support_contact=support if i % 2 else None)
+    return sales, support
+
+
+class QueryCountTestCase(TestCase):
+    """
+        harness checking that an endpoint issues the same number of queries whatever the page size
+    """
+    small_page = 2
+    large_page = 20
+
+    def count_queries(self, user, url, limit):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(pk=user.pk))
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, user, url):
+        small = self.count_queries(user, url, self.small_page)
+        large = self.count_queries(user, url, self.large_page)
+        self.assertEqual(small, large, f'{url} issues {small} queries for {self.small_page} rows '
+                                       f'and {large} queries for {self.large_page} rows')
+
+
+class EventListQueryCountTests(QueryCountTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(40)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+
+    def test_event_list(self):
+        self.assertConstantQueries(self.manager, '/api/event/')
+
+    def test_contract_list(self):
+        self.assertConstantQueries(self.manager, '/api/contract/')
+
+    def test_coming_event_list(self):
+        self.assertConstantQueries(self.sales, '/api/comingevent/')
+
+    def test_missing_event_support(self):
+        self.assertConstantQueries(self.manager, '/api/event/nosupport/')
+
+    def test_support_events(self):
+        self.assertConstantQueries(self.support, '/api/event/supportevent/')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(11)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_pages_with_equal_event_dates(self):
+        ids = list(Event.objects.order_by('id').values_list('id', flat=True))
+        pages = self.walk('/api/event/?limit=3', 'next')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), ids)
+
+        last_page = self.client.get('/api/event/?limit=3').data
+        for _ in range(3):
+            last_page = self.client.get(last_page['next']).data
+        backward = self.walk(last_page['previous'], 'previous')
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_client_pages(self):
+        names = list(Client.objects.order_by('company_name').values_list('company_name', flat=True))
+        response = self.client.get('/api/client/', {'limit': 4, 'count': 'exact'})
+        self.assertEqual(response.data['count'], 11)
+        results = []
+        url = '/api/client/?limit=4'
+        while url:
+            response = self.client.get(url)
+            results += [row['company_name'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(results, names)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/contract/', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def bulk_create_clients(self, count):
+        items = [{'company_name': f'new{count}_{i}', 'email': f'new{count}_{i}@company.com',
+                  'sales_contact_id': 'sales'} for i in range(count)]
+        self.client.force_authenticate(user=User.objects.get(pk=self.sales.pk))
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/client/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['results']), count)
+        return len(context.captured_queries)
+
+    def test_queries_do_not_depend_on_size(self):
+        self.assertEqual(self.bulk_create_clients(2), self.bulk_create_clients(30))
+
+    def test_errors_are_reported_by_index(self):
+        items = [{'company_name': 'new', 'sales_contact_id': 'sales'},
+                 {'company_name': 'company0', 'sales_contact_id': 'sales'},
+                 {'company_name': 'new', 'sales_contact_id': 'sales'},
+                 {'company_name': 'other', 'sales_contact_id': 'support'}]
+        response = self.client.post('/api/client/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['company_name'] for result in response.data['results']], ['new'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+
+    def test_events(self):
+        client = Client.objects.get(company_name='company0')
+        contract = Contract.objects.create(status=True, amount=10, client_id=client, sales_contact_id=self.sales)
+        item = {'client_id': 'company0', 'contract_id': contract.id, 'attendees': 5,
+                'event_date': '2030-01-01T10:00:00Z', 'support_contact': 'support'}
+        response = self.client.post('/api/event/bulk/', [item, item], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': 'Contract is already used'}])
+        event = Event.objects.get(contract_id=contract)
+        response = self.client.put('/api/event/bulk/', [dict(item, id=event.id, attendees=50)], format='json')
+        self.assertEqual(response.status_code, 200)
+        event.refresh_from_db()
+        self.assertEqual(event.attendees, 50)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(3)
+        cls.other = User.objects.create(username='other', email='other@epic.com')
+        Client.objects.create(company_name='other company', sales_contact_id=cls.other)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        lines = self.export('/api/client/export/', sales_contact_id=self.sales.id).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'company_name'])
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['company0', 'company1', 'company2'])
+
+    def test_ndjson_date_range(self):
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        content = self.export('/api/event/export/', type='ndjson', to=tomorrow)
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['company_name'] for row in rows], ['company0', 'company1', 'company2'])
+        self.assertEqual(self.export('/api/event/export/', type='ndjson', **{'from': '2100-01-01'}), b'')
+
+    def test_gzip(self):
+        content = self.export('/api/contract/export/', compress='gzip')
+        self.assertEqual(len(gzip.decompress(content).decode().splitlines()), 4)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/event/export/', {'type': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/event/export/', {'from': 'yesterday'}).status_code, 400)
+        self.assertEqual(APIClient().get('/api/event/export/').status_code, 401)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def size_count(self, endpoint):
+        child = response_size.labels(endpoint=endpoint)
+        return child.count, child.sum
+
+    def test_access(self):
+        self.assertEqual(APIClient().get('/metrics/').status_code, 200)
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(APIClient().get('/metrics/').status_code, 403)
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            staff = APIClient()
+            staff.force_login(User.objects.create(username='staff', email='staff@epic.com', is_staff=True))
+            self.assertEqual(staff.get('/metrics/').status_code, 200)
+
+    def test_streaming_recorded_with_body(self):
+        count, total = self.size_count('ClientViewSet.export')
+        response = self.client.get('/api/client/export/')
+        self.assertEqual(self.size_count('ClientViewSet.export'), (count, total))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(self.size_count('ClientViewSet.export'), (count + 1, total + len(content)))
+
+
+class RepresentationCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+
+    def setUp(self):
+        cache.clear()
+        get_representation_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len([query for query in context.captured_queries if 'epicevent' in query['sql']])
+
+    def test_hit(self):
+        data, queries = self.get('/api/client/company0/')
+        self.assertGreater(queries, 0)
+        self.assertEqual(self.get('/api/client/company0/'), (data, 0))
+
+    def test_write_during_miss(self):
+        get_object = ClientViewSet.get_object
+        loads = []
+
+        def load_then_write(view):
+            instance = get_object(view)
+            loads.append(instance)
+            if len(loads) == 1:
+                # written after the row was read and before the entry is stored
+                Client.objects.get(pk=instance.pk).save()
+                Client.objects.filter(pk=instance.pk).update(phone='0102030405')
+            return instance
+
+        with mock.patch.object(ClientViewSet, 'get_object', load_then_write):
+            self.assertEqual(self.get('/api/client/company0/')[0]['phone'], None)
+        self.assertEqual(self.get('/api/client/company0/')[0]['phone'], '0102030405')
+
+    def test_single_load(self):
+        event = Event.objects.get(client_id__company_name='company1')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(f'/api/event/{event.id}/')
+        queries = [query['sql'] for query in context.captured_queries if 'epicevent_event' in query['sql']]
+        self.assertEqual(len(queries), 1)
+
+    def test_nested_user_change(self):
+        event = Event.objects.get(client_id__company_name='company1')
+        url = f'/api/event/{event.id}/'
+        self.get(url)
+        self.support.first_name = 'Renamed'
+        self.support.save()
+        data, queries = self.get(url)
+        self.assertGreater(queries, 0)
+        self.assertEqual(data['support_contact']['first_name'], 'Renamed')
+
+    def test_nested_client_change(self):
+        contract = Contract.objects.get(client_id__company_name='company0')
+        url = f'/api/contract/{contract.id}/'
+        self.get(url)
+        Client.objects.filter(pk=contract.client_id_id).update(phone='0102030405')
+        self.assertEqual(self.get(url)[1], 0)
+        client = Client.objects.get(pk=contract.client_id_id)
+        client.save()
+        self.assertEqual(self.get(url)[0]['client_id']['phone'], '0102030405')
+
+    def test_counters(self):
+        self.get('/api/client/company0/')
+        self.get('/api/client/company0/')
+        metrics = self.client.get('/metrics/').content.decode()
+        self.assertIn('crm_representation_cache_total{result="hit",serializer="ClientDetailSerializer"}', metrics)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(4)
+
+    def setUp(self):
+        cache.clear()
+        get_representation_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.support)
+
+    def get(self, url, etag=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, len(context.captured_queries)
+
+    def test_not_modified_before_serialization(self):
+        response, queries = self.get('/api/event/supportevent/')
+        self.assertEqual(response.status_code, 200)
+        response, not_modified_queries = self.get('/api/event/supportevent/', response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(not_modified_queries, 1)
+        self.assertLess(not_modified_queries, queries)
+
+    def test_changed_rows(self):
+        etag = self.client.get('/api/event/supportevent/')['ETag']
+        event = Event.objects.filter(support_contact=self.support).first()
+        update_date = event.update_date
+        event.save()
+        self.assertGreater(event.update_date, update_date)
+        self.assertEqual(self.get('/api/event/supportevent/', etag)[0].status_code, 200)
+        etag = self.client.get('/api/event/supportevent/')['ETag']
+        Event.objects.filter(pk=event.pk).delete()
+        self.assertEqual(self.get('/api/event/supportevent/', etag)[0].status_code, 200)
+
+    def test_list_validated_by_rows(self):
+        response = self.client.get('/api/client/')
+        not_modified, queries = self.get('/api/client/', response['ETag'])
+        self.assertEqual((not_modified.status_code, queries), (304, 1))
+        # written by another worker: the versions of this process are not bumped
+        Client.objects.filter(company_name='company0').update(update_date=timezone.now())
+        self.assertEqual(self.get('/api/client/', response['ETag'])[0].status_code, 200)
+
+    def test_etag_depends_on_user_and_url(self):
+        response = self.client.get('/api/event/')
+        self.assertNotEqual(response['ETag'], self.client.get('/api/event/', {'limit': 2})['ETag'])
+        self.client.force_authenticate(user=self.sales)
+        self.assertEqual(self.get('/api/event/', response['ETag'])[0].status_code, 200)
+
+    def test_cached_detail(self):
+        response = self.client.get('/api/client/company0/')
+        self.assertIn('Last-Modified', response)
+        not_modified, queries = self.get('/api/client/company0/', response['ETag'])
+        self.assertEqual((not_modified.status_code, queries), (304, 0))
+        client = Client.objects.get(company_name='company0')
+        self.client.force_authenticate(user=self.sales)
+        item = {'company_name': 'company0', 'email': client.email, 'sales_contact_id': 'sales', 'phone': '0102030405'}
+        self.assertEqual(self.client.put('/api/client/bulk/', [item], format='json').status_code, 200)
+        self.assertGreater(Client.objects.get(pk=client.pk).update_date, client.update_date)
+        self.assertEqual(self.get('/api/client/company0/', response['ETag'])[0].status_code, 200)
+
+
+class ChangesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def changes(self, since=0, **params):
+        response = self.client.get('/api/changes/', {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_create_update_delete(self):
+        cursor = encode_cursor(Change.objects.last())
+        event = Event.objects.get(client_id__company_name='company1')
+        event.duration = timedelta(hours=3)
+        event.save()
+        self.assertEqual(self.changes(cursor)['results'][-1]['data']['duration'], '03:00:00')
+        cursor = encode_cursor(Change.objects.last())
+        client = Client.objects.get(company_name='company0')
+        client.phone = '0102030405'
+        client.save()
+        client.delete()
+        results = self.changes(cursor)['results']
+        self.assertEqual([(change['model'], change['action']) for change in results],
+                         [('client', 'updated'), ('event', 'deleted'), ('contract', 'deleted'), ('client', 'deleted')])
+        self.assertIsNone(results[0]['data'])
+
+    def test_pages(self):
+        data = self.changes(limit=4)
+        self.assertEqual([(change['model'], change['action']) for change in data['results']],
+                         [('client', 'created'), ('contract', 'created'), ('event', 'created'), ('client', 'created')])
+        self.assertEqual(data['results'][2]['data']['duration'], None)
+        self.assertEqual(data['results'][0]['data']['company_name'], 'company0')
+        self.assertTrue(data['more'])
+        data = self.client.get(data['next']).data
+        self.assertEqual(len(data['results']), 2)
+        self.assertFalse(data['more'])
+        self.assertEqual(self.client.get(data['next']).data['results'], [])
+
+    def test_user_cascade(self):
+        cursor = encode_cursor(Change.objects.last())
+        self.support.delete()
+        results = self.changes(cursor)['results']
+        self.assertEqual([(change['model'], change['action']) for change in results], [('event', 'deleted')])
+
+    def test_bulk_and_cursors(self):
+        cursor = encode_cursor(Change.objects.last())
+        items = [{'company_name': 'new', 'sales_contact_id': 'sales'}]
+        self.client.force_authenticate(user=self.sales)
+        self.assertEqual(self.client.post('/api/client/bulk/', items, format='json').status_code, 201)
+        self.client.force_authenticate(user=self.manager)
+        results = self.changes(cursor)['results']
+        self.assertEqual([change['action'] for change in results], ['created'])
+        self.assertEqual(results[0]['cursor'], f'0-{Change.objects.last().id}')
+        self.assertEqual(self.changes(results[0]['cursor'])['results'], [])
+        for since in ['x', '1-', '-1', '5']:
+            self.assertEqual(self.client.get('/api/changes/', {'since': since}).status_code, 400)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+        Client.objects.create(company_name='Lumiere Events', last_name='Dubois', email='contact@lumiere.fr')
+        event = Event.objects.get(client_id__company_name='company1')
+        event.notes = 'Wedding reception in the garden'
+        event.save()
+
+    def setUp(self):
+        clear_ngram_indexes()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['label']) for result in response.data['results']]
+
+    def test_prefix_first(self):
+        self.assertEqual(self.search('company', type='client'), [('client', 'company0'), ('client', 'company1')])
+        self.assertEqual(self.search('Dub'), [('client', 'Lumiere Events')])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.search('lumire', type='client'), [('client', 'Lumiere Events')])
+        self.assertEqual(self.search('weding')[0][0], 'event')
+        self.assertEqual(self.search('zzzz'), [])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search('duboi'), [('client', 'Lumiere Events')])
+        self.assertEqual(self.search('coktail'), [])
+        with mock.patch.object(NgramIndex, 'build') as build, self.captureOnCommitCallbacks(execute=True):
+            Client.objects.filter(company_name='Lumiere Events').get().delete()
+            event = Event.objects.get(client_id__company_name='company0')
+            event.notes = 'Cocktail party'
+            event.save()
+        self.assertEqual(self.search('duboi'), [])
+        self.assertEqual(self.search('coktail', type='event'), [('event', str(event))])
+        build.assert_not_called()
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'a', 'type': 'contract'}).status_code, 400)
+
+
+class ReportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(3)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def rollups(self):
+        return (list(ContractRollup.objects.order_by('id').values_list('sales_contact', 'month', 'due_month', 'status',
+                                                                      'count', 'amount')),
+                list(EventRollup.objects.order_by('id').values_list('support_contact', 'month', 'count', 'attendees')))
+
+    def assertRollupsRebuilt(self):
+        incremental = [sorted(rows, key=str) for rows in self.rollups()]
+        rebuild_rollups()
+        self.assertEqual(incremental, [sorted(rows, key=str) for rows in self.rollups()])
+
+    def test_incremental_totals(self):
+        client = Client.objects.get(company_name='company0')
+        Contract.objects.create(amount=500, client_id=client, sales_contact_id=self.sales,
+                                payment_due=timezone.now().date() + timedelta(days=40))
+        contract = Contract.objects.get(client_id__company_name='company1')
+        contract.amount = 1500
+        contract.status = False
+        contract.save()
+        self.assertRollupsRebuilt()
+        event = Event.objects.only('id').get(client_id=client)
+        event.attendees = 25
+        event.save()
+        self.client.force_authenticate(user=self.sales)
+        item = {'id': contract.id, 'client_id': 'company2', 'status': True, 'amount': 2000}
+        self.assertEqual(self.client.put('/api/contract/bulk/', [item], format='json').status_code, 200)
+        self.assertRollupsRebuilt()
+        Client.objects.get(company_name='company2').delete()
+        self.support.delete()
+        self.assertRollupsRebuilt()
+
+    def test_snapshots(self):
+        self.assertFalse(hasattr(Contract.objects.first(), '_rollup_values'))
+        event = Event.objects.first()
+        event.notes = 'notes'
+        with CaptureQueriesContext(connection) as context:
+            event.save(update_fields=['notes'])
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('SELECT')])
+        event.attendees = 40
+        Event.objects.bulk_update([event], ['attendees'])
+        with self.assertRaises(ValueError):
+            post_bulk_save.send(sender=Event, instances=[event], created=False)
+        rebuild_rollups()
+        rollup = EventRollup.objects.filter(support_contact__isnull=True).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            EventRollup.objects.create(support_contact=None, month=rollup.month)
+
+    def test_reports(self):
+        Contract.objects.create(amount=500, client_id=Client.objects.first(), sales_contact_id=self.sales,
+                                payment_due=timezone.now().date())
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/reports/contracts/')
+        self.assertLessEqual(len(context.captured_queries), 2)
+        self.assertEqual(response.data, {'signed_count': 3, 'signed_amount': 3000,
+                                         'unsigned_count': 1, 'unsigned_amount': 500})
+        sales = self.client.get('/api/reports/sales/').data
+        self.assertEqual([(row['username'], row['signed_count']) for row in sales], [('sales', 3)])
+        payments = self.client.get('/api/reports/payments/').data
+        self.assertEqual([row['unsigned_amount'] for row in payments], [500])
+        support = self.client.get('/api/reports/support/').data
+        self.assertEqual([(row['username'], row['events'], row['attendees']) for row in support],
+                         [('support', 1, 10), (None, 2, 20)])
+        self.assertEqual(self.client.get('/api/reports/unknown/').status_code, 404)
+        self.client.force_authenticate(user=self.sales)
+        self.assertEqual(self.client.get('/api/reports/contracts/').status_code, 403)
+
+
+class ForecastTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(3)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        today = timezone.localdate()
+        client = Client.objects.first()
+        for amount, days, signed in ((100, -45, True), (200, -5, True), (300, 3, True), (400, 40, False),
+                                     (500, 100, True)):
+            Contract.objects.create(amount=amount, status=signed, payment_due=today + timedelta(days=days),
+                                    client_id=client, sales_contact_id=cls.sales)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def test_report(self):
+        response = self.client.get('/api/forecast/', {'weeks': 2, 'months': 3})
+        self.assertEqual(response.status_code, 200)
+        report = response.data
+        today = timezone.localdate()
+        start = today - timedelta(days=today.weekday())
+        self.assertEqual(report['weekly'][0]['week'], start)
+        due = Contract.objects.filter(status=True, payment_due__gte=start, payment_due__lt=start + timedelta(days=14))
+        self.assertEqual(sum(week['signed'] for week in report['weekly']), sum(due.values_list('amount', flat=True)))
+        self.assertEqual(report['monthly'][0]['month'], today.replace(day=1))
+        self.assertEqual(sum(month['unsigned'] for month in report['monthly']), 400)
+        self.assertEqual({row['bucket']: row['amount'] for row in report['ageing']},
+                         {'current': 800, '1-30': 200, '31-60': 100, '61-90': 0, '90+': 0})
+        self.assertEqual(report['sales'], [{'sales_contact': self.sales.pk, 'username': 'sales',
+                                            'signed': 4100, 'unsigned': 400, 'overdue': 300}])
+        self.assertEqual(report['undated'], {'count': 3, 'amount': 3000})
+
+    def test_cached_until_contract_changes(self):
+        self.client.get('/api/forecast/')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/forecast/')
+        self.assertFalse([query for query in context.captured_queries if 'epicevent_contract' in query['sql']])
+        Contract.objects.filter(amount=500).get().delete()
+        self.assertEqual(self.client.get('/api/forecast/').data['sales'][0]['signed'], 3600)
+
+    def test_command_and_parameters(self):
+        out = StringIO()
+        call_command('forecast', stdout=out)
+        self.assertIn('Ageing of signed contracts', out.getvalue())
+        self.assertEqual(self.client.get('/api/forecast/', {'weeks': 'x'}).status_code, 400)
+
+
+class AssignSupportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(4)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        cls.support2 = User.objects.create(username='support2', email='support2@epic.com')
+        cls.support2.groups.add(Group.objects.get(name='support'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def add_support(self, username):
+        user = User.objects.create(username=username, email=f'{username}@epic.com')
+        user.groups.add(Group.objects.get(name='support'))
+        return user
+
+    def test_dry_run(self):
+        response = self.client.post('/api/event/nosupport/assign/', {'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['assigned']) + len(response.data['unassigned']), 2)
+        self.assertEqual(Event.objects.filter(support_contact__isnull=True).count(), 2)
+
+    def test_balance_and_conflicts(self):
+        # every unassigned event takes place on the same date as the two events of support
+        self.add_support('support3')
+        response = self.client.post('/api/event/nosupport/assign/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['username'] for row in response.data['assigned']}, {'support2', 'support3'})
+        self.assertEqual(response.data['unassigned'], [])
+        self.assertFalse(Event.objects.filter(support_contact__isnull=True).exists())
+        self.assertEqual({row['username']: row['events'] for row in response.data['loads']},
+                         {'support': 2, 'support2': 1, 'support3': 1})
+        self.assertEqual(Change.objects.filter(model='event', action=Change.UPDATED).count(), 2)
+        report = {row['username']: row['events'] for row in self.client.get('/api/reports/support/').data}
+        self.assertEqual(report, {'support': 2, 'support2': 1, 'support3': 1})
+
+    def test_unavailable_support(self):
+        out = StringIO()
+        call_command('assign_support', stdout=out)
+        self.assertIn('1 events assigned, 1 without support contact', out.getvalue())
+        self.assertEqual(Event.objects.filter(support_contact=self.support2).count(), 1)
+        self.assertEqual(Event.objects.filter(support_contact__isnull=True).count(), 1)
+
+    def test_constant_queries(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                call_command('assign_support', dry_run=True, stdout=StringIO())
+            return len(context.captured_queries)
+
+        small = count_queries()
+        client = Client.objects.first()
+        for day in range(2, 22):
+            contract = Contract.objects.create(status=True, amount=1000, client_id=client, sales_contact_id=self.sales)
+            Event.objects.create(attendees=5, event_date=timezone.now() + timedelta(days=day), client_id=client,
+                                 contract_id=contract)
+        self.assertEqual(count_queries(), small)
+
+
+class EventConflictTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        cls.assigned = Event.objects.get(support_contact=cls.support)
+        cls.assigned.duration = timedelta(days=1)
+        cls.assigned.save()
+        cls.client_ = Client.objects.get(company_name='company0')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.sales)
+
+    def new_contract(self):
+        return Contract.objects.create(status=True, amount=10, client_id=self.client_, sales_contact_id=self.sales)
+
+    def item(self, hours, duration=None):
+        event_date = self.assigned.event_date + timedelta(hours=hours)
+        return {'client_id': 'company0', 'contract_id': self.new_contract().id, 'attendees': 5, 'notes': '',
+                'event_date': event_date.isoformat(), 'duration': duration, 'support_contact': 'support'}
+
+    def test_create(self):
+        response = self.client.post('/api/event/', self.item(12), format='json')
+        self.assertIn('support is already assigned to event', response.data)
+        response = self.client.post('/api/event/', self.item(-2, '01:00:00'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Event.objects.filter(support_contact=self.support).count(), 2)
+
+    def test_update(self):
+        event = Event.objects.filter(support_contact__isnull=True).get()
+        item = dict(self.item(1), contract_id=event.contract_id_id)
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.put(f'/api/event/{event.pk}/', item, format='json')
+        self.assertIn('support is already assigned to event', response.data)
+        item = dict(item, contract_id=self.assigned.contract_id_id)
+        response = self.client.put(f'/api/event/{self.assigned.pk}/', item, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_point_events(self):
+        Event.objects.filter(pk=self.assigned.pk).update(duration=None)
+        self.assertEqual(self.client.post('/api/event/', self.item(12), format='json').status_code, 201)
+        response = self.client.post('/api/event/', self.item(0), format='json')
+        self.assertIn('support is already assigned to event', response.data)
+        response = self.client.post('/api/event/', self.item(-1, '02:00:00'), format='json')
+        self.assertIn('support is already assigned to event', response.data)
+
+    def test_bulk(self):
+        items = [self.item(24, '12:00:00'), self.item(30), self.item(12)]
+        response = self.client.post('/api/event/bulk/', items, format='json')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('another event', response.data['errors'][0]['errors'])
+        self.assertIn(f'event {self.assigned.pk}', response.data['errors'][1]['errors'])
+
+    def test_conflicts_endpoint(self):
+        event = Event.objects.filter(support_contact__isnull=True).get()
+        Event.objects.filter(pk=event.pk).update(support_contact=self.support)
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get('/api/event/conflicts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['username'], 'support')
+        self.assertEqual(response.data[0]['conflicts_with'], [min(event.pk, self.assigned.pk)])
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(3)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        cls.event = Event.objects.filter(support_contact=cls.support).get()
+        Event.objects.filter(pk=cls.event.pk).update(notes='x' * 30000)
+
+    def setUp(self):
+        get_representation_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        queries = [query['sql'] for query in context.captured_queries]
+        return response.data, [sql for sql in queries if 'epicevent_event"."id' in sql]
+
+    def test_fields(self):
+        data, queries = self.get(f'/api/event/{self.event.pk}/', fields='event_date,attendees')
+        self.assertEqual(list(data), ['attendees', 'event_date'])
+        self.assertNotIn('JOIN', queries[-1])
+        self.assertNotIn('notes', queries[-1])
+
+    def test_expand(self):
+        data, queries = self.get(f'/api/event/{self.event.pk}/', expand='support_contact')
+        self.assertEqual(data['client_id'], self.event.client_id_id)
+        self.assertEqual(data['contract_id'], self.event.contract_id_id)
+        self.assertEqual(data['support_contact']['username'], 'support')
+        self.assertEqual(queries[-1].count('JOIN'), 1)
+        data, _ = self.get(f'/api/event/{self.event.pk}/', fields='notes,contract_id.sales_contact_id.username')
+        self.assertEqual(data['contract_id'], {'sales_contact_id': {'username': 'sales'}})
+        self.assertEqual(len(data['notes']), 30000)
+        data, _ = self.get(f'/api/event/{self.event.pk}/')
+        self.assertEqual(data['client_id']['company_name'], self.event.client_id.company_name)
+
+    def test_lists(self):
+        data, queries = self.get('/api/event/', fields='id,support_contact.username')
+        self.assertEqual([row['support_contact'] for row in data['results']], [None, {'username': 'support'}, None])
+        data, _ = self.get('/api/user/support/', fields='username,groups')
+        self.assertEqual(data, {'username': 'support', 'groups': [Group.objects.get(name='support').pk]})
+        data, _ = self.get('/api/client/', fields='company_name')
+        self.assertEqual(data['results'][0], {'company_name': 'company0'})
+
+    def test_unknown_fields(self):
+        response = self.client.get(f'/api/event/{self.event.pk}/', {'fields': 'id'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/event/', {'expand': 'contract_id.client'})
+        self.assertEqual(response.status_code, 400)
+        for params in [{'fields': 'attendees.foo'}, {'fields': 'client_id.company_name.foo'}, {'expand': 'notes'}]:
+            response = self.client.get(f'/api/event/{self.event.pk}/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Not relations', response.data['detail'])
+
+
+class CompiledSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(4)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        Client.objects.filter(company_name='company1').update(first_name=None, email='')
+
+    def setUp(self):
+        get_representation_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def test_same_json(self):
+        renderer = JSONRenderer()
+        for model, serializer_class in [(Client, ClientListSerializer), (Contract, ContractListSerializer),
+                                        (Event, EventListSerializer)]:
+            queryset = model.objects.order_by('pk')
+            compiled = compile_serializer(serializer_class)
+            for zone in ['UTC', 'Europe/Paris']:
+                with timezone.override(zone):
+                    self.assertEqual(renderer.render(compiled.render_many(compiled.values(queryset))),
+                                     renderer.render(serializer_class(queryset, many=True).data))
+
+    def test_one_query_per_page(self):
+        for url, params in [('/api/event/', {}), ('/api/contract/', {}), ('/api/event/', {'fields': 'id,event_date'})]:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            queries = [query['sql'] for query in context.captured_queries
+                       if 'epicevent_' in query['sql'] and 'COUNT(' not in query['sql']]
+            self.assertEqual(len(queries), 1)
+        data = self.client.get('/api/event/', {'fields': 'id,support_contact.username'}).data
+        self.assertEqual([row['support_contact'] for row in data['results']],
+                         [None, {'username': 'support'}, None, {'username': 'support'}])
+
+    def test_cursor_of_rows(self):
+        # event_date is not rendered, the cursor reads it from the column added for the pagination
+        ids, url, params = [], '/api/event/', {'fields': 'id', 'limit': 1}
+        while url:
+            data = self.client.get(url, params).data
+            ids += [row['id'] for row in data['results']]
+            url, params = data['next'], {}
+        self.assertEqual(ids, list(Event.objects.order_by('event_date', 'id').values_list('id', flat=True)))
+
+    def test_not_compilable(self):
+        with self.assertRaises(NotCompilable):
+            compile_serializer(CreateUserSerializer)
+
+
+class StreamingJSONTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(5)
+        cls.manager = User.objects.create(username='manager', email='manager@epic.com')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        Client.objects.filter(company_name='company1').update(company_name='company \u00e9\u2028',
+                                                              sales_contact_id=None)
+        Client.objects.create(company_name='prospect', sales_contact_id=cls.sales)
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_unpaginated_lists(self):
+        renderer = JSONRenderer()
+        for user, url, data in [
+                (self.manager, '/api/client/nosales/?limit=all',
+                 ClientListSerializer(Client.objects.filter(sales_contact_id__isnull=True), many=True).data),
+                (self.manager, '/api/event/nosupport/?limit=all',
+                 EventListSerializer(Event.objects.filter(support_contact__isnull=True), many=True).data),
+                (self.sales, '/api/client/potential/?limit=all',
+                 ClientListSerializer(potential_clients(), many=True).data),
+                (self.support, '/api/event/supportevent/?limit=all',
+                 EventListSerializer(Event.objects.filter(support_contact=self.support), many=True).data)]:
+            self.assertEqual(self.get(user, url), renderer.render(data))
+            with mock.patch('api.renderers.orjson', None), override_settings(JSON_STREAM_CHUNK_SIZE=1):
+                self.assertEqual(self.get(user, url), renderer.render(data))
+
+    def test_paginated_lists(self):
+        client = APIClient()
+        client.force_authenticate(user=self.manager)
+        response = client.get('/api/event/nosupport/?limit=1')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_chunks(self):
+        chunks = list(stream_json_array(({'id': index} for index in range(5)), 2))
+        self.assertEqual(chunks, [b'[{"id":0},{"id":1}', b',{"id":2},{"id":3}', b',{"id":4}]'])
+        self.assertEqual(list(stream_json_array([], 2)), [b'[]'])
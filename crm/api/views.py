@@ -3,31 +3,48 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ValidationError
 from django.http import Http404
-from datetime import datetime
-from django.utils import timezone
+from django.urls import reverse
+from django.core.cache import cache
 from django.contrib.auth.models import Group
-from .pagination import PaginationHandlerMixin
+from .pagination import PaginationHandlerMixin, ClientPagination, ContractPagination, EventPagination
+from .optimization import OptimizedQuerysetMixin, optimize_queryset
+from .fast import CompiledListMixin
+from .renderers import StreamingJSONResponse
+from .cache import CachedRetrieveMixin
+from .conditional import ConditionalGetMixin, ConditionalViewSetMixin, conditional
+from .bulk import ClientBulkOperation, ContractBulkOperation, EventBulkOperation, bulk_response
+from .export import export_response
 from authentication.models import User
 from epicevent.models import Client, Event, Contract
+from epicevent.queries import COMING_EVENT_BUCKET, current_bucket, upcoming_events, potential_clients
+from epicevent.versions import get_versions
+from epicevent.export import ClientExport, ContractExport, EventExport
+from epicevent.changes import CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE, CursorError, changes_since, decode_cursor
+from epicevent.search import SEARCH_FIELDS, SEARCH_LIMIT, SEARCH_MAX_LIMIT, search
+from epicevent.rollups import REPORTS
+from epicevent.forecast import FORECAST_WEEKS, FORECAST_MONTHS, FORECAST_MAX_PERIODS, get_forecast
+from epicevent.assignment import assign_support
+from epicevent.conflicts import all_conflicts, find_conflicts, conflict_message
+from epicevent.calendars import get_feed
 from authentication.permissions import IsSales, IsSupport, IsManager
+from authentication.roles import has_role
 from .serializers import \
     CreateUserSerializer, UserDetailSerializer, ModifyUserSerializer, UserListSerializer, \
     ClientDetailSerializer, ClientListSerializer, \
     ContractListSerializer, ContractDetailSerializer, \
     EventListSerializer, EventDetailSerializer
 import ast
+from hashlib import md5
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
+from rest_framework.pagination import _positive_int
+from rest_framework.utils.urls import replace_query_param
 
 
 # Create your views here.
-class BasicPagination(PageNumberPagination):
-    page_size_query_param = 'limit'
-
-
 class LoginUser(APIView):
     """
         Endpoint to log in the application and get the token
@@ -52,7 +69,7 @@ class LoginUser(APIView):
             raise ValidationError({"400": f'{user.last_name} {user.first_name} is not active'})
         
         
-class UsersViewSet(ModelViewSet):
+class UsersViewSet(ConditionalViewSetMixin, CompiledListMixin, OptimizedQuerysetMixin, ModelViewSet):
     """
         This viewset will manage the User model
         - get the list of users
@@ -68,6 +85,7 @@ class UsersViewSet(ModelViewSet):
     create_serializer_class = CreateUserSerializer
     queryset = User.objects.all()
     lookup_field = 'username'
+    conditional_models = (User,)
 
     def get_serializer_class(self):
         """
@@ -114,7 +132,8 @@ class UsersViewSet(ModelViewSet):
         return Response(f"{user.username} has been deleted", status=status.HTTP_204_NO_CONTENT)
 
 
-class ClientViewSet(ModelViewSet):
+class ClientViewSet(CachedRetrieveMixin, ConditionalViewSetMixin, CompiledListMixin, OptimizedQuerysetMixin,
+                    ModelViewSet):
     """
         Viewset to manage Client model
         - get the list of clients
@@ -126,6 +145,8 @@ class ClientViewSet(ModelViewSet):
     detail_serializer_class = ClientDetailSerializer
     queryset = Client.objects.all()
     lookup_field = 'company_name'
+    pagination_class = ClientPagination
+    conditional_models = (User,)
 
     def get_serializer_class(self):
         """
@@ -140,14 +161,20 @@ class ClientViewSet(ModelViewSet):
     def get_permissions(self):
         """
             Check the permission by action
-        """
-        if self.action == 'list':
+            bulk action follows the create (POST) and update (PUT) permissions, export the list one
+        """
+        action_name = self.action
+        if action_name == 'bulk':
+            action_name = 'create' if self.request.method == 'POST' else 'update'
+        elif action_name == 'export':
+            action_name = 'list'
+        if action_name == 'list':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'retrieve':
+        elif action_name == 'retrieve':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'update':
+        elif action_name == 'update':
             permission_classes = [IsAuthenticated, IsSales | IsManager]
-        elif self.action == 'create':
+        elif action_name == 'create':
             permission_classes = [IsAuthenticated, IsSales]
         else:
             permission_classes = [IsAdminUser]
@@ -159,7 +186,7 @@ class ClientViewSet(ModelViewSet):
         """
         serializer = ClientDetailSerializer(data=request.data)
         sales_contact = User.objects.get(username=request.data['sales_contact_id'])
-        if sales_contact.groups.filter(name='sales').exists():
+        if has_role(sales_contact, 'sales'):
             if serializer.is_valid():
                 serializer.save(sales_contact_id=sales_contact)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -175,10 +202,10 @@ class ClientViewSet(ModelViewSet):
         serializer = ClientDetailSerializer(client, data=request.data)
         if request.data['sales_contact_id']:
             sales_contact = User.objects.get(username=request.data['sales_contact_id'])
-        if request.user.groups.filter(name='manager').exists() or request.user == client.sales_contact_id:
+        if has_role(request.user, 'manager') or request.user == client.sales_contact_id:
             if serializer.is_valid():
                 if request.data['sales_contact_id']:
-                    if sales_contact.groups.filter(name='sales').exists():
+                    if has_role(sales_contact, 'sales'):
                         serializer.save(sales_contact_id=sales_contact)
                         return Response(serializer.data, status=status.HTTP_201_CREATED)
                     return Response(f"{sales_contact} is not from sales team")
@@ -187,8 +214,26 @@ class ClientViewSet(ModelViewSet):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response(f"You do not have permission to update {client}")
 
+    @action(detail=False, methods=['post', 'put'])
+    def bulk(self, request):
+        """
+            creates (POST) or updates (PUT) a list of clients with the same checks as create and update
+            the clients to update are identified by their company_name
+            valid clients are saved, the others are returned in errors with their index in the list
+        """
+        return bulk_response(ClientBulkOperation(request.user, request.data), request.method == 'POST')
 
-class ContractViewSet(ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+            streams all the clients as a csv or ndjson file, see api.export.export_response for the parameters
+            ?from= and ?to= filter on the creation date
+        """
+        return export_response(ClientExport(), self.get_queryset(), request)
+
+
+class ContractViewSet(CachedRetrieveMixin, ConditionalViewSetMixin, CompiledListMixin, OptimizedQuerysetMixin,
+                      ModelViewSet):
     """
         Viewset to manage Contract model:
         - get list of contracts
@@ -200,6 +245,8 @@ class ContractViewSet(ModelViewSet):
     detail_serializer_class = ContractDetailSerializer
     queryset = Contract.objects.all()
     lookup_field = 'id'
+    pagination_class = ContractPagination
+    conditional_models = (Client, User)
 
     def get_serializer_class(self):
         """
@@ -214,14 +261,20 @@ class ContractViewSet(ModelViewSet):
     def get_permissions(self):
         """
             Check the permission by action
-        """
-        if self.action == 'list':
+            bulk action follows the create (POST) and update (PUT) permissions, export the list one
+        """
+        action_name = self.action
+        if action_name == 'bulk':
+            action_name = 'create' if self.request.method == 'POST' else 'update'
+        elif action_name == 'export':
+            action_name = 'list'
+        if action_name == 'list':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'retrieve':
+        elif action_name == 'retrieve':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'update':
+        elif action_name == 'update':
             permission_classes = [IsAuthenticated, IsSales | IsManager]
-        elif self.action == 'create':
+        elif action_name == 'create':
             permission_classes = [IsAuthenticated, IsSales]
         else:
             permission_classes = [IsAdminUser]
@@ -247,7 +300,7 @@ class ContractViewSet(ModelViewSet):
         serializer = ContractDetailSerializer(contract, data=request.data)
         client = Client.objects.get(company_name=request.data['client_id'])
         sales_contact = User.objects.get(username=client.sales_contact_id)
-        if request.user.groups.filter(name='manager').exists() or request.user == contract.sales_contact_id:
+        if has_role(request.user, 'manager') or request.user == contract.sales_contact_id:
             if serializer.is_valid():
                 serializer.save(client_id=client, sales_contact_id=sales_contact)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -255,8 +308,26 @@ class ContractViewSet(ModelViewSet):
         return Response(f"You do not have rights to update contract {client.company_name}_{contract.id}"
                         f" of {client.company_name}")
 
+    @action(detail=False, methods=['post', 'put'])
+    def bulk(self, request):
+        """
+            creates (POST) or updates (PUT) a list of contracts with the same checks as create and update
+            the contracts to update are identified by their id
+            valid contracts are saved, the others are returned in errors with their index in the list
+        """
+        return bulk_response(ContractBulkOperation(request.user, request.data), request.method == 'POST')
 
-class EventViewSet(ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+            streams all the contracts as a csv or ndjson file, see api.export.export_response for the parameters
+            ?from= and ?to= filter on the creation date
+        """
+        return export_response(ContractExport(), self.get_queryset(), request)
+
+
+class EventViewSet(CachedRetrieveMixin, ConditionalViewSetMixin, CompiledListMixin, OptimizedQuerysetMixin,
+                   ModelViewSet):
     """
         Viewset to manage Event model:
         - get list of events
@@ -268,6 +339,8 @@ class EventViewSet(ModelViewSet):
     detail_serializer_class = EventDetailSerializer
     queryset = Event.objects.all()
     lookup_field = 'id'
+    pagination_class = EventPagination
+    conditional_models = (Contract, Client, User)
 
     def get_serializer_class(self):
         """
@@ -282,14 +355,20 @@ class EventViewSet(ModelViewSet):
     def get_permissions(self):
         """
             Check the permission by action
-        """
-        if self.action == 'list':
+            bulk action follows the create (POST) and update (PUT) permissions, export the list one
+        """
+        action_name = self.action
+        if action_name == 'bulk':
+            action_name = 'create' if self.request.method == 'POST' else 'update'
+        elif action_name == 'export':
+            action_name = 'list'
+        if action_name == 'list':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'retrieve':
+        elif action_name == 'retrieve':
             permission_classes = [IsAuthenticated]
-        elif self.action == 'update':
+        elif action_name == 'update':
             permission_classes = [IsAuthenticated, IsSales | IsManager | IsSupport]
-        elif self.action == 'create':
+        elif action_name == 'create':
             permission_classes = [IsAuthenticated, IsSales]
         else:
             permission_classes = [IsAdminUser]
@@ -312,7 +391,11 @@ class EventViewSet(ModelViewSet):
                 if contract.status is True:
                     if serializer.is_valid():
                         if data['support_contact']:
-                            if support_contact.groups.filter(name='support').exists():
+                            if has_role(support_contact, 'support'):
+                                conflicts = find_conflicts(support_contact, serializer.validated_data['event_date'],
+                                                           serializer.validated_data.get('duration'))
+                                if conflicts:
+                                    return Response(conflict_message(support_contact, conflicts))
                                 serializer.save(client_id=client, support_contact=support_contact, contract_id=contract)
                                 return Response(serializer.data, status=status.HTTP_201_CREATED)
                             return Response(f"{support_contact} is not from support team")
@@ -336,14 +419,19 @@ class EventViewSet(ModelViewSet):
         contract = Contract.objects.get(id=event.contract_id.id)
         if data['support_contact']:
             new_support_contact = User.objects.get(username=data['support_contact'])
-        if request.user.groups.filter(name='manager').exists() \
+        if has_role(request.user, 'manager') \
                 or request.user == client.sales_contact_id \
                 or request.user == event.support_contact:
             if contract.client_id == client:
                 if contract.status is True:
                     if serializer.is_valid():
                         if data['support_contact']:
-                            if new_support_contact.groups.filter(name='support').exists():
+                            if has_role(new_support_contact, 'support'):
+                                conflicts = find_conflicts(new_support_contact, serializer.validated_data['event_date'],
+                                                           serializer.validated_data.get('duration', event.duration),
+                                                           exclude=event.pk)
+                                if conflicts:
+                                    return Response(conflict_message(new_support_contact, conflicts))
                                 serializer.save(client_id=client,
                                                 support_contact=new_support_contact,
                                                 contract_id=contract)
@@ -358,17 +446,42 @@ class EventViewSet(ModelViewSet):
             return Response(f"{client.company_name} sales contact is {client.sales_contact_id}")
         return Response("You do not have rights to update this event")
 
+    @action(detail=False, methods=['post', 'put'])
+    def bulk(self, request):
+        """
+            creates (POST) or updates (PUT) a list of events with the same checks as create and update
+            the events to update are identified by their id
+            valid events are saved, the others are returned in errors with their index in the list
+        """
+        return bulk_response(EventBulkOperation(request.user, request.data), request.method == 'POST')
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+            streams all the events as a csv or ndjson file, see api.export.export_response for the parameters
+            ?from= and ?to= filter on the event date
+        """
+        return export_response(EventExport(), self.get_queryset(), request)
 
-class ComingEventViewSet(ModelViewSet):
+
+class ComingEventViewSet(ConditionalGetMixin, CompiledListMixin, OptimizedQuerysetMixin, ModelViewSet):
     """
         returns all the coming events with the list action
         returns the coming events of a client with the retrieve action
     """
     serializer_class = EventListSerializer
     detail_serializer_class = EventDetailSerializer
-    today = datetime.now(tz=timezone.utc)
-    queryset = Event.objects.filter(event_date__gte=today)
+    queryset = Event.objects.all()
     lookup_field = 'client_id'
+    pagination_class = EventPagination
+    cache_timeout = COMING_EVENT_BUCKET
+    conditional_models = (Contract, Client, User)
+
+    def get_queryset(self):
+        """
+            the coming events are evaluated on each request, from the start of the current minute
+        """
+        return upcoming_events(super().get_queryset(), now=current_bucket())
 
     def get_serializer_class(self):
         """
@@ -392,86 +505,256 @@ class ComingEventViewSet(ModelViewSet):
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    def get_cached_data(self, request, build):
+        """
+            the response data is cached for the current minute,
+            the key changes as soon as an event, contract, client or user is modified
+        """
+        key = f"{current_bucket().timestamp()}:{get_versions(Event, Contract, Client, User)}:" \
+              f"{request.build_absolute_uri()}"
+        key = 'comingevent:' + md5(key.encode()).hexdigest()
+        data = cache.get(key)
+        if data is None:
+            data = build()
+            cache.set(key, data, self.cache_timeout)
+        return data
+
+    def get_conditional_queryset(self):
+        if self.action == 'retrieve':
+            return self.get_queryset().filter(client_id__company_name=self.kwargs['client_id'])
+        return self.get_queryset()
+
+    @conditional
+    def list(self, request):
+        build = super().list
+        return Response(self.get_cached_data(request, lambda: build(request).data))
+
+    @conditional
     def retrieve(self, request, client_id):
-        client = get_object_or_404(Client, company_name=client_id)
-        events = self.queryset.filter(client_id=client)
-        serializer = EventDetailSerializer(events, many=True)
-        return Response(serializer.data)
+        def build():
+            client = get_object_or_404(Client, company_name=client_id)
+            events = self.get_queryset().filter(client_id=client)
+            return self.get_serializer(events, many=True).data
+        return Response(self.get_cached_data(request, build))
 
 
-class MissingClientSales(APIView, PaginationHandlerMixin):
+class MissingClientSales(ConditionalGetMixin, APIView, PaginationHandlerMixin):
     """
         returns all clients which do not have sales contact assigned
     """
     permission_classes = [IsAuthenticated, IsManager]
-    pagination_class = BasicPagination
+    pagination_class = ClientPagination
+
+    def get_queryset(self):
+        return Client.objects.filter(sales_contact_id__isnull=True)
 
+    @conditional
     def get(self, request):
-        clients = Client.objects.filter(sales_contact_id__isnull=True)
-        if not clients:
+        clients = self.get_queryset()
+        if not clients.exists():
             return Response("All clients have a sales contact")
         page = self.paginate_queryset(clients)
-        if page is not None:
-            serializer = self.get_paginated_response(ClientListSerializer(page, many=True).data)
-        else:
-            serializer = ClientListSerializer(clients, many=True)
+        if page is None:
+            return StreamingJSONResponse(clients, ClientListSerializer)
+        serializer = self.get_paginated_response(ClientListSerializer(page, many=True).data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class MissingEventSupport(APIView, PaginationHandlerMixin):
+class MissingEventSupport(ConditionalGetMixin, APIView, PaginationHandlerMixin):
     """
         returns all events which does not have a support contact
     """
     permission_classes = [IsAuthenticated, IsManager]
-    pagination_class = BasicPagination
+    pagination_class = EventPagination
+    conditional_models = (Contract, Client, User)
 
+    def get_queryset(self):
+        return Event.objects.filter(support_contact__isnull=True)
+
+    @conditional
     def get(self, request):
-        events = Event.objects.filter(support_contact__isnull=True)
-        if not events:
+        events = optimize_queryset(self.get_queryset(), EventListSerializer)
+        if not events.exists():
             return Response("All events have a support contact")
         page = self.paginate_queryset(events)
-        if page is not None:
-            serializer = self.get_paginated_response(EventListSerializer(page, many=True).data)
-        else:
-            serializer = EventListSerializer(events, many=True)
+        if page is None:
+            return StreamingJSONResponse(events, EventListSerializer)
+        serializer = self.get_paginated_response(EventListSerializer(page, many=True).data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class PotentialClients(APIView, PaginationHandlerMixin):
+class AssignSupport(APIView):
+    """
+        assigns a support contact to every upcoming event without one, see epicevent.assignment
+        - dry_run: returns the assignments without saving them
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def post(self, request):
+        dry_run = request.data.get('dry_run', request.query_params.get('dry_run', False))
+        if isinstance(dry_run, str):
+            dry_run = dry_run.lower() in ('1', 'true', 'yes')
+        return Response(assign_support(dry_run=bool(dry_run)), status=status.HTTP_200_OK)
+
+
+class EventConflicts(APIView):
+    """
+        returns the events overlapping a previous event of their support contact, see epicevent.conflicts
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request):
+        return Response(all_conflicts(), status=status.HTTP_200_OK)
+
+
+class PotentialClients(ConditionalGetMixin, APIView, PaginationHandlerMixin):
     """
         returns all clients which have not signed a contract
     """
     permission_classes = [IsAuthenticated, IsSales]
-    pagination_class = BasicPagination
+    pagination_class = ClientPagination
+    conditional_models = (Contract,)
 
+    def get_queryset(self):
+        return potential_clients()
+
+    @conditional
     def get(self, request):
-        contracts = list(Contract.objects.filter(status=True))
-        signed_clients = [contract.client_id.id for contract in contracts]
-        clients = Client.objects.exclude(id__in=signed_clients)
-        if not clients:
+        clients = self.get_queryset()
+        if not clients.exists():
             return Response("All clients have signed a contract")
         page = self.paginate_queryset(clients)
-        if page is not None:
-            serializer = self.get_paginated_response(ClientListSerializer(page, many=True).data)
-        else:
-            serializer = ClientListSerializer(clients, many=True)
+        if page is None:
+            return StreamingJSONResponse(clients, ClientListSerializer)
+        serializer = self.get_paginated_response(ClientListSerializer(page, many=True).data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class SupportEvents(APIView, PaginationHandlerMixin):
+class SupportEvents(ConditionalGetMixin, APIView, PaginationHandlerMixin):
     """
         returns the list of events assigned to the support contact who makes the request
     """
     permission_classes = [IsAuthenticated, IsSupport]
-    pagination_class = BasicPagination
+    pagination_class = EventPagination
+    conditional_models = (Contract, Client, User)
+
+    def get_queryset(self):
+        return Event.objects.filter(support_contact=self.request.user)
 
+    @conditional
     def get(self, request):
-        events = list(Event.objects.filter(support_contact=request.user))
-        if not events:
+        events = optimize_queryset(self.get_queryset(), EventListSerializer)
+        if not events.exists():
             return Response("You do not have any event assigned to you")
         page = self.paginate_queryset(events)
-        if page is not None:
-            serializer = self.get_paginated_response(EventListSerializer(page, many=True).data)
-        else:
-            serializer = EventListSerializer(events, many=True)
+        if page is None:
+            return StreamingJSONResponse(events, EventListSerializer)
+        serializer = self.get_paginated_response(EventListSerializer(page, many=True).data)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CalendarFeedUrl(APIView):
+    """
+        returns the url of the iCalendar feed of the user: the events assigned to the user and,
+        for a sales contact, the upcoming events of the user's clients
+        POST replaces the token of the url, the previous url stops working
+    """
+    permission_classes = [IsAuthenticated]
+
+    def response(self, request, feed):
+        url = request.build_absolute_uri(reverse('calendar-feed', args=[feed.token]))
+        return Response({'url': url}, status=status.HTTP_200_OK)
+
+    def get(self, request):
+        return self.response(request, get_feed(request.user))
+
+    def post(self, request):
+        return self.response(request, get_feed(request.user, reset=True))
+
+
+class Changes(APIView):
+    """
+        returns the creations, updates and deletions of clients, contracts and events in the order they were made
+        - ?since=: cursor of the last change already received, 0 (default) to start from the first change
+        - ?limit=: number of changes per page
+        the next link continues after the last change returned, poll it to keep a copy of the tables in sync
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request):
+        since = request.query_params.get('since', '0')
+        try:
+            position = decode_cursor(since)
+        except CursorError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = _positive_int(request.query_params['limit'], strict=True, cutoff=CHANGES_MAX_PAGE_SIZE)
+        except (KeyError, ValueError):
+            limit = CHANGES_PAGE_SIZE
+        changes = changes_since(position, limit)
+        cursor = changes[-1]['cursor'] if changes else since
+        return Response({'next': replace_query_param(request.build_absolute_uri(), 'since', cursor),
+                         'more': len(changes) == limit,
+                         'results': changes}, status=status.HTTP_200_OK)
+
+
+class Search(APIView):
+    """
+        returns the clients (names, contacts and emails) and the events (notes) matching ?q=, best first:
+        rows starting with the search term, then rows with similar words
+        - ?type=client or ?type=event: search only one type
+        - ?limit=: number of results
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response("q: a search term is expected", status=status.HTTP_400_BAD_REQUEST)
+        search_type = request.query_params.get('type')
+        if search_type is not None and search_type not in SEARCH_FIELDS:
+            return Response(f"type: {search_type} is not one of {', '.join(SEARCH_FIELDS)}",
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = _positive_int(request.query_params['limit'], strict=True, cutoff=SEARCH_MAX_LIMIT)
+        except (KeyError, ValueError):
+            limit = SEARCH_LIMIT
+        types = (search_type,) if search_type else tuple(SEARCH_FIELDS)
+        return Response({'results': search(query, types, limit)}, status=status.HTTP_200_OK)
+
+
+class Report(APIView):
+    """
+        returns a report computed from the rollup tables, whatever the number of contracts and events:
+        - contracts: number and amount of the signed and unsigned contracts
+        - sales: the same totals for each sales contact
+        - months: the same totals by month of creation
+        - payments: the same totals by month of payment, from the current month
+        - support: number of events and attendees of each support contact
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request, name):
+        if name not in REPORTS:
+            raise Http404(f"{name} is not one of {', '.join(REPORTS)}")
+        return Response(REPORTS[name](), status=status.HTTP_200_OK)
+
+
+class Forecast(APIView):
+    """
+        returns the receivables projected from the payment dates of the contracts, see epicevent.forecast
+        - ?weeks=: number of coming weeks of the weekly projection
+        - ?months=: number of coming months of the monthly projection
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request):
+        periods = {}
+        for name, default in (('weeks', FORECAST_WEEKS), ('months', FORECAST_MONTHS)):
+            try:
+                periods[name] = _positive_int(request.query_params[name], strict=True, cutoff=FORECAST_MAX_PERIODS)
+            except KeyError:
+                periods[name] = default
+            except ValueError:
+                return Response(f"{name}: a positive number is expected", status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_forecast(**periods), status=status.HTTP_200_OK)
@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from authentication.models import User
 from epicevent.models import Client, Event, Contract
+from epicevent.queries import upcoming_events, potential_clients, signed_contract_exists, coming_event_count
+from django.db.models import Prefetch
 from django.urls import reverse
 from django.utils.html import format_html
-from datetime import datetime
 from django.utils.http import urlencode
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -12,6 +14,10 @@ from dateutil.relativedelta import *
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from authentication.permissions import IsSales, IsManager, IsSupport
+from authentication.roles import has_role
+from epicevent.export import ClientExport, ContractExport, EventExport
+from epicevent.search import SEARCH_MAX_LIMIT, search_ids
+from epicevent.conflicts import find_conflicts, conflict_message
 
 
 # Register your models here.
@@ -35,20 +41,18 @@ class ComingEvent(admin.SimpleListFilter):
         )
 
     def queryset(self, request, queryset):
-        today = datetime.now(tz=timezone.utc)
+        today = timezone.now()
         one_month = today + relativedelta(months=+1)
         three_months = today + relativedelta(months=+3)
 
         if self.value() == '<1M':
-            return queryset.filter(event_date__gte=today,
-                                   event_date__lte=one_month)
+            return upcoming_events(queryset, now=today, until=one_month)
 
         if self.value() == '<3M':
-            return queryset.filter(event_date__gte=today,
-                                   event_date__lte=three_months)
+            return upcoming_events(queryset, now=today, until=three_months)
 
         if self.value() == 'future_events':
-            return queryset.filter(event_date__gte=today)
+            return upcoming_events(queryset, now=today)
 
 
 class ClientContract(admin.SimpleListFilter):
@@ -69,14 +73,11 @@ class ClientContract(admin.SimpleListFilter):
         )
 
     def queryset(self, request, queryset):
-        contracts = list(Contract.objects.filter(status=True))
-        signed_clients = [contract.client_id.id for contract in contracts]
-
         if self.value() == 'Yes':
-            return queryset.filter(id__in=signed_clients)
+            return queryset.filter(signed_contract_exists())
 
         if self.value() == 'No':
-            return queryset.exclude(id__in=signed_clients)
+            return potential_clients(queryset)
 
 
 class SupportEvents(admin.SimpleListFilter):
@@ -101,6 +102,21 @@ class SupportEvents(admin.SimpleListFilter):
             return queryset
 
 
+def export_actions(export_class):
+    """
+        builds the admin actions streaming the selected rows as csv, gzipped csv and ndjson
+    """
+    actions = []
+    for export_type, compress, label in (('csv', False, 'CSV'), ('csv', True, 'gzipped CSV'),
+                                         ('ndjson', False, 'NDJSON')):
+        def export(modeladmin, request, queryset, export_type=export_type, compress=compress):
+            return export_class().response(queryset, export_type, compress)
+        export.__name__ = f"export_{export_type}{'_gzip' if compress else ''}"
+        export.short_description = f"Export selected rows as {label}"
+        actions.append(export)
+    return actions
+
+
 class UserCreationAdminForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
@@ -113,6 +129,44 @@ class UserChangeAdminForm(UserChangeForm):
         fields = UserChangeForm.Meta.fields
 
 
+class AutocompleteSelect(forms.Select):
+    """
+        select filled by an autocomplete endpoint: only the selected option is rendered,
+        forward is the id of a select whose value is sent as ?<name>= (client:id_client)
+    """
+    def __init__(self, url, forward=None, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+        self.forward = forward
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['class'] = (attrs.get('class', '') + ' crm-autocomplete').strip()
+        attrs['data-url'] = str(self.url)
+        attrs.setdefault('style', 'width:200px')
+        if self.forward:
+            attrs['data-forward'] = self.forward
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [str(item) for item in value if item not in ('', None)]
+        options = [self.create_option(name, '', '---------', not selected, 0)]
+        if selected:
+            field = self.choices.field
+            for index, instance in enumerate(field.queryset.filter(pk__in=selected), 1):
+                options.append(self.create_option(name, instance.pk, field.label_from_instance(instance), True, index))
+        return [(None, options, 0)]
+
+    @property
+    def media(self):
+        extra = '' if settings.DEBUG else '.min'
+        return forms.Media(
+            js=(f'admin/js/vendor/jquery/jquery{extra}.js', f'admin/js/vendor/select2/select2.full{extra}.js',
+                'admin/js/jquery.init.js', 'js/chained-area.js'),
+            css={'screen': ('admin/css/vendor/select2/select2.css', 'admin/css/autocomplete.css')},
+        )
+
+
 class ClientAdminForm(forms.ModelForm):
     """
         filter sales contact to get user only from sales group
@@ -125,13 +179,15 @@ class ClientAdminForm(forms.ModelForm):
         super(ClientAdminForm, self).__init__(*args, **kwargs)
 
         users = User.objects.filter(groups__name="sales")
-        self.fields['sales_contact_id'] = forms.ModelChoiceField(queryset=users, required=False)
+        self.fields['sales_contact_id'] = forms.ModelChoiceField(
+            queryset=users, required=False,
+            widget=AutocompleteSelect(reverse('autocomplete-users') + '?group=sales'))
 
 
 class ContractAdminForm(forms.ModelForm):
     """
         Contract form to create/change contracts objects:
-        create a filter to retrieve the sales contact assigned to the client
+        the clients are searched by company name, the sales contact is the one of the selected client
     """
     class Meta(object):
         model = Contract
@@ -140,37 +196,12 @@ class ContractAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(ContractAdminForm, self).__init__(*args, **kwargs)
 
-        try:
-            self.initial['client_id'] = kwargs['instance'].client_id.id
-        except KeyError:
-            pass
-        client_list = [('', '---------')] + [(client.id, client) for client in Client.objects.all()]
-
-        try:
-            self.initial['sales_id'] = kwargs['instance'].sales_contact_id.id
-            sales_init_form = [(sales.id, sales) for sales in
-                               User.objects.filter(username=kwargs['instance'].client_id.sales_contact_id
-                                                   )]
-        except KeyError:
-            sales_init_form = [('', '---------')]
-
-        try:
-            self.fields['client_id'].widget = forms.Select(attrs={'id': 'id_client',
-                                                                  'onchange': 'getSales(this.value)',
-                                                                  'style': 'width:200px'
-                                                                  },
-                                                           choices=client_list,
-                                                           )
-
-            self.fields['sales_contact_id'].widget = \
-                forms.Select(attrs={'id': 'id_sales',
-                                    'style': 'width:200px'
-                                    },
-                             choices=sales_init_form
-                             )
-
-        except KeyError:
-            pass
+        self.fields['client_id'].widget = AutocompleteSelect(reverse('autocomplete-clients'),
+                                                             attrs={'id': 'id_client'})
+        self.fields['client_id'].widget.choices = self.fields['client_id'].choices
+        self.fields['sales_contact_id'].widget = AutocompleteSelect(
+            reverse('autocomplete-users') + '?group=sales', forward='client:id_client', attrs={'id': 'id_sales'})
+        self.fields['sales_contact_id'].widget.choices = self.fields['sales_contact_id'].choices
 
 
 class EventAdminForm(forms.ModelForm):
@@ -188,43 +219,27 @@ class EventAdminForm(forms.ModelForm):
         contract = cleaned_data['contract_id']
         if contract.status is False:
             raise forms.ValidationError("Contract is not signed")
+        support_contact = cleaned_data.get('support_contact')
+        if support_contact and cleaned_data.get('event_date'):
+            conflicts = find_conflicts(support_contact, cleaned_data['event_date'], cleaned_data.get('duration'),
+                                       exclude=self.instance.pk)
+            if conflicts:
+                raise forms.ValidationError(conflict_message(support_contact, conflicts))
         return cleaned_data
 
     def __init__(self, *args, **kwargs):
         super(EventAdminForm, self).__init__(*args, **kwargs)
 
         users = User.objects.filter(groups__name="support")
-        self.fields['support_contact'] = forms.ModelChoiceField(queryset=users, required=False)
-        try:
-            self.initial['client_id'] = kwargs['instance'].client_id.id
-        except KeyError:
-            pass
-        client_list = [('', '---------')] + [(client.id, client) for client in Client.objects.all()]
-
-        try:
-            self.initial['contract_id'] = kwargs['instance'].contract_id.id
-            contract_init_form = [(contract.id, contract) for contract in Contract.objects.filter(
-                client_id=kwargs['instance'].client_id
-            )]
-        except KeyError:
-            contract_init_form = [('', '---------')]
-
-        try:
-            self.fields['client_id'].widget = forms.Select(attrs={'id': 'id_client',
-                                                                  'onchange': 'getContracts(this.value)',
-                                                                  'style': 'width:200px'
-                                                                  },
-                                                           choices=client_list,
-                                                           )
-
-            self.fields['contract_id'].widget = forms.Select(attrs={
-                'id': 'id_contract',
-                'style': 'width:200px'
-                },
-                choices=contract_init_form
-            )
-        except KeyError:
-            pass
+        self.fields['support_contact'] = forms.ModelChoiceField(
+            queryset=users, required=False,
+            widget=AutocompleteSelect(reverse('autocomplete-users') + '?group=support'))
+        self.fields['client_id'].widget = AutocompleteSelect(reverse('autocomplete-clients'),
+                                                             attrs={'id': 'id_client'})
+        self.fields['client_id'].widget.choices = self.fields['client_id'].choices
+        self.fields['contract_id'].widget = AutocompleteSelect(
+            reverse('autocomplete-contracts'), forward='client:id_client', attrs={'id': 'id_contract'})
+        self.fields['contract_id'].widget.choices = self.fields['contract_id'].choices
 
 
 @admin.register(User)
@@ -256,12 +271,29 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
     form = ClientAdminForm
+    actions = export_actions(ClientExport)
     fields = ("company_name", "last_name", "first_name", "email", "phone", "mobile", "sales_contact_id")
     list_display = ("company_name", "last_name", "first_name", "email", "phone", "sales_contact_id",
                     "view_coming_event_link")
     search_fields = ("company_name__startswith", "last_name__startswith",)
     list_filter = ("sales_contact_id", ClientContract)
 
+    def get_queryset(self, request):
+        """
+            joins the sales contact and counts the coming events of each client in the same query
+        """
+        queryset = super().get_queryset(request).select_related('sales_contact_id')
+        return queryset.annotate(coming_event_count=coming_event_count())
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+            prefix search on search_fields, completed by the clients with similar names, contacts or emails
+        """
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=search_ids('client', search_term, SEARCH_MAX_LIMIT))
+        return results, may_have_duplicates
+
     def has_change_permission(self, request, *obj):
         """
             update is allowed only if user is assigned to manager group
@@ -271,7 +303,7 @@ class ClientAdmin(admin.ModelAdmin):
             if obj[0] is not None:
                 if request.user == obj[0].sales_contact_id:
                     return True
-        if request.user.groups.filter(name='manager').exists():
+        if has_role(request.user, 'manager'):
             return True
         if request.user.is_superuser:
             return True
@@ -281,15 +313,13 @@ class ClientAdmin(admin.ModelAdmin):
         """
             create url to get the list of coming event for a client
         """
-        today = datetime.now(tz=timezone.utc)
-        coming_event = Event.objects.filter(client_id=obj).filter(event_date__gte=today)
-        count = coming_event.count()
+        count = obj.coming_event_count
         url = (reverse("admin:epicevent_event_changelist")
                + "?"
                + urlencode({"client_id": obj.id}, True)
                + "&agenda=future_events"
                )
-        if not coming_event:
+        if not count:
             return "No"
         return format_html('<a href="{}">{} Event(s)</a>', url, count)
 
@@ -299,15 +329,27 @@ class ClientAdmin(admin.ModelAdmin):
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     form = EventAdminForm
+    actions = export_actions(EventExport)
     list_display = ("id", "client_id", "event_date", "support_contact", "view_client_link",
                     "client_phone", "client_email", "view_contract_link", "contract_sales")
     search_fields = ("client_id__company_name__startswith",)
     list_filter = ("client_id__company_name", ComingEvent, SupportEvents)
 
-    class Media:
-        js = (
-            'js/chained-area.js',
-        )
+    def get_queryset(self, request):
+        """
+            joins the client, the support contact and the contract with its client and sales contact
+        """
+        return super().get_queryset(request).select_related(
+            'client_id', 'support_contact', 'contract_id__client_id', 'contract_id__sales_contact_id')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+            prefix search on the company name of the client, completed by the events with similar words in their notes
+        """
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=search_ids('event', search_term, SEARCH_MAX_LIMIT))
+        return results, may_have_duplicates
 
     def has_change_permission(self, request, *obj):
         """
@@ -323,7 +365,7 @@ class EventAdmin(admin.ModelAdmin):
             if obj[0] is not None:
                 if request.user == obj[0].support_contact:
                     return True
-        if request.user.groups.filter(name='manager').exists():
+        if has_role(request.user, 'manager'):
             return True
         if request.user.is_superuser:
             return True
@@ -346,8 +388,7 @@ class EventAdmin(admin.ModelAdmin):
         """
             display the sales contact of the contract
         """
-        contract = Contract.objects.get(id=obj.contract_id.id)
-        return contract.sales_contact_id
+        return obj.contract_id.sales_contact_id
 
     contract_sales.short_description = "Sales Contact"
 
@@ -386,14 +427,17 @@ class EventAdmin(admin.ModelAdmin):
 @admin.register(Contract)
 class ContractAdmin(admin.ModelAdmin):
     form = ContractAdminForm
+    actions = export_actions(ContractExport)
     list_display = ("id", "view_client_link", "status", "sales_contact_id", "related_event")
     search_fields = ("client_id__company_name__startswith",)
     list_filter = ("client_id__company_name", "sales_contact_id")
 
-    class Media:
-        js = (
-            'js/chained-area.js',
-        )
+    def get_queryset(self, request):
+        """
+            joins the client and the sales contact, the events of the page are loaded with one more query
+        """
+        events = Prefetch('event_contract', queryset=Event.objects.select_related('client_id'))
+        return super().get_queryset(request).select_related('client_id', 'sales_contact_id').prefetch_related(events)
 
     def has_change_permission(self, request, *obj):
         """
@@ -404,7 +448,7 @@ class ContractAdmin(admin.ModelAdmin):
             if obj[0] is not None:
                 if request.user == obj[0].sales_contact_id:
                     return True
-        if request.user.groups.filter(name='manager').exists():
+        if has_role(request.user, 'manager'):
             return True
         if request.user.is_superuser:
             return True
@@ -427,7 +471,10 @@ class ContractAdmin(admin.ModelAdmin):
         """
             show the event related to the contract
         """
-        event = Event.objects.get(contract_id=obj.id)
+        events = obj.event_contract.all()
+        if not events:
+            return None
+        event = events[0]
         url = (reverse("admin:epicevent_event_changelist")
                + "?"
                + urlencode({"id": event.id}, True)
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# replaces 0002_auto_20220303_1909 on the databases which have not applied it: the permissions the groups are given
+# are only created by post_migrate, after every migration, so a fresh database has none of them yet
+GROUP_PERMISSIONS = {
+    'manager': ['add_user', 'change_user', 'delete_user', 'view_user', 'change_client', 'view_client',
+                'change_event', 'view_event', 'change_contract', 'view_contract'],
+    'sales': ['add_client', 'change_client', 'view_client', 'add_event', 'change_event', 'view_event',
+              'add_contract', 'change_contract', 'view_contract'],
+    'support': ['view_client', 'change_event', 'view_event', 'view_contract'],
+}
+MODELS = {'user': 'authentication', 'client': 'epicevent', 'contract': 'epicevent', 'event': 'epicevent'}
+
+
+def create_groups(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+
+    permissions = {}
+    for model, app_label in MODELS.items():
+        content_type, _ = ContentType.objects.get_or_create(app_label=app_label, model=model)
+        for action in ('add', 'change', 'delete', 'view'):
+            permissions[f'{action}_{model}'], _ = Permission.objects.get_or_create(
+                codename=f'{action}_{model}', content_type=content_type,
+                defaults={'name': f'Can {action} {model}'})
+
+    for name, codenames in GROUP_PERMISSIONS.items():
+        group, _ = Group.objects.get_or_create(name=name)
+        group.permissions.set([permissions[codename] for codename in codenames])
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('authentication', '0002_auto_20220303_1909'),
+    ]
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('epicevent', '0001_initial'),
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_groups)
+    ]
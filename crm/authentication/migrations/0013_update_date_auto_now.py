@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0012_alter_user_join_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -14,7 +14,7 @@ class User(AbstractUser):
     join_date = models.DateField(blank=True, null=True)
     is_staff = models.BooleanField(default=True)
     creation_date = models.DateTimeField(auto_now_add=True)
-    update_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
     groups = models.ManyToManyField(Group, related_name='groups', blank=True)
 
     objects = MyAccountManager()
@@ -1,17 +1,18 @@
 from rest_framework.permissions import BasePermission
+from .roles import has_role
 
 
 class IsManager(BasePermission):
 
     def has_permission(self, request, view):
-        if request.user.groups.filter(name='manager').exists():
+        if has_role(request.user, 'manager'):
             return True
         if request.user.is_superuser:
             return True
         return False
 
     def has_object_permission(self, request, view, obj):
-        if request.user.groups.filter(name='manager').exists():
+        if has_role(request.user, 'manager'):
             return True
         if request.user.is_superuser:
             return True
@@ -21,14 +22,14 @@ class IsManager(BasePermission):
 class IsSales(BasePermission):
 
     def has_permission(self, request, view):
-        if request.user.groups.filter(name='sales').exists():
+        if has_role(request.user, 'sales'):
             return True
         if request.user.is_superuser:
             return True
         return False
 
     def has_object_permission(self, request, view, obj):
-        if request.user.groups.filter(name='sales').exists():
+        if has_role(request.user, 'sales'):
             return True
         if request.user.is_superuser:
             return True
@@ -38,14 +39,14 @@ class IsSales(BasePermission):
 class IsSupport(BasePermission):
 
     def has_permission(self, request, view):
-        if request.user.groups.filter(name='support').exists():
+        if has_role(request.user, 'support'):
             return True
         if request.user.is_superuser:
             return True
         return False
 
     def has_object_permission(self, request, view, obj):
-        if request.user.groups.filter(name='support').exists():
+        if has_role(request.user, 'support'):
             return True
         if request.user.is_superuser:
             return True
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from .models import User
+
+ROLE_CACHE_TIMEOUT = 60
+
+
+def _cache_key(user_id):
+    return f"roles:{user_id}"
+
+
+def get_roles(user):
+    """
+        returns the set of group names of a user
+        the names are loaded once per user instance (so once per request),
+        and shared between requests through a short-lived cache keyed by user id
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_role_names', None)
+    if roles is None:
+        roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_cache_key(user.pk), roles, ROLE_CACHE_TIMEOUT)
+        user._role_names = roles
+    return roles
+
+
+def has_role(user, role):
+    """
+        checks if the user is assigned to the group named role
+    """
+    return role in get_roles(user)
+
+
+def invalidate_roles(user_ids):
+    """
+        removes the cached group names of the users
+    """
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def prefetch_roles(users):
+    """
+        loads the group names of several users with a single query
+    """
+    users = [user for user in users if getattr(user, '_role_names', None) is None]
+    if not users:
+        return
+    roles = {user.pk: set() for user in users}
+    memberships = User.groups.through.objects.filter(user_id__in=roles).values_list('user_id', 'group__name')
+    for user_id, name in memberships:
+        roles[user_id].add(name)
+    for user in users:
+        user._role_names = frozenset(roles[user.pk])
+    cache.set_many({_cache_key(user.pk): user._role_names for user in users}, ROLE_CACHE_TIMEOUT)
@@ -0,0 +1,31 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from .models import User
+from .roles import invalidate_roles
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        drop the cached roles when the groups of a user are modified
+        - forward: user.groups.add(...) -> instance is the user
+        - reverse: group.groups.add(...) -> pk_set contains the users
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_roles([instance.pk])
+    elif pk_set:
+        invalidate_roles(pk_set)
+    else:
+        invalidate_roles(instance.groups.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """
+        a renamed or deleted group changes the roles of all its members
+    """
+    invalidate_roles(instance.groups.values_list('id', flat=True))
@@ -1,3 +1,136 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from api.tests import create_dataset
+from epicevent.models import Client, Contract, Event
+from epicevent.search import clear_ngram_indexes
+from .models import User
+from .roles import get_roles, has_role, prefetch_roles
 
-# Create your tests here.
+ADMIN_QUERY_BUDGET = 10
+
+
+class AdminChangelistQueryTests(TestCase):
+    """
+        the changelists load what they display with joins, annotations and prefetches:
+        the number of queries does not depend on the number of rows and stays under the budget
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(40)
+        User.objects.create_superuser(username='admin', email='admin@epic.com', password='password')
+        Contract.objects.create(amount=100, client_id=Client.objects.first(),
+                                sales_contact_id=User.objects.get(username='sales'))
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(username='admin'))
+
+    def count_queries(self, url):
+        cache.clear()
+        clear_ngram_indexes()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def assertQueryBudget(self, url):
+        queries, response = self.count_queries(url)
+        self.assertLessEqual(queries, ADMIN_QUERY_BUDGET, f'{url} issues {queries} queries')
+        Client.objects.filter(pk__in=Client.objects.order_by('-pk').values('pk')[:30]).delete()
+        fewer, _ = self.count_queries(url)
+        self.assertEqual(queries, fewer, f'{url} issues {queries} queries for 40 rows and {fewer} for 10 rows')
+        return response
+
+    def test_client_changelist(self):
+        response = self.assertQueryBudget('/admin/epicevent/client/')
+        self.assertContains(response, '1 Event(s)')
+
+    def test_contract_changelist(self):
+        response = self.assertQueryBudget('/admin/epicevent/contract/')
+        self.assertContains(response, 'company0_1_')
+
+    def test_client_search(self):
+        Client.objects.filter(company_name='company7').update(last_name='Dubois')
+        response = self.assertQueryBudget('/admin/epicevent/client/?q=duboi')
+        self.assertContains(response, 'company7')
+        self.assertContains(response, '1 result')
+
+    def test_event_changelist(self):
+        response = self.assertQueryBudget('/admin/epicevent/event/')
+        self.assertContains(response, 'client0@company.com')
+
+
+class RoleTests(TestCase):
+    """
+        the group names of a user are read at most once per request and shared between requests through the cache
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales, cls.support = create_dataset(2)
+
+    def setUp(self):
+        cache.clear()
+
+    def role_queries(self, context):
+        return [query for query in context.captured_queries if 'authentication_user_groups' in query['sql']]
+
+    def test_has_role(self):
+        user = User.objects.get(pk=self.sales.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(user, 'sales'))
+            self.assertFalse(has_role(user, 'manager'))
+        # shared by the next requests through the cache
+        fresh = User.objects.get(pk=self.sales.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(fresh, 'sales'))
+        self.assertEqual(get_roles(None), frozenset())
+
+    def test_prefetch_roles(self):
+        users = list(User.objects.filter(pk__in=[self.sales.pk, self.support.pk]).order_by('pk'))
+        with self.assertNumQueries(1):
+            prefetch_roles(users)
+        with self.assertNumQueries(0):
+            self.assertEqual([get_roles(user) for user in users], [{'sales'}, {'support'}])
+            prefetch_roles(users)
+        fresh = User.objects.get(pk=self.support.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(fresh, 'support'))
+
+    def test_groups_changed(self):
+        manager = Group.objects.get(name='manager')
+        has_role(User.objects.get(pk=self.sales.pk), 'sales')
+        self.sales.groups.add(manager)
+        self.assertTrue(has_role(User.objects.get(pk=self.sales.pk), 'manager'))
+        manager.groups.remove(self.sales)
+        self.assertFalse(has_role(User.objects.get(pk=self.sales.pk), 'manager'))
+        manager.groups.add(self.support)
+        self.assertTrue(has_role(User.objects.get(pk=self.support.pk), 'manager'))
+        self.support.groups.clear()
+        self.assertEqual(get_roles(User.objects.get(pk=self.support.pk)), frozenset())
+
+    def test_group_changed(self):
+        group = Group.objects.get(name='sales')
+        self.assertTrue(has_role(User.objects.get(pk=self.sales.pk), 'sales'))
+        group.name = 'sellers'
+        group.save()
+        self.assertEqual(get_roles(User.objects.get(pk=self.sales.pk)), {'sellers'})
+        group.delete()
+        self.assertEqual(get_roles(User.objects.get(pk=self.sales.pk)), frozenset())
+
+    def test_event_update(self):
+        event = Event.objects.filter(support_contact__isnull=True).get()
+        item = {'attendees': 20, 'event_date': event.event_date.isoformat(), 'notes': '', 'support_contact': ''}
+        # the second request reads the roles from the cache and leaves the rollups unchanged
+        for queries, role_queries in ((15, 1), (13, 0)):
+            api = APIClient()
+            api.force_authenticate(user=User.objects.get(pk=self.sales.pk))
+            with CaptureQueriesContext(connection) as context:
+                response = api.put(f'/api/event/{event.pk}/', item, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(context.captured_queries), queries)
+            self.assertEqual(len(self.role_queries(context)), role_queries)
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +93,33 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# roles, coming events and model versions are cached: use a shared backend (redis, memcached)
+# when running several worker processes
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# serialized representations of the client, contract and event details (api.cache),
+# api.cache.DjangoCacheBackend stores them in CACHES instead of a per-process LRU
+# the versions validating the entries are kept in the default cache: with several workers it has to be shared
+# (memcached, redis), the local-memory cache is per process and the workers would miss each other's writes
+REPRESENTATION_CACHE = {
+    'BACKEND': 'api.cache.LRUBackend',
+    'OPTIONS': {
+        'max_entries': 10000,
+        'ttl': 300,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -179,5 +207,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'api': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
-}
\ No newline at end of file
+}
+
+# Requests over these budgets are logged with their SQL statements by api.middleware.MetricsMiddleware
+METRICS_QUERY_BUDGET = 50
+METRICS_LATENCY_BUDGET = 1
+# Addresses allowed to read /metrics/ without a staff session
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
\ No newline at end of file
@@ -16,9 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from epicevent.views import contract_list, sales_contact_list
+from epicevent.views import contract_list, sales_contact_list, client_autocomplete, contract_autocomplete, \
+    user_autocomplete, calendar_feed
 from api.views import LoginUser, UsersViewSet, ClientViewSet, ContractViewSet, EventViewSet, \
-    MissingClientSales, MissingEventSupport, PotentialClients, ComingEventViewSet, SupportEvents
+    MissingClientSales, MissingEventSupport, PotentialClients, ComingEventViewSet, SupportEvents, Changes, Search, \
+    Report, Forecast, AssignSupport, EventConflicts, CalendarFeedUrl
+from api.metrics import metrics_view
 from rest_framework.routers import SimpleRouter
 
 router = SimpleRouter()
@@ -31,12 +34,24 @@ router.register('comingevent', ComingEventViewSet)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics/', metrics_view),
     path('api/login/', LoginUser.as_view()),
     path('get/contracts/<client_id>/', contract_list),
     path('get/sales/<client_id>/', sales_contact_list),
+    path('autocomplete/clients/', client_autocomplete, name='autocomplete-clients'),
+    path('autocomplete/contracts/', contract_autocomplete, name='autocomplete-contracts'),
+    path('autocomplete/users/', user_autocomplete, name='autocomplete-users'),
     path('api/client/nosales/', MissingClientSales.as_view()),
     path('api/client/potential/', PotentialClients.as_view()),
     path('api/event/nosupport/', MissingEventSupport.as_view()),
+    path('api/event/nosupport/assign/', AssignSupport.as_view()),
+    path('api/event/conflicts/', EventConflicts.as_view()),
     path('api/event/supportevent/', SupportEvents.as_view()),
+    path('api/changes/', Changes.as_view()),
+    path('api/calendar/', CalendarFeedUrl.as_view()),
+    path('calendar/<str:token>.ics', calendar_feed, name='calendar-feed'),
+    path('api/search/', Search.as_view()),
+    path('api/reports/<name>/', Report.as_view()),
+    path('api/forecast/', Forecast.as_view()),
     path('api/', include(router.urls)),
 ]
@@ -0,0 +1,113 @@
+import heapq
+from django.db import transaction
+from django.utils import timezone
+from authentication.models import User
+from .conflicts import period
+from .intervals import IntervalIndex
+from .models import MAX_EVENT_DURATION, Event
+from .signals import post_bulk_save, pre_bulk_save
+
+SUPPORT_GROUP = 'support'
+
+
+class SupportLoad(object):
+    """
+        upcoming events of a support contact: count and attendees for the balancing,
+        dates in an interval index for the conflicts
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.events = 0
+        self.attendees = 0
+        self.dates = IntervalIndex()
+
+    def key(self):
+        return self.events, self.attendees, self.user.pk
+
+    def add(self, event_date, duration, attendees, now):
+        self.dates.add(*period(event_date, duration))
+        if event_date >= now:
+            self.events += 1
+            self.attendees += attendees or 0
+
+    def is_free(self, event_date, duration):
+        return self.dates.is_free(*period(event_date, duration))
+
+
+def support_loads(now):
+    """
+        returns {pk: SupportLoad} of the active support contacts from their upcoming events, with two queries
+    """
+    users = User.objects.filter(groups__name=SUPPORT_GROUP, is_active=True).distinct().order_by('pk')
+    loads = {user.pk: SupportLoad(user) for user in users}
+    # the events started before now and still running are conflicts too
+    rows = Event.objects.filter(support_contact__in=list(loads), event_date__gt=now - MAX_EVENT_DURATION) \
+        .order_by().values_list('support_contact_id', 'event_date', 'duration', 'attendees')
+    for support_contact, event_date, duration, attendees in rows.iterator(chunk_size=5000):
+        loads[support_contact].add(event_date, duration, attendees, now)
+    return loads
+
+
+def plan_assignment(events, loads, now):
+    """
+        assigns each event to the least loaded support contact (fewest upcoming events, then attendees)
+        free at its date, the biggest events first
+        returns the [(event, load)] assigned and the events without free support contact
+    """
+    heap = [load.key() for load in loads.values()]
+    heapq.heapify(heap)
+    assigned, unassigned = [], []
+    for event in sorted(events, key=lambda event: (-(event.attendees or 0), event.event_date, event.pk)):
+        busy = []
+        load = None
+        while heap:
+            candidate = loads[heapq.heappop(heap)[2]]
+            if candidate.is_free(event.event_date, event.duration):
+                load = candidate
+                break
+            busy.append(candidate)
+        if load is None:
+            unassigned.append(event)
+        else:
+            load.add(event.event_date, event.duration, event.attendees, now)
+            assigned.append((event, load))
+            heapq.heappush(heap, load.key())
+        for candidate in busy:
+            heapq.heappush(heap, candidate.key())
+    return assigned, unassigned
+
+
+def assign_support(dry_run=False, now=None):
+    """
+        assigns a support contact to every upcoming event without one, saved with a single bulk_update
+        with dry_run the plan is returned without saving anything
+        returns {'assigned': [...], 'unassigned': [...], 'loads': [...]}
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = Event.objects.filter(support_contact__isnull=True, event_date__gte=now)
+        if not dry_run:
+            events = events.select_for_update()
+        events = list(events)
+        loads = support_loads(now)
+        assigned, unassigned = plan_assignment(events, loads, now)
+        if assigned and not dry_run:
+            # bulk_update does not run the auto_now of update_date
+            for event, load in assigned:
+                event.support_contact = load.user
+                event.update_date = now
+            instances = [event for event, _ in assigned]
+            pre_bulk_save.send(sender=Event, instances=instances, created=False)
+            Event.objects.bulk_update(instances, ['support_contact', 'update_date'], batch_size=1000)
+            post_bulk_save.send(sender=Event, instances=instances, created=False)
+    return {
+        'dry_run': dry_run,
+        'assigned': [{'event': event.pk, 'event_date': event.event_date, 'attendees': event.attendees,
+                      'support_contact': load.user.pk, 'username': load.user.username}
+                     for event, load in sorted(assigned, key=lambda item: (item[0].event_date, item[0].pk))],
+        'unassigned': [{'event': event.pk, 'event_date': event.event_date, 'attendees': event.attendees}
+                       for event in sorted(unassigned, key=lambda event: (event.event_date, event.pk))],
+        'loads': [{'support_contact': load.user.pk, 'username': load.user.username,
+                   'events': load.events, 'attendees': load.attendees} for load in loads.values()],
+    }
@@ -0,0 +1,110 @@
+import secrets
+from datetime import timedelta, timezone as dt_timezone
+from hashlib import md5
+from django.db.models import F, Q
+from django.utils import timezone
+from .conflicts import end_date
+from .models import CalendarFeed, Client, Event
+
+# past events of a support contact kept in the feed, the sales contacts only get the upcoming events of their clients
+FEED_HISTORY = timedelta(days=30)
+PRODID = '-//Epic Events//CRM//EN'
+
+
+def feed_events(user_id, now=None):
+    """
+        events of the feed of a user: the events assigned to the user and the upcoming events of the user's clients
+    """
+    now = now or timezone.now()
+    return Event.objects.filter(Q(support_contact=user_id, event_date__gte=now - FEED_HISTORY)
+                                | Q(client_id__sales_contact_id=user_id, event_date__gte=now))
+
+
+def mark_feeds_stale(model, pks):
+    """
+        increments with one update the version of the feeds including the events (model Event) or clients (model
+        Client) of the pks: the feeds of their support contacts and of the sales contacts of their clients
+    """
+    if model is Event:
+        events = Event.objects.filter(pk__in=pks)
+        sales_contacts = events.values('client_id__sales_contact_id')
+    else:
+        events = Event.objects.filter(client_id__in=pks)
+        sales_contacts = Client.objects.filter(pk__in=pks).values('sales_contact_id')
+    CalendarFeed.objects.filter(Q(user__in=events.values('support_contact')) | Q(user__in=sales_contacts)) \
+        .update(version=F('version') + 1)
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def fold(line):
+    """
+        splits a content line in lines of 75 octets at most, the next ones starting with a space (RFC 5545 3.1)
+    """
+    if len(line.encode()) <= 75:
+        return line
+    lines, current, size = [], '', 0
+    for char in line:
+        length = len(char.encode())
+        if size + length > 75:
+            lines.append(current)
+            current, size = ' ', 1
+        current += char
+        size += length
+    lines.append(current)
+    return '\r\n'.join(lines)
+
+
+def utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_calendar(user, now=None):
+    """
+        returns the VCALENDAR of the feed events of the user, read with a single values_list query
+    """
+    rows = feed_events(user.pk, now).order_by('event_date', 'id').values_list(
+        'pk', 'event_date', 'duration', 'update_date', 'attendees', 'notes', 'contract_id', 'support_contact_id',
+        'client_id__company_name')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+             f'X-WR-CALNAME:{escape(f"Epic Events - {user.username}")}']
+    for pk, event_date, duration, update_date, attendees, notes, contract_id, support_contact, company_name in rows:
+        description = f'Contract {contract_id}' + (f'\n{notes}' if notes else '')
+        lines += ['BEGIN:VEVENT', f'UID:event-{pk}@epicevents', f'DTSTAMP:{utc(update_date)}',
+                  f'DTSTART:{utc(event_date)}', f'DTEND:{utc(end_date(event_date, duration))}',
+                  f'SUMMARY:{escape(f"{company_name} ({attendees} attendees)")}',
+                  f'DESCRIPTION:{escape(description)}',
+                  f"CATEGORIES:{'SUPPORT' if support_contact == user.pk else 'SALES'}", 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ''.join(f'{fold(line)}\r\n' for line in lines)
+
+
+def refresh_feed(feed, now=None):
+    """
+        renders and saves the payload of the feed when one of its events or clients changed since the last rendering,
+        or on a new day for the events entering or leaving the feed window
+        the version read with the feed is saved: a write made during the rendering leaves the feed stale
+    """
+    now = now or timezone.now()
+    if feed.rendered_version != feed.version or feed.last_modified is None \
+            or timezone.localdate(feed.last_modified) != timezone.localdate(now):
+        feed.payload = render_calendar(feed.user, now)
+        feed.rendered_version = feed.version
+        feed.etag = md5(feed.payload.encode()).hexdigest()
+        feed.last_modified = now
+        feed.save(update_fields=['payload', 'rendered_version', 'etag', 'last_modified'])
+    return feed
+
+
+def get_feed(user, reset=False):
+    """
+        returns the feed of the user, created with a new token on first use, reset replaces the token
+    """
+    feed, created = CalendarFeed.objects.get_or_create(user=user, defaults={'token': secrets.token_urlsafe(32)})
+    if reset and not created:
+        feed.token = secrets.token_urlsafe(32)
+        feed.save(update_fields=['token'])
+    return feed
@@ -0,0 +1,94 @@
+import re
+from datetime import timedelta
+from django.db import connections
+from django.db.models import BigIntegerField, Func, Q
+from django.db.models.expressions import RawSQL
+from django.utils.duration import duration_string
+from .export import ClientExport, ContractExport, EventExport
+from .models import Change, Client, Contract, Event
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# models logged in Change by model_name, with the export defining the columns of their rows in the feed
+TRACKED_MODELS = {
+    'client': (Client, ClientExport),
+    'contract': (Contract, ContractExport),
+    'event': (Event, EventExport),
+}
+
+
+class CursorError(ValueError):
+    pass
+
+
+def is_postgresql():
+    return connections[Change.objects.db].vendor == 'postgresql'
+
+
+def record_changes(model, instances, action):
+    """
+        logs the action on the instances with one insert, with the id of the writing transaction on postgresql
+    """
+    name = model._meta.model_name
+    if name in TRACKED_MODELS:
+        transaction_id = Func(function='txid_current', output_field=BigIntegerField()) if is_postgresql() else 0
+        Change.objects.bulk_create([Change(model=name, object_id=instance.pk, action=action,
+                                           transaction_id=transaction_id)
+                                    for instance in instances if instance.pk is not None])
+
+
+def encode_cursor(change):
+    return f'{change.transaction_id}-{change.id}'
+
+
+def decode_cursor(cursor):
+    """
+        returns the (transaction_id, id) of a cursor, 0 starts from the first change
+    """
+    if cursor == '0':
+        return 0, 0
+    match = re.fullmatch(r'(\d+)-(\d+)', cursor)
+    if match is None:
+        raise CursorError(f"since: {cursor} is not a cursor")
+    return int(match.group(1)), int(match.group(2))
+
+
+def get_rows(name, ids):
+    """
+        returns the current rows of the ids by id, with the columns of the export of the model,
+        the durations as [days] hh:mm:ss like the serializers
+    """
+    model, export_class = TRACKED_MODELS[name]
+    export = export_class()
+    return {row[0]: {header: duration_string(value) if isinstance(value, timedelta) else value
+                     for header, value in zip(export.headers, row)}
+            for row in export.rows(model.objects.filter(pk__in=ids))}
+
+
+def changes_since(since, limit=CHANGES_PAGE_SIZE):
+    """
+        returns the limit changes following the cursor since (transaction_id, id) in the order they were committed,
+        with the current row of the objects created or updated (None if it has been deleted since)
+        on postgresql only the changes of the transactions below the xmin of the snapshot are returned:
+        these transactions are over and the ones still running, or starting later, have a larger id,
+        so no change can be committed behind a cursor already returned however long its transaction runs
+        the other databases serialize their writes, the order of the ids is the order of the commits
+    """
+    transaction_id, change_id = since
+    changes = Change.objects.filter(Q(transaction_id__gt=transaction_id) |
+                                    Q(transaction_id=transaction_id, id__gt=change_id))
+    if is_postgresql():
+        changes = changes.filter(transaction_id__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+    changes = list(changes.order_by('transaction_id', 'id')[:limit])
+    rows = {}
+    for name in TRACKED_MODELS:
+        ids = {change.object_id for change in changes if change.model == name and change.action != Change.DELETED}
+        rows[name] = get_rows(name, ids) if ids else {}
+    return [{'cursor': encode_cursor(change),
+             'model': change.model,
+             'id': change.object_id,
+             'action': change.action,
+             'date': change.date,
+             'data': rows[change.model].get(change.object_id) if change.action != Change.DELETED else None}
+            for change in changes]
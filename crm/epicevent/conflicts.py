@@ -0,0 +1,107 @@
+from collections import defaultdict
+from django.db.models import Q
+from authentication.models import User
+from .intervals import IntervalIndex
+from .models import POINT_EVENT_DURATION, MAX_EVENT_DURATION, Event
+
+
+def period(event_date, duration=None):
+    """
+        returns the half-open period [start, end) of an event,
+        an event without duration only takes the instant of its date
+    """
+    return event_date, event_date + (duration or POINT_EVENT_DURATION)
+
+
+def end_date(event_date, duration=None):
+    """
+        returns the end of an event as displayed, its date when it has no duration
+    """
+    return event_date + duration if duration else event_date
+
+
+def window(start, end):
+    """
+        filter of the events overlapping [start, end) served by the (support_contact, event_date) index:
+        they start before end and, their duration being bounded, after start - MAX_EVENT_DURATION
+        their end is then checked in python
+    """
+    return Q(event_date__gt=start - MAX_EVENT_DURATION, event_date__lt=end)
+
+
+def find_conflicts(support_contact, event_date, duration=None, exclude=None):
+    """
+        returns the (start, end, pk) of the events of the support contact overlapping the period, with one query
+        - exclude: pk of the event being updated
+    """
+    start, end = period(event_date, duration)
+    rows = Event.objects.filter(window(start, end), support_contact=support_contact).order_by()
+    if exclude is not None:
+        rows = rows.exclude(pk=exclude)
+    conflicts = []
+    for pk, other_date, other_duration in rows.values_list('pk', 'event_date', 'duration'):
+        other_start, other_end = period(other_date, other_duration)
+        if other_end > start:
+            conflicts.append((other_start, other_end, pk))
+    return sorted(conflicts)
+
+
+def conflict_message(support_contact, conflicts):
+    start, end, pk = conflicts[0]
+    event = f"event {pk}" if pk is not None else "another event"
+    return f"{support_contact} is already assigned to {event} from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}"
+
+
+class SupportCalendar(object):
+    """
+        interval index of the events of each support contact, loaded with one query for a range of dates:
+        checks the assignments of many events, the later ones being added to the index as they are accepted
+    """
+
+    def __init__(self, support_contacts, start, end):
+        self.indexes = {pk: IntervalIndex() for pk in support_contacts}
+        if not self.indexes or start is None:
+            return
+        rows = Event.objects.filter(window(start, end), support_contact__in=list(self.indexes)).order_by() \
+            .values_list('pk', 'support_contact_id', 'event_date', 'duration')
+        intervals = defaultdict(list)
+        for pk, support_contact, event_date, duration in rows.iterator(chunk_size=5000):
+            intervals[support_contact].append((*period(event_date, duration), pk))
+        for support_contact, items in intervals.items():
+            self.indexes[support_contact].extend(items)
+
+    def add(self, support_contact, pk, event_date, duration=None):
+        self.indexes.setdefault(support_contact, IntervalIndex()).add(*period(event_date, duration), pk)
+
+    def remove(self, support_contact, pk, event_date, duration=None):
+        if support_contact in self.indexes:
+            self.indexes[support_contact].remove(*period(event_date, duration), pk)
+
+    def conflicts(self, support_contact, event_date, duration=None, exclude=None):
+        index = self.indexes.get(support_contact)
+        if index is None:
+            return []
+        return [interval for interval in index.overlaps(*period(event_date, duration))
+                if exclude is None or interval[2] != exclude]
+
+
+def all_conflicts():
+    """
+        returns the overlapping events of each support contact in a single pass over the events sorted by date:
+        each event is compared with the previous events of its support contact still running at its start
+        [{'support_contact', 'username', 'event', 'event_date', 'end_date', 'conflicts_with': [pk]}]
+    """
+    rows = Event.objects.filter(support_contact__isnull=False).order_by('event_date', 'id') \
+        .values_list('pk', 'support_contact_id', 'event_date', 'duration')
+    calendar = SupportCalendar((), None, None)
+    conflicts = []
+    for pk, support_contact, event_date, duration in rows.iterator(chunk_size=5000):
+        overlaps = calendar.conflicts(support_contact, event_date, duration)
+        if overlaps:
+            conflicts.append({'support_contact': support_contact, 'event': pk, 'event_date': event_date,
+                              'end_date': end_date(event_date, duration),
+                              'conflicts_with': [other for _, _, other in overlaps]})
+        calendar.add(support_contact, pk, event_date, duration)
+    usernames = dict(User.objects.filter(pk__in={row['support_contact'] for row in conflicts})
+                     .values_list('pk', 'username'))
+    return [{**row, 'username': usernames.get(row['support_contact'])} for row in conflicts]
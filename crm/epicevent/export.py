@@ -0,0 +1,199 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.duration import duration_string
+
+EXPORT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class Echo(object):
+    """
+        file-like object returning what is written, lets csv.writer build one line at a time
+    """
+
+    def write(self, value):
+        return value
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return duration_string(value)
+    return value
+
+
+def _parse_bound(value, name):
+    """
+        parses a date or datetime query parameter, a date stands for midnight of that day
+    """
+    try:
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else None
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        return timezone.make_aware(datetime.combine(day, time.min)), True
+    if parsed is None:
+        raise ExportError(f"{name}: {value} is not a date")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, False
+
+
+class Export(object):
+    """
+        Streams the rows of a queryset as CSV or NDJSON:
+        - the rows are read with values_list and a server-side cursor (iterator), no model is instantiated
+        - lines are yielded by chunks, the memory used does not depend on the number of rows
+        - filters: from / to on date_field (to is inclusive for a date), sales_contact_id on sales_contact_field
+    """
+    name = None
+    columns = ()
+    date_field = 'creation_date'
+    sales_contact_field = 'sales_contact_id'
+
+    def __init__(self):
+        self.chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def filter(self, queryset, params):
+        """
+            applies the from, to and sales_contact_id query parameters
+        """
+        if params.get('from'):
+            start, _ = _parse_bound(params['from'], 'from')
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start})
+        if params.get('to'):
+            end, is_day = _parse_bound(params['to'], 'to')
+            if is_day:
+                queryset = queryset.filter(**{f'{self.date_field}__lt': end + timedelta(days=1)})
+            else:
+                queryset = queryset.filter(**{f'{self.date_field}__lte': end})
+        if params.get('sales_contact_id'):
+            if not str(params['sales_contact_id']).isdigit():
+                raise ExportError(f"sales_contact_id: {params['sales_contact_id']} is not an id")
+            queryset = queryset.filter(**{self.sales_contact_field: int(params['sales_contact_id'])})
+        return queryset
+
+    def rows(self, queryset):
+        lookups = [lookup for _, lookup in self.columns]
+        rows = queryset.select_related(None).prefetch_related(None).order_by('pk').values_list(*lookups)
+        return rows.iterator(chunk_size=self.chunk_size)
+
+    def format_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.headers)
+        for row in rows:
+            yield writer.writerow([_encode_value(value) for value in row])
+
+    def format_ndjson(self, rows):
+        headers = self.headers
+        for row in rows:
+            yield json.dumps(dict(zip(headers, map(_encode_value, row)))) + '\n'
+
+    def lines(self, queryset, export_type):
+        """
+            yields the file by chunks of chunk_size lines
+        """
+        buffer = []
+        for line in getattr(self, f'format_{export_type}')(self.rows(queryset)):
+            buffer.append(line)
+            if len(buffer) >= self.chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    def compress(self, chunks):
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def response(self, queryset, export_type='csv', compress=False):
+        """
+            returns a streaming response with the file of the rows, gzipped when compress is set
+        """
+        if export_type not in EXPORT_TYPES:
+            raise ExportError(f"type: {export_type} is not one of {', '.join(EXPORT_TYPES)}")
+        chunks = self.lines(queryset, export_type)
+        filename = f"{self.name}-{timezone.now():%Y%m%d-%H%M%S}.{export_type}"
+        if compress:
+            response = StreamingHttpResponse(self.compress(chunks), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse((chunk.encode() for chunk in chunks),
+                                             content_type=EXPORT_TYPES[export_type])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ClientExport(Export):
+    name = 'clients'
+    columns = (
+        ('id', 'id'),
+        ('company_name', 'company_name'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('mobile', 'mobile'),
+        ('sales_contact_id', 'sales_contact_id'),
+        ('sales_contact', 'sales_contact_id__username'),
+        ('creation_date', 'creation_date'),
+        ('update_date', 'update_date'),
+    )
+
+
+class ContractExport(Export):
+    name = 'contracts'
+    columns = (
+        ('id', 'id'),
+        ('status', 'status'),
+        ('amount', 'amount'),
+        ('payment_due', 'payment_due'),
+        ('client_id', 'client_id'),
+        ('company_name', 'client_id__company_name'),
+        ('sales_contact_id', 'sales_contact_id'),
+        ('sales_contact', 'sales_contact_id__username'),
+        ('creation_date', 'creation_date'),
+        ('update_date', 'update_date'),
+    )
+
+
+class EventExport(Export):
+    name = 'events'
+    date_field = 'event_date'
+    sales_contact_field = 'client_id__sales_contact_id'
+    columns = (
+        ('id', 'id'),
+        ('event_date', 'event_date'),
+        ('duration', 'duration'),
+        ('attendees', 'attendees'),
+        ('notes', 'notes'),
+        ('client_id', 'client_id'),
+        ('company_name', 'client_id__company_name'),
+        ('contract_id', 'contract_id'),
+        ('support_contact_id', 'support_contact'),
+        ('support_contact', 'support_contact__username'),
+        ('creation_date', 'creation_date'),
+        ('update_date', 'update_date'),
+    )
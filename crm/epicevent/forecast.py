@@ -0,0 +1,156 @@
+from datetime import timedelta
+from hashlib import md5
+from itertools import islice
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from authentication.models import User
+from .models import Contract
+from .versions import get_versions
+
+FORECAST_WEEKS = 12
+FORECAST_MONTHS = 12
+FORECAST_MAX_PERIODS = 104
+# lower bounds of the ageing buckets in days past the payment date
+AGEING_BUCKETS = (('current', None), ('1-30', 1), ('31-60', 31), ('61-90', 61), ('90+', 91))
+
+
+class ContractColumns(object):
+    """
+        amount, payment_due, status and sales_contact_id of the contracts as numpy arrays,
+        read with values_list by chunks of FORECAST_CHUNK_SIZE rows
+        a missing payment_due is NaT
+    """
+
+    def __init__(self, amount, due, status, sales):
+        self.amount = amount
+        self.due = due
+        self.status = status
+        self.sales = sales
+
+    @classmethod
+    def load(cls, queryset=None, chunk_size=None):
+        queryset = Contract.objects.all() if queryset is None else queryset
+        chunk_size = chunk_size or getattr(settings, 'FORECAST_CHUNK_SIZE', 50000)
+        rows = queryset.order_by().values_list('amount', 'payment_due', 'status', 'sales_contact_id')
+        rows = rows.iterator(chunk_size=chunk_size)
+        chunks = []
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            amount, due, status, sales = zip(*chunk)
+            chunks.append((np.array(amount, dtype=np.float64), np.array(due, dtype='datetime64[D]'),
+                           np.array(status, dtype=bool), np.array(sales, dtype=np.int64)))
+        if not chunks:
+            return cls(np.empty(0, np.float64), np.empty(0, 'datetime64[D]'), np.empty(0, bool), np.empty(0, np.int64))
+        return cls(*(np.concatenate(column) for column in zip(*chunks)))
+
+
+def _totals(index, amount, size):
+    """
+        sums the amounts by index (0 <= index < size), ignoring the other indexes
+    """
+    mask = (index >= 0) & (index < size)
+    return np.bincount(index[mask], weights=amount[mask], minlength=size)
+
+
+def _round(values):
+    return [round(value, 2) for value in values.tolist()]
+
+
+class Forecast(object):
+    """
+        Receivables projected from the payment dates of the contracts, computed with vectorized group-bys:
+        - weekly / monthly: amounts of the signed and unsigned contracts due in each coming week / month
+        - ageing: signed contracts by number of days past their payment date
+        - sales: totals of each sales contact
+        the contracts without payment date are only counted in undated
+    """
+
+    def __init__(self, columns, today):
+        self.columns = columns
+        self.today = np.datetime64(today, 'D')
+
+    def projection(self, offsets, periods):
+        """
+            returns the signed and unsigned amounts by period from the period offsets of the payment dates
+        """
+        columns = self.columns
+        offsets = np.where(np.isnat(columns.due), -1, offsets)
+        signed = _totals(offsets[columns.status], columns.amount[columns.status], periods)
+        unsigned = _totals(offsets[~columns.status], columns.amount[~columns.status], periods)
+        return signed, unsigned
+
+    def weekly(self, weeks=FORECAST_WEEKS):
+        # weeks start on monday, numpy day 0 (1970-01-01) is a thursday
+        start = self.today - (self.today.astype(np.int64) + 3) % 7
+        offsets = ((self.columns.due - start).astype(np.int64) // 7)
+        signed, unsigned = self.projection(offsets, weeks)
+        weeks = start + np.arange(weeks) * 7
+        return [{'week': week, 'signed': amount, 'unsigned': pipeline}
+                for week, amount, pipeline in zip(weeks.tolist(), _round(signed), _round(unsigned))]
+
+    def monthly(self, months=FORECAST_MONTHS):
+        start = self.today.astype('datetime64[M]')
+        offsets = (self.columns.due.astype('datetime64[M]') - start).astype(np.int64)
+        signed, unsigned = self.projection(offsets, months)
+        months = (start + np.arange(months)).astype('datetime64[D]')
+        return [{'month': month, 'signed': amount, 'unsigned': pipeline}
+                for month, amount, pipeline in zip(months.tolist(), _round(signed), _round(unsigned))]
+
+    def ageing(self):
+        columns = self.columns
+        mask = columns.status & ~np.isnat(columns.due)
+        late = (self.today - columns.due[mask]).astype(np.int64)
+        buckets = np.digitize(late, [bound for _, bound in AGEING_BUCKETS[1:]])
+        counts = np.bincount(buckets, minlength=len(AGEING_BUCKETS))
+        amounts = np.bincount(buckets, weights=columns.amount[mask], minlength=len(AGEING_BUCKETS))
+        return [{'bucket': name, 'count': count, 'amount': amount}
+                for (name, _), count, amount in zip(AGEING_BUCKETS, counts.tolist(), _round(amounts))]
+
+    def sales(self):
+        columns = self.columns
+        sales, index = np.unique(columns.sales, return_inverse=True)
+        dated = ~np.isnat(columns.due)
+        overdue = columns.status & dated
+        overdue[dated] &= columns.due[dated] < self.today
+        totals = {
+            'signed': np.bincount(index, weights=columns.amount * columns.status, minlength=len(sales)),
+            'unsigned': np.bincount(index, weights=columns.amount * ~columns.status, minlength=len(sales)),
+            'overdue': np.bincount(index, weights=columns.amount * overdue, minlength=len(sales)),
+        }
+        totals = {name: _round(values) for name, values in totals.items()}
+        usernames = dict(User.objects.filter(pk__in=sales.tolist()).values_list('pk', 'username'))
+        return [{'sales_contact': pk, 'username': usernames.get(pk),
+                 **{name: values[position] for name, values in totals.items()}}
+                for position, pk in enumerate(sales.tolist())]
+
+    def undated(self):
+        mask = np.isnat(self.columns.due)
+        return {'count': int(mask.sum()), 'amount': round(float(self.columns.amount[mask].sum()), 2)}
+
+    def report(self, weeks=FORECAST_WEEKS, months=FORECAST_MONTHS):
+        return {
+            'date': self.today.tolist(),
+            'weekly': self.weekly(weeks),
+            'monthly': self.monthly(months),
+            'ageing': self.ageing(),
+            'sales': self.sales(),
+            'undated': self.undated(),
+        }
+
+
+def get_forecast(weeks=FORECAST_WEEKS, months=FORECAST_MONTHS, today=None):
+    """
+        returns the forecast report of the day, cached until a contract or a user changes
+    """
+    today = today or timezone.localdate()
+    key = f"{today}:{weeks}:{months}:{get_versions(Contract, User)}"
+    key = 'forecast:' + md5(key.encode()).hexdigest()
+    report = cache.get(key)
+    if report is None:
+        report = Forecast(ContractColumns.load(), today).report(weeks, months)
+        cache.set(key, report, int(timedelta(days=1).total_seconds()))
+    return report
@@ -0,0 +1,66 @@
+from bisect import bisect_left, bisect_right
+
+
+class IntervalIndex(object):
+    """
+        in-memory index of half-open intervals [start, end) sorted by start:
+        an interval overlapping [start, end) starts before end and after start - longest,
+        longest being the length of the longest interval of the index, so a lookup only scans this range
+    """
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.intervals = []
+        self.longest = None
+        self.extend(intervals)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def add(self, start, end, value=None):
+        """
+            inserts one interval in order, an interval starting after the others is appended
+        """
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.intervals.insert(position, (start, end, value))
+        if self.longest is None or end - start > self.longest:
+            self.longest = end - start
+
+    def extend(self, intervals):
+        """
+            adds many intervals with a single sort instead of one insertion each
+        """
+        intervals = list(intervals)
+        if not intervals:
+            return
+        self.intervals.extend(intervals)
+        self.intervals.sort(key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in self.intervals]
+        longest = max(end - start for start, end, _ in intervals)
+        if self.longest is None or longest > self.longest:
+            self.longest = longest
+
+    def remove(self, start, end, value=None):
+        """
+            removes one interval (start, end, value), the longest length is kept as an upper bound
+        """
+        for position in range(bisect_left(self.starts, start), bisect_right(self.starts, start)):
+            if self.intervals[position] == (start, end, value):
+                del self.starts[position]
+                del self.intervals[position]
+                return
+
+    def _candidates(self, start, end):
+        if not self.intervals:
+            return []
+        return self.intervals[bisect_right(self.starts, start - self.longest):bisect_left(self.starts, end)]
+
+    def overlaps(self, start, end):
+        """
+            returns the (start, end, value) of the intervals overlapping [start, end)
+        """
+        return [interval for interval in self._candidates(start, end) if interval[1] > start]
+
+    def is_free(self, start, end):
+        return not any(interval[1] > start for interval in self._candidates(start, end))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from epicevent.assignment import assign_support
+
+
+class Command(BaseCommand):
+    """
+        Assigns the upcoming events without support contact to the support group (epicevent.assignment),
+        --dry-run prints the plan without saving it
+    """
+    help = 'Assigns a support contact to the upcoming events without one, balancing the load of the support group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='print the assignments without saving them')
+
+    def handle(self, *args, **options):
+        result = assign_support(dry_run=options['dry_run'])
+        for row in result['assigned']:
+            self.stdout.write(f"event {row['event']} on {row['event_date']:%Y-%m-%d %H:%M} "
+                              f"({row['attendees']} attendees) -> {row['username']}")
+        for row in result['unassigned']:
+            self.stdout.write(self.style.WARNING(
+                f"event {row['event']} on {row['event_date']:%Y-%m-%d %H:%M}: no support contact available"))
+        self.stdout.write(self.style.MIGRATE_HEADING('\nUpcoming load'))
+        for row in result['loads']:
+            self.stdout.write(f"{row['username']:>24}{row['events']:>10} events{row['attendees']:>10} attendees")
+        verb = 'would be assigned' if result['dry_run'] else 'assigned'
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{len(result['assigned'])} events {verb}, {len(result['unassigned'])} without support contact"))
@@ -0,0 +1,36 @@
+import json
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from epicevent.forecast import FORECAST_WEEKS, FORECAST_MONTHS, get_forecast
+
+
+class Command(BaseCommand):
+    """
+        Prints the receivables projected from the payment dates of the contracts (epicevent.forecast),
+        as tables or as json with --json
+    """
+    help = 'Prints the weekly and monthly receivables, the ageing of the payments and the totals by sales contact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=FORECAST_WEEKS, help='number of coming weeks')
+        parser.add_argument('--months', type=int, default=FORECAST_MONTHS, help='number of coming months')
+        parser.add_argument('--json', action='store_true', help='print the report as json')
+
+    def handle(self, *args, **options):
+        report = get_forecast(options['weeks'], options['months'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, cls=DjangoJSONEncoder, indent=2))
+            return
+        self.stdout.write(f"Receivables on {report['date']}")
+        self.table('Weekly', report['weekly'], ('week', 'signed', 'unsigned'))
+        self.table('Monthly', report['monthly'], ('month', 'signed', 'unsigned'))
+        self.table('Ageing of signed contracts', report['ageing'], ('bucket', 'count', 'amount'))
+        self.table('Sales contacts', report['sales'], ('username', 'signed', 'unsigned', 'overdue'))
+        self.stdout.write(f"\nWithout payment date: {report['undated']['count']} contracts, "
+                          f"{report['undated']['amount']}")
+
+    def table(self, title, rows, columns):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{title}"))
+        self.stdout.write(''.join(f'{column:>16}' for column in columns))
+        for row in rows:
+            self.stdout.write(''.join(f'{str(row[column]):>16}' for column in columns))
@@ -0,0 +1,447 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+from time import perf_counter
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.duration import duration_string
+from authentication.models import User
+from epicevent.models import Client, Contract, Event
+from epicevent.rollups import rebuild_rollups
+from epicevent.signals import post_bulk_save
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def copy_value(value):
+    """
+        durations are copied as [days] hh:mm:ss, the input format of postgresql intervals
+    """
+    if isinstance(value, timedelta):
+        return duration_string(value)
+    return value
+
+
+def open_file(path):
+    """
+        opens a csv or ndjson file, gzipped when its name ends with .gz
+        returns the file and its type
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        file_type = 'csv'
+    elif name.endswith(('.ndjson', '.jsonl', '.json')):
+        file_type = 'ndjson'
+    else:
+        raise CommandError(f"{path}: unknown file type, expected .csv or .ndjson (optionally .gz)")
+    opener = gzip.open if path.endswith('.gz') else open
+    return opener(path, 'rt', newline='', encoding='utf-8'), file_type
+
+
+def read_rows(path):
+    """
+        yields (line number, row as a dict or the reason why the line cannot be read)
+    """
+    file, file_type = open_file(path)
+    with file:
+        if file_type == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    yield line_number, f"invalid json: {error}"
+                    continue
+                yield line_number, row if isinstance(row, dict) else "a json object is expected"
+
+
+class Importer(object):
+    """
+        Imports the rows of a file by chunks:
+        - parse() checks a row and returns the values of fields, references are resolved by set-based queries per chunk
+        - on postgresql, the chunk is copied (COPY) into a temporary table, then upserted with a single
+          INSERT ... ON CONFLICT (key_fields) DO UPDATE
+        - on other databases, the chunk is written with bulk_create and bulk_update
+    """
+    model = None
+    label = None
+    fields = ()
+    key_fields = ()
+    update_fields = ()
+    returned_fields = ('id',)
+
+    def __init__(self, command):
+        self.command = command
+        self.seen = set()
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def staging_table(self):
+        return f'import_{self.table}'
+
+    def column(self, name):
+        return self.model._meta.get_field(name).column
+
+    def clean(self, name, value):
+        if value == '':
+            value = None
+        try:
+            value = self.model._meta.get_field(name).clean(value, None)
+        except ValidationError as error:
+            raise RejectedRow(f"{name}: {' '.join(error.messages)}")
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def prepare(self, rows):
+        """
+            loads what is needed to parse the rows of a chunk
+        """
+
+    def parse(self, row):
+        raise NotImplementedError
+
+    def check_duplicate(self, values):
+        key = tuple(values[name] for name in self.key_fields)
+        if None not in key:
+            if key in self.seen:
+                raise RejectedRow(f"duplicate {', '.join(self.key_fields)} in the file")
+            self.seen.add(key)
+
+    def parse_chunk(self, chunk):
+        """
+            returns the parsed rows with their line number, and the rejected ones with the reason
+        """
+        readable = [(line, row) for line, row in chunk if isinstance(row, dict)]
+        rejects = [(line, row, None) for line, row in chunk if not isinstance(row, dict)]
+        self.prepare([row for _, row in readable])
+        parsed = []
+        for line, row in readable:
+            try:
+                values = self.parse(row)
+                self.check_duplicate(values)
+            except RejectedRow as error:
+                rejects.append((line, str(error), row))
+                continue
+            parsed.append((line, values))
+        return parsed, rejects
+
+    def write(self, rows, now):
+        if connection.vendor == 'postgresql':
+            returned = self.write_postgresql(rows, now)
+            # COPY does not build instances, receivers only get the returned fields
+            return [self.model(**dict(zip(self.returned_fields, values))) for values in returned]
+        return self.write_fallback(rows, now)
+
+    def create_staging_table(self, cursor):
+        columns = ', '.join(f'{self.column(name)} {self.model._meta.get_field(name).rel_db_type(connection)}'
+                            for name in self.fields)
+        cursor.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS {self.staging_table} ({columns}) '
+                       f'ON COMMIT DELETE ROWS')
+
+    def merge_statements(self):
+        """
+            returns the statements moving the rows of the staging table to the table,
+            each one returning the returned_fields of the rows
+        """
+        columns = ', '.join(self.column(name) for name in self.fields)
+        updates = ', '.join(f'{self.column(name)} = EXCLUDED.{self.column(name)}'
+                            for name in self.update_fields + ('update_date',))
+        return [f'INSERT INTO {self.table} ({columns}, creation_date, update_date) '
+                f'SELECT {columns}, %(now)s, %(now)s FROM {self.staging_table} '
+                f'ON CONFLICT ({", ".join(self.column(name) for name in self.key_fields)}) '
+                f'DO UPDATE SET {updates} RETURNING {self.returning}']
+
+    @property
+    def returning(self):
+        return ', '.join(self.column(name) for name in self.returned_fields)
+
+    def write_postgresql(self, rows, now):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for values in rows:
+            writer.writerow([copy_value(values[name]) for name in self.fields])
+        buffer.seek(0)
+        returned = []
+        with connection.cursor() as cursor:
+            self.create_staging_table(cursor)
+            columns = ', '.join(self.column(name) for name in self.fields)
+            cursor.copy_expert(f'COPY {self.staging_table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            for statement in self.merge_statements():
+                cursor.execute(statement, {'now': now})
+                returned += cursor.fetchall()
+        return returned
+
+    def get_existing(self, rows):
+        """
+            returns the rows of the table having the key of a row of the chunk, by key
+        """
+        name = self.key_fields[0]
+        keys = {values[name] for values in rows if values[name] is not None}
+        existing = self.model.objects.filter(**{f'{name}__in': keys})
+        return {tuple(getattr(instance, field) for field in self.key_fields): instance for instance in existing}
+
+    def write_fallback(self, rows, now):
+        existing = self.get_existing(rows)
+        created, updated = [], []
+        for values in rows:
+            instance = existing.get(tuple(values.get(name) for name in self.key_fields))
+            if instance is None:
+                created.append(self.model(**values))
+                continue
+            for name in self.update_fields:
+                setattr(instance, name, values[name])
+            instance.update_date = now
+            updated.append(instance)
+        self.model.objects.bulk_create(created)
+        self.model.objects.bulk_update(updated, self.update_fields + ('update_date',))
+        return created + updated
+
+    def finish(self):
+        """
+            called once the file is imported
+        """
+
+
+class ClientImporter(Importer):
+    model = Client
+    label = 'clients'
+    fields = ('company_name', 'first_name', 'last_name', 'email', 'phone', 'mobile', 'sales_contact_id_id')
+    key_fields = ('company_name',)
+    update_fields = ('first_name', 'last_name', 'email', 'phone', 'mobile', 'sales_contact_id_id')
+
+    def __init__(self, command):
+        super().__init__(command)
+        self.emails = {}
+
+    def prepare(self, rows):
+        emails = {row.get('email') for row in rows if row.get('email')}
+        self.taken_emails = dict(Client.objects.filter(email__in=emails).values_list('email', 'company_name'))
+
+    def parse(self, row):
+        values = {name: self.clean(name, row.get(name)) for name in self.fields[:-1]}
+        values['sales_contact_id_id'] = self.command.get_user(row.get('sales_contact'), 'sales')
+        email = values['email']
+        if email is not None:
+            owner = self.emails.get(email) or self.taken_emails.get(email)
+            if owner is not None and owner != values['company_name']:
+                raise RejectedRow(f"client with this email already exists: {owner}")
+            self.emails[email] = values['company_name']
+        return values
+
+
+class ContractImporter(Importer):
+    """
+        contracts keep the id of the file when there is one, so that the events can reference them,
+        the other contracts get a new id
+    """
+    model = Contract
+    label = 'contracts'
+    fields = ('id', 'status', 'amount', 'payment_due', 'client_id_id', 'sales_contact_id_id')
+    key_fields = ('id',)
+    update_fields = ('status', 'amount', 'payment_due', 'sales_contact_id_id')
+    returned_fields = ('id', 'client_id_id')
+
+    def prepare(self, rows):
+        self.clients = self.command.get_clients(rows)
+        ids = {row['id'] for row in rows if str(row.get('id') or '').isdigit()}
+        self.owners = dict(Contract.objects.filter(id__in=ids).values_list('id', 'client_id'))
+
+    def parse(self, row):
+        values = {name: self.clean(name, row.get(name)) for name in ('amount', 'payment_due')}
+        values['id'] = self.clean('id', row['id']) if row.get('id') not in (None, '') else None
+        status = row.get('status') or False
+        if isinstance(status, str):
+            status = {'true': True, 'false': False}.get(status.lower(), status)
+        values['status'] = self.clean('status', status)
+        client_id, sales_contact_id = self.command.get_client(self.clients, row.get('company_name'))
+        if values['id'] is not None and self.owners.get(values['id'], client_id) != client_id:
+            raise RejectedRow(f"contract {values['id']} belongs to another client")
+        values['client_id_id'] = client_id
+        if row.get('sales_contact'):
+            sales_contact_id = self.command.get_user(row['sales_contact'], 'sales')
+        if sales_contact_id is None:
+            raise RejectedRow(f"{row.get('company_name')} does not have a sales contact")
+        values['sales_contact_id_id'] = sales_contact_id
+        return values
+
+    def merge_statements(self):
+        columns = ', '.join(self.column(name) for name in self.fields[1:])
+        upsert = super().merge_statements()[0].replace('ON CONFLICT', 'WHERE id IS NOT NULL ON CONFLICT')
+        return [upsert,
+                f'INSERT INTO {self.table} ({columns}, creation_date, update_date) '
+                f'SELECT {columns}, %(now)s, %(now)s FROM {self.staging_table} WHERE id IS NULL '
+                f'RETURNING {self.returning}']
+
+    def write_fallback(self, rows, now):
+        for values in rows:
+            if values['id'] is None:
+                del values['id']
+        return super().write_fallback(rows, now)
+
+    def get_existing(self, rows):
+        ids = {values['id'] for values in rows if values.get('id') is not None}
+        return {(contract.id,): contract for contract in Contract.objects.filter(id__in=ids)}
+
+    def finish(self):
+        """
+            moves the id sequence after the ids of the file
+        """
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), [Contract]):
+                cursor.execute(statement)
+
+
+class EventImporter(Importer):
+    """
+        the event of a contract is identified by (client_id, contract_id), the contract has to be signed
+    """
+    model = Event
+    label = 'events'
+    fields = ('client_id_id', 'contract_id_id', 'event_date', 'duration', 'attendees', 'notes', 'support_contact_id')
+    key_fields = ('client_id_id', 'contract_id_id')
+    update_fields = ('event_date', 'duration', 'attendees', 'notes', 'support_contact_id')
+    returned_fields = ('id', 'client_id_id')
+
+    def prepare(self, rows):
+        self.clients = self.command.get_clients(rows)
+        ids = {row['contract_id'] for row in rows if str(row.get('contract_id') or '').isdigit()}
+        self.contracts = {pk: (client_id, status) for pk, client_id, status in
+                          Contract.objects.filter(id__in=ids).values_list('id', 'client_id', 'status')}
+
+    def parse(self, row):
+        values = {name: self.clean(name, row.get(name)) for name in ('event_date', 'duration', 'attendees', 'notes')}
+        client_id, _ = self.command.get_client(self.clients, row.get('company_name'))
+        contract_id = row.get('contract_id')
+        contract = self.contracts.get(int(contract_id)) if str(contract_id or '').isdigit() else None
+        if contract is None:
+            raise RejectedRow(f"contract {contract_id} does not exist")
+        if contract[0] != client_id:
+            raise RejectedRow(f"contract {contract_id} does not belong to {row.get('company_name')}")
+        if contract[1] is not True:
+            raise RejectedRow("Contract is not signed")
+        values['client_id_id'] = client_id
+        values['contract_id_id'] = int(contract_id)
+        values['support_contact_id'] = self.command.get_user(row.get('support_contact'), 'support')
+        return values
+
+    def get_existing(self, rows):
+        ids = {values['contract_id_id'] for values in rows}
+        events = Event.objects.filter(contract_id__in=ids)
+        return {(event.client_id_id, event.contract_id_id): event for event in events}
+
+
+class Command(BaseCommand):
+    """
+        Imports clients, contracts and events from csv or ndjson files (optionally gzipped),
+        with the columns of the export endpoints:
+        - clients: company_name, first_name, last_name, email, phone, mobile, sales_contact (username)
+        - contracts: id, status, amount, payment_due, company_name, sales_contact (defaults to the client's one)
+        - events: company_name, contract_id, event_date, attendees, notes, support_contact (username)
+        Existing clients are updated by company_name, contracts by id and events by (client, contract).
+        Each chunk is written in its own transaction, rejected rows are written to the rejects file.
+    """
+    help = 'Imports clients, contracts and events from csv or ndjson files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', help='file of clients')
+        parser.add_argument('--contracts', help='file of contracts')
+        parser.add_argument('--events', help='file of events')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per chunk')
+        parser.add_argument('--rejects', default='rejects.ndjson', help='file receiving the rejected rows')
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ('clients', 'contracts', 'events')):
+            raise CommandError("At least one of --clients, --contracts and --events is required")
+        self.batch_size = options['batch_size']
+        self.rejects_path = options['rejects']
+        self.rejects_file = None
+        self.users = self.get_users()
+        try:
+            for name, importer_class in (('clients', ClientImporter), ('contracts', ContractImporter),
+                                         ('events', EventImporter)):
+                if options[name]:
+                    self.import_file(importer_class(self), options[name])
+            if options['contracts'] or options['events']:
+                rebuild_rollups()
+        finally:
+            if self.rejects_file is not None:
+                self.rejects_file.close()
+                self.stdout.write(self.style.WARNING(f"Rejected rows written to {self.rejects_path}"))
+
+    def get_users(self):
+        """
+            loads every username with its id and groups with a single query
+        """
+        users = {}
+        for username, pk, group in User.objects.values_list('username', 'id', 'groups__name'):
+            users.setdefault(username, (pk, set()))[1].add(group)
+        return users
+
+    def get_user(self, username, role):
+        if not username:
+            return None
+        pk, groups = self.users.get(username, (None, ()))
+        if pk is None:
+            raise RejectedRow(f"{username} does not exist")
+        if role not in groups:
+            raise RejectedRow(f"{username} is not from {role} team")
+        return pk
+
+    def get_clients(self, rows):
+        """
+            returns the id and sales contact id of the clients of the rows, by company_name
+        """
+        names = {row.get('company_name') for row in rows if row.get('company_name')}
+        clients = Client.objects.filter(company_name__in=names).values_list('company_name', 'id', 'sales_contact_id')
+        return {name: (pk, sales_contact_id) for name, pk, sales_contact_id in clients}
+
+    def get_client(self, clients, company_name):
+        if company_name not in clients:
+            raise RejectedRow(f"client {company_name} does not exist")
+        return clients[company_name]
+
+    def reject(self, path, line, reason, row):
+        if self.rejects_file is None:
+            self.rejects_file = open(self.rejects_path, 'w', encoding='utf-8')
+        self.rejects_file.write(json.dumps({'file': path, 'line': line, 'reason': reason, 'row': row},
+                                           default=str) + '\n')
+
+    def import_file(self, importer, path):
+        rows = read_rows(path)
+        imported = rejected = 0
+        start = perf_counter()
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                parsed, rejects = importer.parse_chunk(chunk)
+                instances = importer.write([values for _, values in parsed], timezone.now()) if parsed else []
+                post_bulk_save.send(sender=importer.model, instances=instances)
+            for line, reason, row in rejects:
+                self.reject(path, line, reason, row)
+            imported += len(parsed)
+            rejected += len(rejects)
+            elapsed = perf_counter() - start
+            self.stdout.write(f"{importer.label}: {imported} rows imported, {rejected} rejected "
+                              f"({imported / elapsed if elapsed else 0:.0f} rows/s)")
+        importer.finish()
+        self.stdout.write(self.style.SUCCESS(f"{path}: {imported} {importer.label} imported, {rejected} rejected "
+                                             f"in {perf_counter() - start:.1f}s"))
@@ -0,0 +1,20 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from epicevent.rollups import ROLLUPS
+
+
+class Command(BaseCommand):
+    """
+        Recomputes the rollup tables of the reports from the contracts and events,
+        they are maintained on each change: a rebuild is only needed after writes bypassing the signals
+        (queryset.update, raw SQL) or to reset the rounding of the float amounts
+    """
+    help = 'Rebuilds the contract and event rollup tables used by the reports'
+
+    def handle(self, *args, **options):
+        for model, rollup in ROLLUPS.items():
+            start = perf_counter()
+            rollup.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"{rollup.rollup_model.objects.count()} {model._meta.verbose_name} totals rebuilt "
+                f"in {perf_counter() - start:.2f}s"))
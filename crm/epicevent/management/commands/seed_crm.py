@@ -0,0 +1,138 @@
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from authentication.models import User
+from epicevent.models import Client, Contract, Event
+from epicevent.signals import post_bulk_save
+
+
+class Command(BaseCommand):
+    """
+        Seeds a synthetic dataset with reproducible distributions:
+        - users split between the manager, sales and support groups
+        - clients assigned to sales contacts with a skewed distribution, a few without sales contact
+        - a variable number of contracts per client, most of them signed
+        - an event for most signed contracts, in the past or in the coming year, some without support contact
+    """
+    help = 'Seeds the database with a synthetic dataset of users, clients, contracts and events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='number of clients')
+        parser.add_argument('--managers', type=int, default=5, help='number of users in the manager group')
+        parser.add_argument('--sales', type=int, default=50, help='number of users in the sales group')
+        parser.add_argument('--support', type=int, default=50, help='number of users in the support group')
+        parser.add_argument('--contracts-per-client', type=float, default=2, help='average contracts per client')
+        parser.add_argument('--signed-ratio', type=float, default=0.7, help='ratio of signed contracts')
+        parser.add_argument('--event-ratio', type=float, default=0.8, help='ratio of signed contracts with an event')
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per insert')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.prefix = f'seed{options["seed"]}_{int(self.now.timestamp())}'
+
+        with transaction.atomic():
+            users = {
+                'manager': self.create_users('manager', options['managers']),
+                'sales': self.create_users('sales', options['sales']),
+                'support': self.create_users('support', options['support']),
+            }
+            clients = self.create_clients(options['clients'], users['sales'])
+            contracts = self.create_contracts(clients, options['contracts_per_client'], options['signed_ratio'])
+            events = self.create_events(contracts, users['support'], options['event_ratio'])
+            post_bulk_save.send(sender=User, instances=sum(users.values(), []), created=True)
+            post_bulk_save.send(sender=Client, instances=clients, created=True)
+            post_bulk_save.send(sender=Contract, instances=contracts, created=True)
+            post_bulk_save.send(sender=Event, instances=events, created=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(len(group) for group in users.values())} users, {len(clients)} clients, '
+            f'{len(contracts)} contracts and {len(events)} events created'))
+
+    def create_users(self, group_name, count):
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{group_name}{i}_{self.prefix}'[:30],
+                 email=f'{group_name}{i}_{self.prefix}@epicevents.com',
+                 last_name=f'{group_name.capitalize()}{i}',
+                 first_name=self.rng.choice(FIRST_NAMES),
+                 password=password)
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        if len(users) and users[0].pk is None:
+            users = list(User.objects.filter(email__endswith=f'_{self.prefix}@epicevents.com',
+                                             username__startswith=group_name))
+        group, _ = Group.objects.get_or_create(name=group_name)
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.pk, group_id=group.pk) for user in users
+        ], batch_size=self.batch_size)
+        return users
+
+    def create_clients(self, count, sales):
+        # a few sales contacts own most of the portfolio
+        weights = [1 / (rank + 1) for rank in range(len(sales))]
+        clients = []
+        for i in range(count):
+            sales_contact = self.rng.choices(sales, weights)[0] if sales and self.rng.random() > 0.05 else None
+            clients.append(Client(company_name=f'{self.rng.choice(COMPANY_WORDS)} {i} {self.prefix}',
+                                  first_name=self.rng.choice(FIRST_NAMES),
+                                  last_name=self.rng.choice(LAST_NAMES),
+                                  email=f'contact{i}_{self.prefix}@client.com',
+                                  phone=f'0{self.rng.randint(100000000, 999999999)}',
+                                  mobile=f'06{self.rng.randint(10000000, 99999999)}',
+                                  sales_contact_id=sales_contact))
+        return self.bulk_create(Client, clients, company_name__endswith=self.prefix)
+
+    def create_contracts(self, clients, per_client, signed_ratio):
+        contracts = []
+        for client in clients:
+            if client.sales_contact_id is None:
+                continue
+            for _ in range(min(int(self.rng.expovariate(1 / per_client)) + 1, 20)):
+                contracts.append(Contract(status=self.rng.random() < signed_ratio,
+                                          amount=round(self.rng.lognormvariate(9, 1), 2),
+                                          payment_due=(self.now + timedelta(days=self.rng.randint(-180, 365))).date(),
+                                          client_id=client,
+                                          sales_contact_id=client.sales_contact_id))
+        return self.bulk_create(Contract, contracts, client_id__company_name__endswith=self.prefix)
+
+    def create_events(self, contracts, support, event_ratio):
+        events = []
+        for contract in contracts:
+            if not contract.status or self.rng.random() > event_ratio:
+                continue
+            support_contact = self.rng.choice(support) if support and self.rng.random() < 0.7 else None
+            events.append(Event(attendees=max(1, int(self.rng.lognormvariate(4, 1))),
+                                event_date=self.now + timedelta(days=self.rng.uniform(-365, 365)),
+                                notes=self.rng.choice(NOTES),
+                                client_id_id=contract.client_id_id,
+                                contract_id=contract,
+                                support_contact=support_contact))
+        return self.bulk_create(Event, events, client_id__company_name__endswith=self.prefix)
+
+    def bulk_create(self, model, objects, **created_filter):
+        """
+            bulk inserts the objects and returns them with their primary key,
+            reloading them on databases which do not return the inserted ids
+        """
+        created = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if created and created[0].pk is None:
+            created = list(model.objects.filter(**created_filter).order_by('id'))
+        return created
+
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Chloe', 'David', 'Emma', 'Felix', 'Gabriel', 'Hugo', 'Ines', 'Jules',
+               'Lea', 'Louis', 'Manon', 'Nathan', 'Oscar', 'Paul', 'Rose', 'Sarah', 'Theo', 'Zoe']
+LAST_NAMES = ['Martin', 'Bernard', 'Thomas', 'Petit', 'Robert', 'Richard', 'Durand', 'Dubois', 'Moreau',
+              'Laurent', 'Simon', 'Michel', 'Lefebvre', 'Leroy', 'Roux', 'David', 'Bertrand', 'Morel']
+COMPANY_WORDS = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Wonka', 'Tyrell',
+                 'Cyberdyne', 'Soylent', 'Vandelay', 'Massive', 'Aperture', 'Oscorp', 'Gringotts']
+NOTES = ['', 'Outdoor venue, plan a tent', 'Catering for vegetarian guests', 'Live band requested',
+         'Client asked for a follow-up call one week before', 'Parking for 50 cars needed' * 3,
+         'Keynote speaker arrives the day before. ' * 20]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0008_alter_event_unique_together'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='client',
+            options={'ordering': ['company_name']},
+        ),
+        migrations.AlterModelOptions(
+            name='event',
+            options={'ordering': ['event_date']},
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_date', 'id'], name='epicevent_e_event_d_699704_idx'),
+        ),
+    ]
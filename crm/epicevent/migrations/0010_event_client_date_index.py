@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0009_event_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['client_id', 'event_date'], name='epicevent_e_client__f5f71e_idx'),
+        ),
+    ]
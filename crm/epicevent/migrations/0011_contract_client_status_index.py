@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0010_event_client_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['client_id', 'status'], name='epicevent_c_client__8a270c_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0011_contract_client_status_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+# trigram indexes of epicevent.search.fuzzy_matches, pg_trgm is only available on postgresql
+TRIGRAM_INDEXES = {
+    'client_company_name_trgm': ('epicevent_client', 'company_name'),
+    'client_first_name_trgm': ('epicevent_client', 'first_name'),
+    'client_last_name_trgm': ('epicevent_client', 'last_name'),
+    'client_email_trgm': ('epicevent_client', 'email'),
+    'event_notes_trgm': ('epicevent_event', 'notes'),
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, (table, column) in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0013_change'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['last_name'], name='client_last_name_like', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0014_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('support_contact', models.BigIntegerField(null=True)),
+                ('month', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('attendees', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('support_contact', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ContractRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sales_contact', models.BigIntegerField()),
+                ('month', models.DateField()),
+                ('due_month', models.DateField(null=True)),
+                ('status', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+            ],
+            options={
+                'unique_together': {('sales_contact', 'month', 'due_month', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:29
+
+import datetime
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0015_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='duration',
+            field=models.DurationField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(datetime.timedelta(seconds=60)), django.core.validators.MaxValueValidator(datetime.timedelta(days=31))]),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['support_contact', 'event_date'], name='epicevent_e_support_87e395_idx'),
+        ),
+    ]
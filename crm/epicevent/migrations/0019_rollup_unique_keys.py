@@ -0,0 +1,53 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:54
+
+import datetime
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.comparison
+
+# rollup model: (key fields, measure), postgresql may hold several rows of a key with a null field
+ROLLUP_KEYS = {
+    'ContractRollup': (('sales_contact', 'month', 'due_month', 'status'), 'amount'),
+    'EventRollup': (('support_contact', 'month'), 'attendees'),
+}
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+        merges the rows of a same key into one before the unique constraints are created
+    """
+    for name, (key, measure) in ROLLUP_KEYS.items():
+        model = apps.get_model('epicevent', name)
+        rows = model.objects.order_by().values(*key).annotate(rows=models.Count('id'), total_count=models.Sum('count'),
+                                                                total=models.Sum(measure)).filter(rows__gt=1)
+        for row in list(rows):
+            lookup = {field: row[field] for field in key}
+            model.objects.filter(**lookup).delete()
+            model.objects.create(**lookup, count=row['total_count'], **{measure: row['total']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0018_change_transaction_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='contractrollup',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventrollup',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='contractrollup',
+            constraint=models.UniqueConstraint(django.db.models.expressions.F('sales_contact'), django.db.models.expressions.F('month'), django.db.models.functions.comparison.Coalesce('due_month', django.db.models.expressions.Value(datetime.date(1, 1, 1))), django.db.models.expressions.F('status'), name='contractrollup_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventrollup',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('support_contact', django.db.models.expressions.Value(0, models.BigIntegerField())), django.db.models.expressions.F('month'), name='eventrollup_key'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epicevent', '0019_rollup_unique_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='calendarfeed',
+            name='state',
+        ),
+        migrations.AddField(
+            model_name='calendarfeed',
+            name='rendered_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='calendarfeed',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+    ]
@@ -1,6 +1,18 @@
+from datetime import date, timedelta
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from authentication.models import User
 
+# an event without duration is a point in time, it takes the shortest period a datetime can express
+# the durations are bounded so that the events overlapping a period start at most MAX_EVENT_DURATION before it
+# (epicevent.conflicts)
+POINT_EVENT_DURATION = timedelta(microseconds=1)
+MAX_EVENT_DURATION = timedelta(days=31)
+# stands for a missing month in the unique keys of the rollups
+NO_MONTH = date(1, 1, 1)
+
 
 # Create your models here.
 class Client(models.Model):
@@ -11,12 +23,16 @@ class Client(models.Model):
     mobile = models.CharField(max_length=20, blank=True, null=True)
     company_name = models.CharField(max_length=250, unique=True)
     creation_date = models.DateTimeField(auto_now_add=True)
-    update_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
     sales_contact_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name='client_sales_contact',
                                          blank=True, null=True)
 
     class Meta:
         ordering = ['company_name']
+        indexes = [
+            # prefix search (LIKE 'x%'), company_name and email get one from their unique constraint
+            models.Index(fields=['last_name'], name='client_last_name_like', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.company_name
@@ -27,10 +43,15 @@ class Contract(models.Model):
     amount = models.FloatField(max_length=25)
     payment_due = models.DateField(blank=True, null=True)
     creation_date = models.DateTimeField(auto_now_add=True)
-    update_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
     sales_contact_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contract_sales_contact')
     client_id = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='contract_client')
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client_id', 'status']),
+        ]
+
     def __str__(self):
         return self.client_id.company_name + "_" + str(self.id)
 
@@ -38,9 +59,12 @@ class Contract(models.Model):
 class Event(models.Model):
     attendees = models.IntegerField()
     event_date = models.DateTimeField()
+    duration = models.DurationField(blank=True, null=True,
+                                    validators=[MinValueValidator(timedelta(minutes=1)),
+                                                MaxValueValidator(MAX_EVENT_DURATION)])
     notes = models.CharField(max_length=35000, blank=True, null=True)
     creation_date = models.DateTimeField(auto_now_add=True)
-    update_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
     support_contact = models.ForeignKey(User, on_delete=models.CASCADE, related_name='event_support_contact',
                                         blank=True, null=True)
     client_id = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='event_client')
@@ -49,6 +73,94 @@ class Event(models.Model):
     class Meta:
         unique_together = ['client_id', 'contract_id']
         ordering = ['event_date']
+        indexes = [
+            models.Index(fields=['event_date', 'id']),
+            models.Index(fields=['client_id', 'event_date']),
+            models.Index(fields=['support_contact', 'event_date']),
+        ]
 
     def __str__(self):
         return self.client_id.company_name + "_" + str(self.contract_id.id) + "_" + str(self.event_date)
+
+    @property
+    def end_date(self):
+        return self.event_date + self.duration if self.duration else self.event_date
+
+
+class Change(models.Model):
+    """
+        log of the creations, updates and deletions of clients, contracts and events, written by epicevent.signals
+        (transaction_id, id) is the cursor of the changes feed (epicevent.changes),
+        transaction_id is the id of the writing transaction on postgresql, 0 on the other databases
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTIONS)
+    date = models.DateTimeField(auto_now_add=True)
+    transaction_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['transaction_id', 'id']
+        indexes = [models.Index(fields=['transaction_id', 'id'])]
+
+    def __str__(self):
+        return f"{self.model}_{self.object_id}_{self.action}"
+
+
+class ContractRollup(models.Model):
+    """
+        number and amount of the contracts by sales contact, creation month, payment month and status,
+        maintained by epicevent.rollups
+        the users are referenced by id without a foreign key: the rows of a deleted user are emptied by the deletion
+        of their contracts, which may be collected after the user
+    """
+    sales_contact = models.BigIntegerField()
+    month = models.DateField()
+    due_month = models.DateField(null=True)
+    status = models.BooleanField()
+    count = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+
+    class Meta:
+        # postgresql does not compare NULLs in a unique index, the null month is replaced by a sentinel
+        constraints = [models.UniqueConstraint('sales_contact', 'month', Coalesce('due_month', Value(NO_MONTH)),
+                                               'status', name='contractrollup_key')]
+
+
+class EventRollup(models.Model):
+    """
+        number of events and attendees by support contact and month of the event, maintained by epicevent.rollups
+    """
+    support_contact = models.BigIntegerField(null=True)
+    month = models.DateField()
+    count = models.IntegerField(default=0)
+    attendees = models.BigIntegerField(default=0)
+
+    class Meta:
+        # postgresql does not compare NULLs in a unique index, the null support contact is replaced by 0
+        constraints = [models.UniqueConstraint(Coalesce('support_contact', Value(0, models.BigIntegerField())),
+                                               'month', name='eventrollup_key')]
+
+
+class CalendarFeed(models.Model):
+    """
+        iCalendar feed of the events of a user, rendered by epicevent.calendars when the events changed
+        calendar applications cannot send a JWT, the feed url is authenticated by its secret token
+        - version: incremented by the writes of the events and clients of the feed (epicevent.signals)
+        - rendered_version: version the payload was rendered from
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True)
+    version = models.BigIntegerField(default=1)
+    rendered_version = models.BigIntegerField(default=0)
+    payload = models.TextField(blank=True)
+    etag = models.CharField(max_length=32, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user}_calendar"
@@ -0,0 +1,66 @@
+from datetime import datetime
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Client, Contract, Event
+
+COMING_EVENT_BUCKET = 60
+
+
+def current_bucket(seconds=COMING_EVENT_BUCKET):
+    """
+        returns the current time rounded down to the bucket,
+        every request of the same bucket sees the same list of coming events
+    """
+    now = int(timezone.now().timestamp())
+    return datetime.fromtimestamp(now - now % seconds, tz=timezone.utc)
+
+
+def upcoming_events(queryset=None, client=None, now=None, until=None):
+    """
+        returns the events taking place from now, evaluated on each call
+        - client: restrict to the events of a client, served by the (client_id, event_date) index
+        - until: restrict to the events taking place before this date
+    """
+    if queryset is None:
+        queryset = Event.objects.all()
+    if client is not None:
+        queryset = queryset.filter(client_id=client)
+    queryset = queryset.filter(event_date__gte=now or timezone.now())
+    if until is not None:
+        queryset = queryset.filter(event_date__lte=until)
+    return queryset
+
+
+def coming_event_count(now=None):
+    """
+        number of coming events of the client of the row, as a subquery served by the (client_id, event_date) index
+    """
+    events = upcoming_events(Event.objects.filter(client_id=OuterRef('pk')), now=now)
+    events = events.order_by().values('client_id').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(events), 0)
+
+
+def signed_contract_exists():
+    """
+        condition true when the client of the row has signed at least one contract,
+        used as a semi-join (filter) or an anti-join (exclude) served by the (client_id, status) index
+    """
+    return Exists(Contract.objects.filter(client_id=OuterRef('pk'), status=True))
+
+
+def potential_clients(queryset=None):
+    """
+        returns the clients which have not signed any contract
+    """
+    if queryset is None:
+        queryset = Client.objects.all()
+    return queryset.filter(~signed_contract_exists())
+
+
+def available_contracts(client_id):
+    """
+        returns the signed contracts of the client which are not used by an event yet
+    """
+    used = Event.objects.filter(contract_id=OuterRef('pk'))
+    return Contract.objects.filter(client_id=client_id, status=True).filter(~Exists(used))
@@ -0,0 +1,273 @@
+from collections import defaultdict
+from datetime import datetime
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, DateField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from authentication.models import User
+from .models import Contract, ContractRollup, Event, EventRollup
+
+
+def to_month(value):
+    """
+        first day of the month of a date or datetime, in the current time zone as TruncMonth
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        value = value.date()
+    return value.replace(day=1)
+
+
+class Rollup(object):
+    """
+        Totals of a model by key stored in a rollup table, maintained incrementally:
+        a saved or deleted row removes (1, measure) from the totals of its previous key and adds it to its new key,
+        the values of the previous key are recorded on the instance before the write (epicevent.signals)
+        - key: (rollup field, model attname, truncated to the month)
+        - measure: (rollup field, model attname) summed with the count of rows
+    """
+    model = None
+    rollup_model = None
+    key = ()
+    measure = None
+
+    @property
+    def attnames(self):
+        return [attname for _, attname, _ in self.key] + [self.measure[1]]
+
+    def entry(self, values):
+        """
+            returns (key, measure) of a row from its field values
+        """
+        key = []
+        for _, attname, monthly in self.key:
+            value = self.model._meta.get_field(attname).to_python(values[attname])
+            key.append(to_month(value) if monthly else value)
+        return tuple(key), values[self.measure[1]] or 0
+
+    def values(self, instance):
+        """
+            returns the loaded values of the key and measure of an instance, None when one of them is deferred
+        """
+        values = instance.__dict__
+        attnames = self.attnames
+        return {attname: values[attname] for attname in attnames} \
+            if all(attname in values for attname in attnames) else None
+
+    def load_snapshot(self, instance, update_fields=None):
+        """
+            records the values of the row before it is saved, read with one query, nothing for a new row
+            a save whose update_fields leave the key and the measure unchanged is marked as not changing the totals
+        """
+        instance._rollup_values = None
+        instance._rollup_unchanged = False
+        if instance.pk is None:
+            return
+        if update_fields is not None:
+            attnames = {self.model._meta.get_field(name).attname for name in update_fields}
+            if not attnames & set(self.attnames):
+                instance._rollup_unchanged = True
+                return
+        instance._rollup_values = self.model.objects.filter(pk=instance.pk).values(*self.attnames).first()
+
+    def load_snapshots(self, instances):
+        """
+            records the values of the rows before a bulk_update with one query
+        """
+        rows = self.model.objects.filter(pk__in=[instance.pk for instance in instances]) \
+            .values('pk', *self.attnames)
+        previous = {row.pop('pk'): row for row in rows}
+        for instance in instances:
+            instance._rollup_values = previous.get(instance.pk)
+            instance._rollup_unchanged = False
+
+    def delete_snapshot(self, instance):
+        """
+            records the values of a deleted row: the loaded ones (rows collected by a cascade), read otherwise
+        """
+        values = self.values(instance)
+        if values is None:
+            values = self.model.objects.filter(pk=instance.pk).values(*self.attnames).first()
+        instance._rollup_values = values
+        instance._rollup_unchanged = False
+
+    def changed(self, instances, created=False, deleted=False):
+        """
+            applies the creation, update or deletion of the instances to the totals
+            the previous values of an update or deletion are recorded before the write (load_snapshot,
+            load_snapshots, delete_snapshot), the totals cannot be corrected without them
+        """
+        attnames = self.attnames
+        deltas = defaultdict(lambda: [0, 0])
+        for instance in instances:
+            if getattr(instance, '_rollup_unchanged', False):
+                instance._rollup_unchanged = False
+                continue
+            previous = None if created else getattr(instance, '_rollup_values', None)
+            if previous is None and not created:
+                raise ValueError(f'{self.model.__name__} {instance.pk}: the values before the write were not '
+                                 f'recorded, send pre_bulk_save before bulk_update')
+            if previous is not None:
+                key, measure = self.entry(previous)
+                deltas[key][0] -= 1
+                deltas[key][1] -= measure
+            if not deleted:
+                # the deferred fields of an instance are not saved, they keep their previous values
+                current = {**(previous or {}), **{attname: value for attname, value in instance.__dict__.items()
+                                                  if attname in attnames}}
+                key, measure = self.entry(current)
+                deltas[key][0] += 1
+                deltas[key][1] += measure
+            instance._rollup_values = None
+        self.apply(deltas)
+
+    def apply(self, deltas):
+        """
+            adds the deltas {key: [count, measure]} to the rollup rows with one update per key,
+            the rows whose count falls to 0 are deleted
+        """
+        measure = self.measure[0]
+        for key, (count, total) in deltas.items():
+            if not count and not total:
+                continue
+            lookup = {field: value for (field, _, _), value in zip(self.key, key)}
+            changes = {'count': F('count') + count, measure: F(measure) + total}
+            if self.rollup_model.objects.filter(**lookup).update(**changes):
+                if count < 0:
+                    self.rollup_model.objects.filter(**lookup, count__lte=0).delete()
+                continue
+            try:
+                with transaction.atomic():
+                    self.rollup_model.objects.create(**lookup, count=count, **{measure: total})
+            except IntegrityError:
+                self.rollup_model.objects.filter(**lookup).update(**changes)
+
+    def rebuild(self):
+        """
+            recomputes every total from the model table with one aggregate query
+        """
+        keys = {}
+        for index, (_, attname, monthly) in enumerate(self.key):
+            keys[f'key{index}'] = TruncMonth(attname, output_field=DateField()) if monthly else F(attname)
+        rows = self.model.objects.order_by().annotate(**keys).values(*keys) \
+            .annotate(rollup_count=Count('pk'), rollup_measure=Sum(self.measure[1]))
+        with transaction.atomic():
+            self.rollup_model.objects.all().delete()
+            self.rollup_model.objects.bulk_create([
+                self.rollup_model(count=row['rollup_count'], **{self.measure[0]: row['rollup_measure']},
+                                  **{field: row[f'key{index}'] for index, (field, _, _) in enumerate(self.key)})
+                for row in rows])
+
+
+class ContractTotals(Rollup):
+    model = Contract
+    rollup_model = ContractRollup
+    key = (('sales_contact', 'sales_contact_id_id', False),
+           ('month', 'creation_date', True),
+           ('due_month', 'payment_due', True),
+           ('status', 'status', False))
+    measure = ('amount', 'amount')
+
+
+class EventTotals(Rollup):
+    model = Event
+    rollup_model = EventRollup
+    key = (('support_contact', 'support_contact_id', False),
+           ('month', 'event_date', True))
+    measure = ('attendees', 'attendees')
+
+
+ROLLUPS = {
+    Contract: ContractTotals(),
+    Event: EventTotals(),
+}
+
+
+def rebuild_rollups():
+    for rollup in ROLLUPS.values():
+        rollup.rebuild()
+
+
+def _status_totals(**values):
+    return {**values, 'signed_count': 0, 'signed_amount': 0, 'unsigned_count': 0, 'unsigned_amount': 0}
+
+
+def _by_status(rows, *fields):
+    """
+        groups the rows (fields..., status, count, amount) by fields with the signed and unsigned totals
+    """
+    report = {}
+    for row in rows:
+        key = tuple(row[field] for field in fields)
+        totals = report.setdefault(key, _status_totals(**dict(zip(fields, key))))
+        prefix = 'signed' if row['status'] else 'unsigned'
+        totals[f'{prefix}_count'] += row['count']
+        totals[f'{prefix}_amount'] += row['amount']
+    for totals in report.values():
+        totals['signed_amount'] = round(totals['signed_amount'], 2)
+        totals['unsigned_amount'] = round(totals['unsigned_amount'], 2)
+    return [report[key] for key in sorted(report, key=lambda key: tuple((value is None, value) for value in key))]
+
+
+def _contract_totals(*fields):
+    return ContractRollup.objects.order_by().values(*fields, 'status') \
+        .annotate(count=Sum('count'), amount=Sum('amount'))
+
+
+def _usernames(ids):
+    return dict(User.objects.filter(pk__in=[pk for pk in ids if pk is not None]).values_list('pk', 'username'))
+
+
+def contract_report():
+    """
+        number and amount of the signed and unsigned contracts
+    """
+    totals = _by_status(_contract_totals())
+    return totals[0] if totals else _status_totals()
+
+
+def sales_report():
+    """
+        signed and unsigned contracts of each sales contact
+    """
+    rows = _by_status(_contract_totals('sales_contact'), 'sales_contact')
+    usernames = _usernames(row['sales_contact'] for row in rows)
+    return [{**row, 'username': usernames.get(row['sales_contact'])} for row in rows]
+
+
+def monthly_report():
+    """
+        signed and unsigned contracts by month of creation
+    """
+    return _by_status(_contract_totals('month'), 'month')
+
+
+def payment_report(today=None):
+    """
+        signed and unsigned contracts by month of payment, from the current month
+    """
+    month = to_month(today or timezone.now())
+    return _by_status(_contract_totals('due_month').filter(due_month__gte=month), 'due_month')
+
+
+def support_report():
+    """
+        number of events and attendees of each support contact, None for the events without support contact
+    """
+    rows = EventRollup.objects.order_by().values('support_contact') \
+        .annotate(events=Sum('count'), attendees=Sum('attendees'))
+    usernames = _usernames(row['support_contact'] for row in rows)
+    rows = [{**row, 'username': usernames.get(row['support_contact'])} for row in rows]
+    return sorted(rows, key=lambda row: (row['support_contact'] is None, row['support_contact'] or 0))
+
+
+REPORTS = {
+    'contracts': contract_report,
+    'sales': sales_report,
+    'months': monthly_report,
+    'payments': payment_report,
+    'support': support_report,
+}
@@ -0,0 +1,191 @@
+import heapq
+import re
+from collections import Counter
+from threading import Lock
+from django.db import connections
+from django.db.models import Q
+from .models import Client, Event
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# same default as pg_trgm.word_similarity_threshold
+SIMILARITY_THRESHOLD = 0.6
+PREFIX_SCORE = 1.0
+
+# searched models by type: (model, fields matched by prefix with their pattern-ops index, fields matched by trigrams)
+SEARCH_FIELDS = {
+    'client': (Client, ('company_name', 'last_name', 'email'), ('company_name', 'first_name', 'last_name', 'email')),
+    'event': (Event, ('client_id__company_name',), ('notes',)),
+}
+
+_words = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """
+        returns the trigrams of the words of the text as pg_trgm extracts them:
+        lower case words padded with two spaces before and one after
+    """
+    grams = set()
+    for word in _words.findall(text.lower()):
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class NgramIndex(object):
+    """
+        in-process inverted index of the trigrams of the fields of a model, used when pg_trgm is not available
+        the score of a row is the share of the trigrams of the query found in its fields (like word_similarity)
+        built on the first search, then updated row by row from the writes (epicevent.signals.search_index_changed)
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.postings = {}
+        self.grams = {}
+
+    def build(self):
+        rows = self.model.objects.order_by().values_list('pk', *self.fields)
+        for pk, *values in rows.iterator(chunk_size=2000):
+            self.add(pk, values)
+
+    def add(self, pk, values):
+        self.remove(pk)
+        grams = trigrams(' '.join(value for value in values if value))
+        self.grams[pk] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(pk)
+
+    def remove(self, pk):
+        for gram in self.grams.pop(pk, ()):
+            pks = self.postings[gram]
+            pks.discard(pk)
+            if not pks:
+                del self.postings[gram]
+
+    def refresh(self, pks):
+        """
+            indexes the current values of the rows with one query, the rows which no longer exist are removed
+        """
+        rows = {pk: values for pk, *values in self.model.objects.filter(pk__in=pks).values_list('pk', *self.fields)}
+        for pk in pks:
+            if pk in rows:
+                self.add(pk, rows[pk])
+            else:
+                self.remove(pk)
+
+    def search(self, query, limit):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+        minimum = SIMILARITY_THRESHOLD * len(grams)
+        matches = ((count / len(grams), pk) for pk, count in counts.items() if count >= minimum)
+        return [(pk, score) for score, pk in heapq.nlargest(limit, matches)]
+
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def get_ngram_index(search_type):
+    """
+        returns the n-gram index of the type, built on first use
+    """
+    model, _, fields = SEARCH_FIELDS[search_type]
+    with _indexes_lock:
+        index = _indexes.get(search_type)
+        if index is None:
+            index = NgramIndex(model, fields)
+            index.build()
+            _indexes[search_type] = index
+    return index
+
+
+def update_ngram_index(model, pks, deleted=False):
+    """
+        applies the writes of rows of the model to its n-gram index, nothing when the index is not built yet
+    """
+    for search_type, (search_model, _, _) in SEARCH_FIELDS.items():
+        if search_model is not model:
+            continue
+        with _indexes_lock:
+            index = _indexes.get(search_type)
+            if index is None:
+                continue
+            if deleted:
+                for pk in pks:
+                    index.remove(pk)
+            else:
+                index.refresh(pks)
+
+
+def clear_ngram_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def fuzzy_matches(search_type, query, limit):
+    """
+        returns [(pk, score)] of the rows whose fields contain words similar to the query, best first
+        on postgresql the `<%` operator is served by the gin_trgm_ops indexes of the fields (migration 0014)
+    """
+    model, _, fields = SEARCH_FIELDS[search_type]
+    connection = connections[model.objects.db]
+    if connection.vendor != 'postgresql':
+        return get_ngram_index(search_type).search(query, limit)
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [connection.ops.quote_name(model._meta.get_field(field).column) for field in fields]
+    score = ', '.join(f'word_similarity(%s, {column})' for column in columns)
+    condition = ' OR '.join(f'%s <%% {column}' for column in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, GREATEST({score}) AS score FROM {table} WHERE {condition} '
+                       f'ORDER BY score DESC, id LIMIT %s', [query] * len(columns) * 2 + [limit])
+        return cursor.fetchall()
+
+
+def prefix_matches(search_type, query, limit):
+    """
+        returns [(pk, PREFIX_SCORE)] of the rows having a field starting with the query,
+        served by the varchar_pattern_ops indexes
+    """
+    model, fields, _ = SEARCH_FIELDS[search_type]
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__startswith': query})
+    pks = model.objects.filter(condition).order_by().values_list('pk', flat=True)[:limit]
+    return [(pk, PREFIX_SCORE) for pk in pks]
+
+
+def search_ids(search_type, query, limit=SEARCH_LIMIT):
+    """
+        returns {pk: score} of the best rows of the type for the query: prefix matches first, then fuzzy ones
+    """
+    scores = dict(fuzzy_matches(search_type, query, limit))
+    scores.update(prefix_matches(search_type, query, limit))
+    return dict(heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0])))
+
+
+def _labels(search_type, ids):
+    if search_type == 'client':
+        return dict(Client.objects.filter(pk__in=ids).values_list('pk', 'company_name'))
+    rows = Event.objects.filter(pk__in=ids).values_list('pk', 'client_id__company_name', 'contract_id', 'event_date')
+    return {pk: f'{company_name}_{contract_id}_{event_date}' for pk, company_name, contract_id, event_date in rows}
+
+
+def search(query, types=tuple(SEARCH_FIELDS), limit=SEARCH_LIMIT):
+    """
+        returns the limit best results across the types: [{'type', 'id', 'label', 'score'}] ranked by score
+    """
+    results = []
+    for search_type in types:
+        scores = search_ids(search_type, query, limit)
+        labels = _labels(search_type, scores)
+        results += [{'type': search_type, 'id': pk, 'label': labels[pk], 'score': round(score, 3)}
+                    for pk, score in scores.items() if pk in labels]
+    results.sort(key=lambda result: (-result['score'], result['label']))
+    return results[:limit]
@@ -0,0 +1,198 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver, Signal
+from authentication.models import User
+from .calendars import mark_feeds_stale
+from .changes import record_changes
+from .models import Change, Client, Contract, Event
+from .rollups import ROLLUPS
+from .search import update_ngram_index
+from .versions import bump_version, bump_scope_versions, object_scope
+
+# sent by bulk_create/bulk_update callers, which skip post_save: sender is the model, instances the rows,
+# created True for bulk_create, False for bulk_update, missing for upserts
+post_bulk_save = Signal()
+# sent by bulk_update callers before the write, with the same arguments as post_bulk_save
+pre_bulk_save = Signal()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+@receiver(post_bulk_save)
+def model_changed(sender, **kwargs):
+    bump_model(sender)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        bump_model(User)
+        if not reverse:
+            bump_objects([instance])
+        else:
+            bump_objects(User(pk=pk) for pk in pk_set or instance.groups.values_list('id', flat=True))
+
+
+def bump_model(model):
+    """
+        bumps the version of the model now and once the transaction is committed,
+        a list validated in between with the old rows is then invalidated too
+    """
+    bump_version(model)
+    transaction.on_commit(lambda: bump_version(model))
+
+
+def bump_objects(instances):
+    """
+        bumps the version of each instance now and once the transaction is committed,
+        a cache filled in between with the old rows is then invalidated too
+    """
+    scopes = [object_scope(instance) for instance in instances if instance.pk is not None]
+    bump_scope_versions(scopes)
+    transaction.on_commit(lambda: bump_scope_versions(scopes))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+@receiver(post_bulk_save)
+def object_changed(sender, instance=None, instances=(), **kwargs):
+    """
+        bumps the version of the changed rows, used to check the cached representations which include them
+    """
+    bump_objects([instance] if instance is not None else instances)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+@receiver(post_bulk_save, sender=Client)
+@receiver(post_bulk_save, sender=Contract)
+@receiver(post_bulk_save, sender=Event)
+def client_changed(sender, instance=None, instances=(), **kwargs):
+    """
+        bumps the version of the clients whose row, contracts or events changed
+    """
+    rows = [instance] if instance is not None else instances
+    if sender is Client:
+        client_ids = {row.pk for row in rows}
+    else:
+        client_ids = {row.client_id_id for row in rows}
+    bump_scope_versions(f'client:{client_id}' for client_id in client_ids if client_id is not None)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+def log_save(sender, instance, created, **kwargs):
+    record_changes(sender, [instance], Change.CREATED if created else Change.UPDATED)
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def log_delete(sender, instance, **kwargs):
+    """
+        also called for the clients, contracts and events deleted in cascade with their user or client
+    """
+    record_changes(sender, [instance], Change.DELETED)
+
+
+@receiver(post_bulk_save, sender=Client)
+@receiver(post_bulk_save, sender=Contract)
+@receiver(post_bulk_save, sender=Event)
+def log_bulk_save(sender, instances, created=False, **kwargs):
+    """
+        the rows of an upsert are logged as updated, consumers of the feed apply updates as upserts
+    """
+    record_changes(sender, instances, Change.CREATED if created else Change.UPDATED)
+
+
+@receiver(pre_save, sender=Contract)
+@receiver(pre_save, sender=Event)
+def rollup_load_snapshot(sender, instance, update_fields=None, **kwargs):
+    ROLLUPS[sender].load_snapshot(instance, update_fields)
+
+
+@receiver(pre_delete, sender=Contract)
+@receiver(pre_delete, sender=Event)
+def rollup_delete_snapshot(sender, instance, **kwargs):
+    ROLLUPS[sender].delete_snapshot(instance)
+
+
+@receiver(pre_bulk_save, sender=Contract)
+@receiver(pre_bulk_save, sender=Event)
+def rollup_bulk_snapshot(sender, instances, **kwargs):
+    if kwargs.get('created') is False:
+        ROLLUPS[sender].load_snapshots(instances)
+
+
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+def rollup_save(sender, instance, created, **kwargs):
+    ROLLUPS[sender].changed([instance], created=created)
+
+
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def rollup_delete(sender, instance, **kwargs):
+    ROLLUPS[sender].changed([instance], deleted=True)
+
+
+@receiver(post_bulk_save, sender=Contract)
+@receiver(post_bulk_save, sender=Event)
+def rollup_bulk_save(sender, instances, **kwargs):
+    """
+        the previous values of upserted rows are unknown, import_crm rebuilds the totals once all rows are imported
+    """
+    if 'created' in kwargs:
+        ROLLUPS[sender].changed(instances, created=kwargs['created'])
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Event)
+@receiver(post_bulk_save, sender=Client)
+@receiver(post_bulk_save, sender=Event)
+def search_index_changed(sender, instance=None, instances=(), signal=None, **kwargs):
+    """
+        updates the n-gram indexes of the search once the transaction is committed
+    """
+    pks = [row.pk for row in ([instance] if instance is not None else instances) if row.pk is not None]
+    deleted = signal is post_delete
+    transaction.on_commit(lambda: update_ngram_index(sender, pks, deleted))
+
+
+@receiver(pre_save, sender=Client)
+@receiver(pre_save, sender=Event)
+@receiver(pre_delete, sender=Client)
+@receiver(pre_delete, sender=Event)
+@receiver(pre_bulk_save, sender=Client)
+@receiver(pre_bulk_save, sender=Event)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Event)
+@receiver(post_bulk_save, sender=Client)
+@receiver(post_bulk_save, sender=Event)
+def calendar_feeds_changed(sender, instance=None, instances=(), **kwargs):
+    """
+        marks stale the calendar feeds including the rows: before the write for their previous support and sales
+        contacts, after it for the new ones
+    """
+    pks = [row.pk for row in ([instance] if instance is not None else instances) if row.pk is not None]
+    if pks:
+        mark_feeds_stale(sender, pks)
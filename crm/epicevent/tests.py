@@ -1,3 +1,277 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import User
+from .calendars import fold, get_feed, refresh_feed
+from .export import EventExport
+from .intervals import IntervalIndex
+from .models import CalendarFeed, Client, Contract, Event
 
-# Create your tests here.
+
+class ImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = User.objects.create(username='sales', email='sales@epic.com')
+        cls.sales.groups.add(Group.objects.get(name='sales'))
+        Client.objects.create(company_name='existing', email='existing@client.com')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def import_files(self, **files):
+        rejects = os.path.join(self.directory.name, f'rejects{len(os.listdir(self.directory.name))}.ndjson')
+        call_command('import_crm', batch_size=2, rejects=rejects, stdout=StringIO(), **files)
+        if not os.path.exists(rejects):
+            return []
+        with open(rejects) as file:
+            return [json.loads(line) for line in file]
+
+    def test_import(self):
+        clients = self.write('clients.csv', 'company_name,first_name,email,sales_contact\n'
+                                            'first,A,first@client.com,sales\n'
+                                            'existing,Updated,existing@client.com,sales\n'
+                                            'other,B,first@client.com,sales\n'
+                                            'unknown,C,,nobody\n')
+        contracts = self.write('contracts.ndjson',
+                               '{"id": 100, "status": true, "amount": 10, "company_name": "first"}\n'
+                               '{"status": "false", "amount": 20, "company_name": "existing"}\n')
+        events = self.write('events.csv', 'company_name,contract_id,event_date,attendees\n'
+                                          'first,100,2030-01-01T10:00:00,30\n'
+                                          'existing,100,2030-01-01T10:00:00,30\n')
+        rejects = self.import_files(clients=clients, contracts=contracts, events=events)
+
+        self.assertEqual([(reject['line'], reject['reason']) for reject in rejects], [
+            (4, 'client with this email already exists: first'),
+            (5, 'nobody does not exist'),
+            (3, 'contract 100 does not belong to existing'),
+        ])
+        self.assertEqual(Client.objects.get(company_name='existing').first_name, 'Updated')
+        self.assertEqual(Contract.objects.get(id=100).sales_contact_id, self.sales)
+        self.assertEqual(Contract.objects.filter(client_id__company_name='existing', status=False).count(), 1)
+        self.assertEqual(Event.objects.get().attendees, 30)
+
+        events = self.write('events.csv', 'company_name,contract_id,event_date,attendees\n'
+                                          'first,100,2030-01-01T10:00:00,40\n')
+        self.assertEqual(self.import_files(events=events), [])
+        self.assertEqual(Event.objects.get().attendees, 40)
+
+
+    def test_event_round_trip(self):
+        Client.objects.filter(company_name='existing').update(sales_contact_id=self.sales)
+        contracts = self.write('contracts.ndjson',
+                               '{"id": 100, "status": true, "amount": 10, "company_name": "existing"}\n')
+        events = self.write('events.csv', 'company_name,contract_id,event_date,duration,attendees\n'
+                                          'existing,100,2030-01-01T10:00:00,2 03:30:00,30\n')
+        self.assertEqual(self.import_files(contracts=contracts, events=events), [])
+        event = Event.objects.get()
+        self.assertEqual(event.duration, timedelta(days=2, hours=3, minutes=30))
+        export = EventExport()
+        for export_type in ['csv', 'ndjson']:
+            path = self.write(f'export.{export_type}', ''.join(export.lines(Event.objects.all(), export_type)))
+            Event.objects.update(duration=None)
+            self.assertEqual(self.import_files(events=path), [])
+            self.assertEqual(Event.objects.get().duration, timedelta(days=2, hours=3, minutes=30))
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = User.objects.create(username='sales', email='sales@epic.com')
+        cls.sales.groups.add(Group.objects.get(name='sales'))
+        cls.clients = [Client.objects.create(company_name=f'company{i:02}', sales_contact_id=cls.sales)
+                       for i in range(25)]
+        cls.contracts = [Contract.objects.create(status=status, amount=10, client_id=cls.clients[0],
+                                                 sales_contact_id=cls.sales) for status in (True, True, False)]
+        Event.objects.create(attendees=10, event_date=timezone.now(), client_id=cls.clients[0],
+                             contract_id=cls.contracts[0])
+        User.objects.create_superuser(username='admin', email='admin@epic.com', password='password')
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(username='admin'))
+
+    def test_clients(self):
+        response = self.client.get('/autocomplete/clients/', {'q': 'company', 'page': 2})
+        self.assertEqual(response.json(), {'results': [{'id': client.id, 'text': client.company_name}
+                                                       for client in self.clients[20:]],
+                                           'pagination': {'more': False}})
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(len(self.client.get('/autocomplete/clients/', {'q': 'company1'}).json()['results']), 10)
+
+    def test_contracts(self):
+        response = self.client.get('/autocomplete/contracts/', {'client': self.clients[0].id})
+        self.assertEqual(response.json()['results'], [{'id': self.contracts[1].id,
+                                                       'text': f'company00_{self.contracts[1].id}'}])
+
+    def test_users(self):
+        response = self.client.get('/autocomplete/users/', {'group': 'sales', 'client': self.clients[1].id})
+        self.assertEqual(response.json()['results'], [{'id': self.sales.id, 'text': 'sales'}])
+        self.assertEqual(self.client.get('/autocomplete/users/', {'group': 'support'}).json()['results'], [])
+
+    def test_forms_do_not_list_the_tables(self):
+        for url in ('/admin/epicevent/client/add/', '/admin/epicevent/contract/add/', '/admin/epicevent/event/add/',
+                    f'/admin/epicevent/event/{Event.objects.get().id}/change/'):
+            response = self.client.get(url)
+            self.assertNotContains(response, 'company05')
+
+    def test_chained_selects(self):
+        client = self.clients[0]
+        response = self.client.get(f'/get/contracts/{client.id}/')
+        self.assertEqual(response.json(), {'data': [{'id': self.contracts[1].id,
+                                                     'name': f'company00_{self.contracts[1].id}'}]})
+        self.assertEqual(self.client.get(f'/get/sales/{client.id}/').json(), {'data': [{'id': self.sales.id,
+                                                                                        'name': 'sales'}]})
+
+    def test_unchanged_client_gets_not_modified(self):
+        client = self.clients[0]
+        for url in (f'/get/contracts/{client.id}/', f'/get/sales/{client.id}/',
+                    f'/autocomplete/contracts/?client={client.id}'):
+            response = self.client.get(url)
+            etag = response['ETag']
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse([query for query in context.captured_queries if 'epicevent' in query['sql']])
+            Event.objects.create(attendees=10, event_date=timezone.now(), client_id=client,
+                                 contract_id=Contract.objects.create(status=True, amount=10, client_id=client,
+                                                                     sales_contact_id=self.sales))
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class IntervalIndexTests(SimpleTestCase):
+
+    def test_overlaps(self):
+        index = IntervalIndex([(0, 10, 'long'), (12, 13, 'a'), (14, 16, 'b')])
+        self.assertEqual(index.overlaps(5, 6), [(0, 10, 'long')])
+        self.assertEqual(index.overlaps(10, 14), [(12, 13, 'a')])
+        self.assertEqual(index.overlaps(9, 15), [(0, 10, 'long'), (12, 13, 'a'), (14, 16, 'b')])
+        self.assertTrue(index.is_free(10, 12))
+        self.assertTrue(index.is_free(16, 20))
+        self.assertFalse(index.is_free(15, 20))
+        self.assertTrue(IntervalIndex().is_free(0, 1))
+
+    def test_extend(self):
+        index = IntervalIndex([(12, 13, 'a')])
+        index.extend([(14, 16, 'b'), (0, 10, 'long')])
+        index.add(11, 12, 'c')
+        self.assertEqual(index.intervals, [(0, 10, 'long'), (11, 12, 'c'), (12, 13, 'a'), (14, 16, 'b')])
+        self.assertEqual(index.overlaps(5, 6), [(0, 10, 'long')])
+
+
+class CalendarFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = User.objects.create(username='sales', email='sales@epic.com')
+        cls.sales.groups.add(Group.objects.get(name='sales'))
+        cls.support = User.objects.create(username='support', email='support@epic.com')
+        cls.support.groups.add(Group.objects.get(name='support'))
+        client = Client.objects.create(company_name='Dupont, Fils; et Cie', sales_contact_id=cls.sales)
+        event_date = timezone.now() + timedelta(days=2)
+        for index, support_contact in enumerate((cls.support, None)):
+            contract = Contract.objects.create(status=True, amount=10, client_id=client, sales_contact_id=cls.sales)
+            Event.objects.create(attendees=10 + index, event_date=event_date + timedelta(days=index), client_id=client,
+                                 contract_id=contract, support_contact=support_contact, notes='Line 1\nLine 2')
+
+    def feed_url(self, user):
+        api = APIClient()
+        api.force_authenticate(user=user)
+        return api.get('/api/calendar/').data['url']
+
+    def test_feeds(self):
+        support_feed = self.client.get(self.feed_url(self.support))
+        self.assertEqual(support_feed.status_code, 200)
+        self.assertEqual(support_feed['Content-Type'], 'text/calendar; charset=utf-8')
+        content = support_feed.content.decode()
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+        self.assertIn('SUMMARY:Dupont\\, Fils\\; et Cie (10 attendees)\r\n', content)
+        self.assertIn('\\nLine 2', content)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split('\r\n')))
+        sales_feed = self.client.get(self.feed_url(self.sales)).content.decode()
+        self.assertEqual(sales_feed.count('CATEGORIES:SALES'), 2)
+        self.assertEqual(self.client.get('/calendar/unknown.ics').status_code, 404)
+
+    def test_not_modified(self):
+        url = self.feed_url(self.support)
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 1)
+        event = Event.objects.get(support_contact=self.support)
+        event.attendees = 50
+        event.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(50 attendees)', response.content.decode())
+        event = Event.objects.get(support_contact__isnull=True)
+        event.support_contact = self.support
+        event.save()
+        self.assertEqual(self.client.get(url).content.decode().count('BEGIN:VEVENT'), 2)
+        client = event.client_id
+        client.company_name = 'Durand'
+        client.save()
+        self.assertIn('SUMMARY:Durand (11 attendees)', self.client.get(url).content.decode())
+
+    def test_only_the_feeds_of_the_rows(self):
+        support_feed = refresh_feed(get_feed(self.support))
+        sales_feed = refresh_feed(get_feed(self.sales))
+        with mock.patch('epicevent.calendars.render_calendar', return_value='') as render:
+            Client.objects.create(company_name='Unrelated')
+            refresh_feed(CalendarFeed.objects.get(pk=support_feed.pk))
+            render.assert_not_called()
+            # the previous support contact loses the event, the sales contact of its client is not changed
+            event = Event.objects.get(support_contact=self.support)
+            event.support_contact = None
+            event.save()
+            self.assertEqual(refresh_feed(CalendarFeed.objects.get(pk=support_feed.pk)).payload, '')
+            refresh_feed(CalendarFeed.objects.get(pk=sales_feed.pk))
+            self.assertEqual(render.call_count, 2)
+            render.reset_mock()
+            # the previous sales contact loses the events of the client
+            client = Client.objects.get(company_name__startswith='Dupont')
+            client.sales_contact_id = None
+            client.save()
+            refresh_feed(CalendarFeed.objects.get(pk=sales_feed.pk))
+            refresh_feed(CalendarFeed.objects.get(pk=support_feed.pk))
+            render.assert_called_once()
+
+    def test_new_day(self):
+        feed = refresh_feed(get_feed(self.support))
+        etag = feed.etag
+        self.assertEqual(refresh_feed(feed).etag, etag)
+        with mock.patch('epicevent.calendars.render_calendar', return_value='') as render:
+            refresh_feed(feed, timezone.now() + timedelta(days=1))
+        render.assert_called_once()
+
+    def test_reset_token(self):
+        url = self.feed_url(self.support)
+        api = APIClient()
+        api.force_authenticate(user=self.support)
+        new_url = api.post('/api/calendar/').data['url']
+        self.assertNotEqual(url, new_url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+    def test_fold(self):
+        line = 'DESCRIPTION:' + 'é' * 100
+        folded = fold(line).split('\r\n')
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded))
+        self.assertEqual(folded[0] + ''.join(part[1:] for part in folded[1:]), line)
@@ -0,0 +1,70 @@
+import time
+from django.core.cache import cache
+
+VERSION_TIMEOUT = None
+
+
+def _version_key(model):
+    return f"version:{model._meta.label_lower}"
+
+
+def _scope_key(scope):
+    return f"version:{scope}"
+
+
+def get_versions(*models):
+    """
+        returns the time of the last change of each model,
+        a missing marker is reset to now so that nothing older can be served from a cache
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, VERSION_TIMEOUT)
+        versions.update(missing)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(model):
+    """
+        records that a row of the model has been created, modified or deleted
+    """
+    cache.set(_version_key(model), time.time(), VERSION_TIMEOUT)
+
+
+def get_scope_version(scope):
+    """
+        returns the time of the last change of the rows of a scope (client:<id> for a client, its contracts and events)
+    """
+    key = _scope_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        cache.set(key, version, VERSION_TIMEOUT)
+    return version
+
+
+def get_scope_versions(scopes):
+    """
+        returns the versions of several scopes by scope, the missing ones are reset to now
+    """
+    keys = {_scope_key(scope): scope for scope in scopes}
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, VERSION_TIMEOUT)
+        versions.update(missing)
+    return {scope: versions[key] for key, scope in keys.items()}
+
+
+def object_scope(instance):
+    return f"{instance._meta.label_lower}:{instance.pk}"
+
+
+def bump_scope_versions(scopes):
+    """
+        records that rows of the scopes have been created, modified or deleted
+    """
+    now = time.time()
+    cache.set_many({_scope_key(scope): now for scope in scopes}, VERSION_TIMEOUT)
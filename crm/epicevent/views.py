@@ -1,31 +1,149 @@
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
-from .models import Contract, Client, Event
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+from hashlib import md5
+from .calendars import refresh_feed
+from .models import CalendarFeed, Client
+from .queries import available_contracts
+from .versions import get_versions, get_scope_version
 from authentication.models import User
 
+AUTOCOMPLETE_PAGE_SIZE = 20
+AUTOCOMPLETE_MAX_AGE = 30
+
+
+def versioned(get_state, max_age=0):
+    """
+        decorator adding an ETag built from the url and get_state(request, **kwargs) to the responses,
+        a request sending the same ETag in If-None-Match gets a 304 without running the view
+        max_age=0: the browser revalidates the response each time it is used
+    """
+    def etag(request, *args, **kwargs):
+        return md5(f'{request.get_full_path()}:{get_state(request, **kwargs)}'.encode()).hexdigest()
+
+    def decorator(view):
+        return cache_control(private=True, max_age=max_age)(condition(etag_func=etag)(view))
+    return decorator
+
+
+def client_state(request, client_id=None):
+    """
+        version of the client (client_id or ?client=), changed with the client, its contracts and its events
+    """
+    return get_scope_version(f"client:{client_id or request.GET.get('client')}")
+
+
+def client_sales_state(request, client_id=None):
+    return client_state(request, client_id), get_versions(User)
+
+
+def autocomplete_response(request, rows, label):
+    """
+        returns the page ?page= of the ordered rows (id, ...) in the select2 format:
+        {"results": [{"id": id, "text": label(row)}], "pagination": {"more": true if there is a next page}}
+    """
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    start = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+    rows = list(rows[start:start + AUTOCOMPLETE_PAGE_SIZE + 1])
+    return JsonResponse({'results': [{'id': row[0], 'text': label(row)} for row in rows[:AUTOCOMPLETE_PAGE_SIZE]],
+                         'pagination': {'more': len(rows) > AUTOCOMPLETE_PAGE_SIZE}})
+
+
+@login_required
+@versioned(lambda request: get_versions(Client), AUTOCOMPLETE_MAX_AGE)
+def client_autocomplete(request):
+    """
+        This view returns the clients whose company name starts with ?q=
+        the prefix search is served by the index of the unique company_name
+    """
+    clients = Client.objects.filter(company_name__startswith=request.GET.get('q', ''))
+    return autocomplete_response(request, clients.order_by('company_name').values_list('id', 'company_name'),
+                                 lambda row: row[1])
+
+
+@login_required
+@versioned(client_state)
+def contract_autocomplete(request):
+    """
+        This view returns the signed contracts of the client ?client= not used in an event
+    """
+    client_id = request.GET.get('client', '')
+    if not client_id.isdigit():
+        return JsonResponse({'results': [], 'pagination': {'more': False}})
+    rows = available_contracts(client_id).order_by('id').values_list('id', 'client_id__company_name')
+    return autocomplete_response(request, rows, lambda row: f'{row[1]}_{row[0]}')
+
+
+@login_required
+@versioned(client_sales_state)
+def user_autocomplete(request):
+    """
+        This view returns the users whose username starts with ?q=
+        - ?group=: only the users of the group (sales, support)
+        - ?client=: only the sales contact of the client
+    """
+    users = User.objects.filter(username__startswith=request.GET.get('q', ''))
+    if request.GET.get('group'):
+        users = users.filter(groups__name=request.GET['group'])
+    if request.GET.get('client', '').isdigit():
+        users = users.filter(client_sales_contact=request.GET['client'])
+    return autocomplete_response(request, users.order_by('username').values_list('id', 'username'),
+                                 lambda row: row[1])
+
 
 # Create your views here.
 @login_required
+@versioned(client_state)
 def contract_list(request, client_id):
     """
         This view returns the list of contract linked to a client and not used in an event
         This view will be used in the admin interface to filter the list of contracts in the Event form
     """
-    client = Client.objects.get(id=client_id)
-    events = list(Event.objects.filter(client_id=client))
-    contract_used = [event.contract_id.id for event in events]
-    contracts = Contract.objects.filter(client_id=client).filter(status=True).exclude(id__in=contract_used)
-    return JsonResponse({'data': [{'id': contract.id, 'name': contract.client_id.company_name + '_' + str(contract.id)} 
-                                  for contract in contracts]})
+    if not client_id.isdigit():
+        return JsonResponse({'data': []})
+    contracts = available_contracts(client_id).order_by('id').values_list('id', 'client_id__company_name')
+    return JsonResponse({'data': [{'id': pk, 'name': f'{company_name}_{pk}'} for pk, company_name in contracts]})
 
 
 @login_required
+@versioned(client_sales_state)
 def sales_contact_list(request, client_id):
     """
         This view returns the sale contact of a client
         This view will be used to get the sale contact when creating a contract
     """
-    client = Client.objects.get(id=client_id)
-    sales = User.objects.filter(username=client.sales_contact_id)
-    return JsonResponse({'data': [{'id': sale.id, 'name': sale.username} for sale in sales]})
+    if not client_id.isdigit():
+        return JsonResponse({'data': []})
+    sales = User.objects.filter(client_sales_contact=client_id).values_list('id', 'username')
+    return JsonResponse({'data': [{'id': pk, 'name': username} for pk, username in sales]})
+
+
+def load_calendar_feed(request, token):
+    """
+        loads the feed of the token once per request, rendered again if its events changed
+    """
+    if not hasattr(request, 'calendar_feed'):
+        request.calendar_feed = refresh_feed(get_object_or_404(CalendarFeed.objects.select_related('user'),
+                                                               token=token))
+    return request.calendar_feed
+
+
+@require_safe
+@cache_control(private=True, max_age=0)
+@condition(etag_func=lambda request, token: load_calendar_feed(request, token).etag,
+           last_modified_func=lambda request, token: load_calendar_feed(request, token).last_modified)
+def calendar_feed(request, token):
+    """
+        This view returns the iCalendar feed of the user of the token (see api.views.CalendarFeedUrl),
+        the stored payload is only rendered again when the events of the user changed
+        a calendar application sending the ETag in If-None-Match gets a 304 after one query
+    """
+    feed = load_calendar_feed(request, token)
+    response = HttpResponse(feed.payload, content_type='text/calendar; charset=utf-8')
+    response.headers['Content-Disposition'] = f'inline; filename="{feed.user.username}.ics"'
+    return response
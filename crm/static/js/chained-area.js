@@ -1,24 +1,62 @@
-function getContracts(client_id) {
+function initAutocomplete(element) {
     let $ = django.jQuery;
-    $.get('/get/contracts/' + client_id, function (resp){
-
-        let contract_list = '<option value="" selected="">---------</option>'
-        $.each(resp.data, function(i, item){
-           contract_list += '<option value="'+ item.id +'">'+ item.name +'</option>'
-        });
-        $('#id_contract').html(contract_list);
+    $(element).select2({
+        theme: 'admin-autocomplete',
+        allowClear: true,
+        placeholder: '---------',
+        ajax: {
+            url: element.dataset.url,
+            dataType: 'json',
+            delay: 250,
+            cache: true,
+            data: function (params) {
+                let data = {q: params.term || '', page: params.page || 1};
+                if (element.dataset.forward) {
+                    let forward = element.dataset.forward.split(':');
+                    data[forward[0]] = $('#' + forward[1]).val();
+                }
+                return data;
+            }
+        }
     });
 }
 
 
-function getSales(client_id) {
+function getContracts(client_id) {
     let $ = django.jQuery;
-    $.get('/get/sales/' + client_id, function (resp){
+    // the contracts are searched for the selected client when the list is opened
+    $('#id_contract').val(null).trigger('change');
+}
+
 
-        let sales_list = '<option value="" selected="">---------</option>'
-        $.each(resp.data, function(i, item){
-           sales_list += '<option value="'+ item.id +'">'+ item.name +'</option>'
+function getSales(client_id) {
+    let $ = django.jQuery;
+    let sales = $('#id_sales');
+    sales.empty();
+    if (!client_id) {
+        sales.trigger('change');
+        return;
+    }
+    $.get(sales.data('url'), {client: client_id}, function (resp){
+        $.each(resp.results, function(i, item){
+            sales.append(new Option(item.text, item.id, true, true));
         });
-        $('#id_sales').html(sales_list);
+        sales.trigger('change');
     });
 }
+
+
+window.addEventListener('load', function() {
+    let $ = django.jQuery;
+    $('.crm-autocomplete').each(function() {
+        initAutocomplete(this);
+    });
+    $('#id_client').on('change', function() {
+        if ($('#id_contract').length) {
+            getContracts(this.value);
+        }
+        if ($('#id_sales').length) {
+            getSales(this.value);
+        }
+    });
+});